@@ -0,0 +1,322 @@
+"""
+Deterministic, offline stand-ins for GitHub and Gemini used by the benchmark harness.
+
+FakeGithubServer is a local HTTP server implementing the GitHub REST endpoints
+GithubClient calls (user, pulls, compare, source tarballs, issue comments, reviews) and serves synthetic diffs
+of configurable size. StubLLM is a CrewAI BaseLLM that answers each
+agent stage with canned output after an injectable latency, and can be told
+to fail a fraction of calls with 503-style errors.
+"""
+import hashlib
+import io
+import json
+import random
+import tarfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from crewai.llms.base_llm import BaseLLM
+
+
+# Author of every comment the fake server stores, and the token's user
+BOT_LOGIN = "ai-tech-lead-bench"
+
+
+def _sha(*parts):
+    return hashlib.sha1("\0".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+
+
+class FakeGithubServer:
+    """
+    Local HTTP server implementing the GitHub REST endpoints GithubClient uses.
+
+    Serves synthetic diffs of `files_per_pr` files with `lines_per_file` added
+    lines each (plus a `lockfile_lines`-line package-lock.json when set), honours If-None-Match with 304s, and counts requests per route.
+    Responses carry X-RateLimit-* headers for an hourly budget of `rate_limit`
+    requests (304s are free, as on GitHub); once it is spent requests get 403.
+    Point the client at it with GITHUB_API_URL=server.url.
+    """
+
+    def __init__(self, files_per_pr=5, lines_per_file=40, latency=0.0, rate_limit=5000, lockfile_lines=0):
+        self.files_per_pr = files_per_pr
+        self.lockfile_lines = lockfile_lines
+        self.lines_per_file = lines_per_file
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.rate_remaining = rate_limit
+        self.rate_reset = int(time.time()) + 3600
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.comments = []
+        self.reviews = []
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+
+    def record_call(self, route):
+        with self.lock:
+            self.calls[route] = self.calls.get(route, 0) + 1
+
+    def spend_rate_limit(self, free=False):
+        """Charge one request against the budget; returns the rate-limit headers to send."""
+        with self.lock:
+            if time.time() >= self.rate_reset:
+                self.rate_remaining = self.rate_limit
+                self.rate_reset = int(time.time()) + 3600
+            allowed = self.rate_remaining > 0
+            if allowed and not free:
+                self.rate_remaining -= 1
+            return allowed, {
+                "X-RateLimit-Limit": str(self.rate_limit),
+                "X-RateLimit-Remaining": str(self.rate_remaining),
+                "X-RateLimit-Reset": str(self.rate_reset),
+            }
+
+    def pull(self, repo_name, number):
+        return {
+            "number": number,
+            "base": {"sha": _sha(repo_name, number, "base")},
+            "head": {"sha": _sha(repo_name, number, "head")},
+        }
+
+    def comparison(self):
+        files = []
+        for i in range(self.files_per_pr):
+            body = []
+            for j in range(self.lines_per_file // 2):
+                body.append(f"+def generated_function_{i}_{j}(value):")
+                body.append("+    return value")
+            files.append({
+                "filename": f"src/module_{i}.py",
+                "status": "modified",
+                "additions": len(body),
+                "deletions": 0,
+                "patch": f"@@ -0,0 +1,{len(body)} @@\n" + "\n".join(body),
+            })
+        if self.lockfile_lines:
+            # Lockfile churn, which the diff filter should keep out of the prompts
+            body = [f'+    "dependency-{j}": "^1.{j}.0",' for j in range(self.lockfile_lines)]
+            files.append({
+                "filename": "package-lock.json",
+                "status": "modified",
+                "additions": len(body),
+                "deletions": 0,
+                "patch": f"@@ -1,0 +1,{len(body)} @@\n" + "\n".join(body),
+            })
+        return {"files": files}
+
+    def tarball(self, repo_name, ref):
+        """Gzipped source archive of the synthetic modules, laid out like GitHub's (`owner-repo-sha/...`)."""
+        root = f"{repo_name.replace('/', '-')}-{ref[:7]}"
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode="w:gz") as archive:
+            for i in range(self.files_per_pr):
+                source = "".join(
+                    f"def generated_function_{i}_{j}(value):\n    return value\n\n"
+                    for j in range(self.lines_per_file // 2)
+                ).encode("utf-8")
+                info = tarfile.TarInfo(f"{root}/src/module_{i}.py")
+                info.size = len(source)
+                archive.addfile(info, io.BytesIO(source))
+        return buffer.getvalue()
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status, payload, route):
+                if server.latency:
+                    time.sleep(server.latency)
+                body = json.dumps(payload).encode("utf-8")
+                etag = '"%s"' % hashlib.sha1(body).hexdigest()
+                not_modified = self.command == "GET" and self.headers.get("If-None-Match") == etag
+                allowed, rate_headers = server.spend_rate_limit(free=not_modified)
+                if not allowed:
+                    server.record_call("rate_limited")
+                    body = json.dumps({"message": "API rate limit exceeded"}).encode("utf-8")
+                    self.send_response(403)
+                    for name, value in rate_headers.items():
+                        self.send_header(name, value)
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                    return
+                if not_modified:
+                    server.record_call(f"{route}:304")
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    for name, value in rate_headers.items():
+                        self.send_header(name, value)
+                    self.end_headers()
+                    return
+                server.record_call(route)
+                self.send_response(status)
+                for name, value in rate_headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("ETag", etag)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _reply_archive(self, body):
+                allowed, rate_headers = server.spend_rate_limit()
+                if not allowed:
+                    return self._reply(403, {"message": "API rate limit exceeded"}, "rate_limited")
+                server.record_call("tarball")
+                self.send_response(200)
+                for name, value in rate_headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/x-gzip")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                parts = self.path.split("?")[0].strip("/").split("/")
+                if len(parts) == 5 and parts[3] == "tarball":
+                    return self._reply_archive(server.tarball(f"{parts[1]}/{parts[2]}", parts[4]))
+                if parts == ["user"]:
+                    return self._reply(200, {"login": BOT_LOGIN}, "get_user")
+                if len(parts) == 3 and parts[0] == "repos":
+                    return self._reply(200, {"full_name": f"{parts[1]}/{parts[2]}"}, "get_repo")
+                if len(parts) == 5 and parts[3] == "pulls":
+                    return self._reply(200, server.pull(f"{parts[1]}/{parts[2]}", int(parts[4])), "get_pull")
+                if len(parts) == 5 and parts[3] == "compare":
+                    return self._reply(200, server.comparison(), "compare")
+                if len(parts) == 6 and parts[3] == "issues" and parts[5] == "comments":
+                    repo_name, number = f"{parts[1]}/{parts[2]}", int(parts[4])
+                    with server.lock:
+                        comments = [
+                            {"id": i + 1, "body": body, "user": {"login": BOT_LOGIN, "type": "Bot"}}
+                            for i, (repo, pr, body) in enumerate(server.comments) if (repo, pr) == (repo_name, number)
+                        ]
+                    return self._reply(200, comments, "list_comments")
+                self._reply(404, {"message": "Not Found"}, "not_found")
+
+            def do_POST(self):
+                parts = self.path.strip("/").split("/")
+                length = int(self.headers.get("Content-Length") or 0)
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                if len(parts) == 6 and parts[3] == "issues" and parts[5] == "comments":
+                    with server.lock:
+                        server.comments.append((f"{parts[1]}/{parts[2]}", int(parts[4]), payload.get("body", "")))
+                        comment_id = len(server.comments)
+                    return self._reply(201, {"id": comment_id, "body": payload.get("body", "")}, "create_comment")
+                if len(parts) == 6 and parts[3] == "pulls" and parts[5] == "reviews":
+                    with server.lock:
+                        server.reviews.append((f"{parts[1]}/{parts[2]}", int(parts[4]), payload))
+                        review_id = len(server.reviews)
+                    return self._reply(200, {"id": review_id, "state": "COMMENTED"}, "create_review")
+                self._reply(404, {"message": "Not Found"}, "not_found")
+
+            def do_PATCH(self):
+                parts = self.path.strip("/").split("/")
+                length = int(self.headers.get("Content-Length") or 0)
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                if len(parts) == 6 and parts[3] == "issues" and parts[4] == "comments":
+                    comment_id = int(parts[5])
+                    with server.lock:
+                        if not 0 < comment_id <= len(server.comments):
+                            comment_id = None
+                        else:
+                            repo_name, number, _ = server.comments[comment_id - 1]
+                            server.comments[comment_id - 1] = (repo_name, number, payload.get("body", ""))
+                    if comment_id is not None:
+                        return self._reply(200, {"id": comment_id, "body": payload.get("body", "")}, "update_comment")
+                self._reply(404, {"message": "Not Found"}, "not_found")
+
+        return Handler
+
+
+STUB_REVIEW = (
+    '{"style_issues": [{"file": "%s", "line": 1, "description": "Stub style finding."}], '
+    '"potential_bugs": [], "documentation_issues": [], "optimization_recommendations": [], '
+    '"summary": "Deterministic stub review."}'
+)
+STUB_REPORT = "## AI Tech Lead Analysis\n\nDeterministic stub report."
+
+
+class StubLLM(BaseLLM):
+    """
+    Deterministic LLM for benchmarks.
+
+    Latency is drawn from a seeded RNG as `latency * uniform(1 - jitter, 1 + jitter)`;
+    `failure_rate` of calls raise an error that the crew's retry logic treats as a
+    transient 503. Every call is recorded in `calls` as (stage, seconds, ok).
+    """
+
+    def __init__(self, model, latency=0.05, jitter=0.5, failure_rate=0.0, seed=0):
+        super().__init__(model=model, temperature=0.0)
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self._rng = random.Random(f"{seed}:{model}")
+        self._lock = threading.Lock()
+        self.calls = []
+
+    @staticmethod
+    def _stage(prompt):
+        if "Markdown report" in prompt:
+            return "report"
+        if "pytest" in prompt:
+            return "test"
+        return "review"
+
+    @staticmethod
+    def _prompt_text(messages):
+        if isinstance(messages, str):
+            return messages
+        return "\n".join(str(m.get("content", "")) for m in messages)
+
+    def call(self, messages, tools=None, callbacks=None, available_functions=None, **kwargs):
+        prompt = self._prompt_text(messages)
+        stage = self._stage(prompt)
+        with self._lock:
+            delay = self.latency * self._rng.uniform(1 - self.jitter, 1 + self.jitter)
+            fail = self._rng.random() < self.failure_rate
+        time.sleep(max(0.0, delay))
+        with self._lock:
+            self.calls.append((stage, delay, not fail))
+        if fail:
+            raise RuntimeError("503 Service Unavailable: The model is overloaded (stub failure injection).")
+
+        if stage == "report":
+            answer = STUB_REPORT
+        elif stage == "test":
+            filenames = sorted(set(line[len("+++ b/"):] for line in prompt.splitlines() if line.startswith("+++ b/")))
+            answer = "\n".join(
+                f"# === Tests for {name} ===\nimport pytest\n\ndef test_stub_{i}():\n    assert True\n"
+                for i, name in enumerate(filenames)
+            ) or "Tests SKIPPED due to non-testable code."
+        else:
+            first_file = next(
+                (line[len("+++ b/"):] for line in prompt.splitlines() if line.startswith("+++ b/")), "unknown"
+            )
+            answer = STUB_REVIEW % first_file
+        return f"Thought: I now can give a great answer\nFinal Answer: {answer}"
+
+    def supports_function_calling(self):
+        return False
+
+    def supports_stop_words(self):
+        return True
+
+    def get_context_window_size(self):
+        return 1048576
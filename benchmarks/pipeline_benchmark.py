@@ -0,0 +1,275 @@
+"""
+Offline benchmark for the webhook -> crew -> report pipeline.
+
+Replays pull_request webhooks (seeded from examples/reviewer_test_payloads.json)
+against watcher_server.app, with GitHub and Gemini replaced by the deterministic
+fakes in benchmarks/fakes.py. Prints (or writes) a JSON report with per-stage
+latency percentiles, throughput, peak RSS and peak thread count so runs can be
+compared across releases.
+
+Usage (from the repository root):
+    python -m benchmarks.pipeline_benchmark --requests 50 --concurrency 8 --files 20 --output bench.json
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+WEBHOOK_SECRET = "benchmark-secret"
+
+
+def percentiles(values):
+    if not values:
+        return {"count": 0, "p50": None, "p95": None, "p99": None, "max": None}
+    ordered = sorted(values)
+
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 4)
+
+    return {"count": len(ordered), "p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99), "max": round(ordered[-1], 4)}
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    return round(peak / (1024 * 1024) if platform.system() == "Darwin" else peak / 1024, 1)
+
+
+def seed_payloads(count):
+    """Turn the Reviewer Server example payloads into pull_request webhook events."""
+    with open(os.path.join(ROOT, "examples", "reviewer_test_payloads.json"), "r", encoding="utf-8") as f:
+        examples = [p for p in json.load(f).values() if isinstance(p, dict) and "pr_info" in p]
+    events = []
+    for i in range(count):
+        pr_info = examples[i % len(examples)]["pr_info"]
+        full_name = f"{pr_info['repo_owner']}/{pr_info['repo_name']}"
+        number = pr_info["number"] + i
+        events.append({
+            "action": "opened",
+            "number": number,
+            "repository": {"full_name": full_name},
+            "pull_request": {"number": number, "head": {"sha": hashlib.sha1(f"{full_name}{number}".encode()).hexdigest()}},
+        })
+    return events
+
+
+def configure_environment(args):
+    os.environ.setdefault("GITHUB_WEBHOOK_SECRET", WEBHOOK_SECRET)
+    os.environ.setdefault("GITHUB_ACCESS_TOKEN", "benchmark-token")
+    os.environ.setdefault("GEMINI_API_KEY", "benchmark-key")
+    os.environ["MAX_WORKERS"] = str(args.workers)
+    os.environ["MAX_WORKERS_PER_REPO"] = str(args.workers)
+    os.environ["MAX_QUEUE_DEPTH"] = str(max(args.requests, 1))
+    os.environ["QUEUE_BACKEND"] = args.queue_backend
+    os.environ["QUEUE_DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="ai-tech-lead-bench-"), "jobs.sqlite3")
+    os.environ["QUEUE_POLL_INTERVAL"] = "0.05"
+    # Every job must show up in the snapshot the report is built from
+    os.environ["JOB_HISTORY_SIZE"] = str(max(args.requests, 50))
+    os.environ["CHECKPOINTS"] = "false"
+    os.environ["INCREMENTAL_REVIEW"] = "true" if args.incremental else "false"
+    # Fake PRs share their patches; the cross-PR hunk index would skip all but the first review
+    os.environ["HUNK_INDEX"] = "true" if args.incremental else "false"
+    # A fresh LLM response cache per run, so earlier runs cannot answer this one's prompts
+    os.environ["LLM_CACHE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="ai-tech-lead-llm-cache-"), "llm_cache.sqlite3")
+    os.environ["HUNK_INDEX_PATH"] = os.path.join(tempfile.mkdtemp(prefix="ai-tech-lead-hunks-"), "hunks.sqlite3")
+    os.environ["CREW_KICKOFF_BASE_DELAY"] = "0.05"
+    os.environ["CREW_KICKOFF_MAX_DELAY"] = "0.2"
+    # Stub latencies are sub-second; hedge long before the production default kicks in
+    os.environ.setdefault("LLM_HEDGE_DEFAULT_DELAY", "1.0")
+    # Generated suites are run with pytest against the fake server's tarballs only when asked
+    os.environ["VERIFY_TESTS"] = "true" if args.verify_tests else "false"
+    # The fake server only serves the benchmark's own sources, so no sandbox is needed
+    os.environ["VERIFY_ALLOW_UNSANDBOXED"] = "true" if args.verify_tests else "false"
+    os.environ["VERIFY_WORKDIR"] = tempfile.mkdtemp(prefix="ai-tech-lead-verify-")
+    # The stub LLM factory is installed after import; a warm-up would build real LLMs
+    os.environ["WARMUP_ON_START"] = "false"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20, help="Webhook deliveries to replay")
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent webhook senders")
+    parser.add_argument("--workers", type=int, default=4, help="MAX_WORKERS for the job queue")
+    parser.add_argument("--files", type=int, default=5, help="Files per synthetic PR diff")
+    parser.add_argument("--lines", type=int, default=40, help="Added lines per synthetic file")
+    parser.add_argument("--lockfile-lines", type=int, default=0, help="Add a package-lock.json of this many lines to each PR")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Mean stub LLM latency (seconds)")
+    parser.add_argument("--llm-jitter", type=float, default=0.5, help="Relative latency jitter")
+    parser.add_argument("--llm-failure-rate", type=float, default=0.0, help="Fraction of LLM calls failing with 503")
+    parser.add_argument("--degraded-model", default=None,
+                        help="Catalog model (e.g. gemini-2.5-flash) whose stub uses the --degraded-* settings, "
+                             "to exercise hedging and the circuit breakers")
+    parser.add_argument("--degraded-latency", type=float, default=5.0, help="Mean stub latency of --degraded-model")
+    parser.add_argument("--degraded-failure-rate", type=float, default=0.0, help="503 rate of --degraded-model")
+    parser.add_argument("--github-latency", type=float, default=0.0, help="Latency per fake GitHub call (seconds)")
+    parser.add_argument("--github-rate-limit", type=int, default=5000, help="Hourly request budget of the fake GitHub")
+    parser.add_argument("--queue-backend", choices=("sqlite", "memory", "redis"), default="sqlite",
+                        help="QUEUE_BACKEND for the run (redis uses REDIS_URL)")
+    parser.add_argument("--verify-tests", action="store_true", help="Run the generated suites (VERIFY_TESTS)")
+    parser.add_argument("--incremental", action="store_true", help="Keep the per-file review cache and the cross-PR hunk index enabled")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=600.0, help="Max seconds to wait for the queue to drain")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    configure_environment(args)
+
+    from benchmarks.fakes import FakeGithubServer, StubLLM
+
+    fake_github = FakeGithubServer(
+        files_per_pr=args.files, lines_per_file=args.lines, latency=args.github_latency,
+        rate_limit=args.github_rate_limit, lockfile_lines=args.lockfile_lines,
+    ).start()
+    # The GitHub client is created at import time, so point it at the fake server first
+    os.environ["GITHUB_API_URL"] = fake_github.url
+
+    from ai_tech_lead_project import agents
+    from ai_tech_lead_project import watcher_server
+    from ai_tech_lead_project.tools.github_tools import github_tool
+    from ai_tech_lead_project.llm_dispatch import llm_dispatcher
+
+    stubs = []
+
+    degraded = agents._normalize_model_name(args.degraded_model) if args.degraded_model else None
+
+    def stub_factory(model):
+        if model == degraded:
+            stub = StubLLM(model, latency=args.degraded_latency, jitter=args.llm_jitter,
+                           failure_rate=args.degraded_failure_rate, seed=args.seed)
+        else:
+            stub = StubLLM(model, latency=args.llm_latency, jitter=args.llm_jitter,
+                           failure_rate=args.llm_failure_rate, seed=args.seed)
+        stubs.append(stub)
+        return stub
+
+    agents.set_llm_factory(stub_factory)
+
+    peak_threads = [threading.active_count()]
+    sampling = threading.Event()
+
+    def sample_threads():
+        while not sampling.is_set():
+            peak_threads[0] = max(peak_threads[0], threading.active_count())
+            time.sleep(0.01)
+
+    sampler = threading.Thread(target=sample_threads, daemon=True)
+    sampler.start()
+
+    events = seed_payloads(args.requests)
+    statuses = {}
+    ingest_latencies = []
+    lock = threading.Lock()
+
+    def send(index_events):
+        client = watcher_server.app.test_client()
+        for index, event in index_events:
+            body = json.dumps(event).encode("utf-8")
+            signature = "sha256=" + hmac.new(os.environ["GITHUB_WEBHOOK_SECRET"].encode("utf-8"), body, hashlib.sha256).hexdigest()
+            started_at = time.perf_counter()
+            response = client.post("/webhook", data=body, headers={
+                "Content-Type": "application/json",
+                "X-GitHub-Event": "pull_request",
+                "X-GitHub-Delivery": f"bench-{args.seed}-{index}",
+                "X-Hub-Signature-256": signature,
+            })
+            with lock:
+                ingest_latencies.append(time.perf_counter() - started_at)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    started_at = time.time()
+    senders = [
+        threading.Thread(target=send, args=([(i, e) for i, e in enumerate(events) if i % args.concurrency == n],))
+        for n in range(args.concurrency)
+    ]
+    for sender in senders:
+        sender.start()
+    for sender in senders:
+        sender.join()
+
+    queue = watcher_server.job_queue
+    deadline = time.time() + args.timeout
+    while time.time() < deadline:
+        counts = queue.snapshot()["counts"]
+        if counts["pending"] == 0 and counts["running"] == 0:
+            break
+        time.sleep(0.05)
+    elapsed = time.time() - started_at
+    sampling.set()
+
+    snapshot = queue.snapshot()
+    jobs = snapshot["recent"]
+    stage_seconds = {}
+    for job in jobs:
+        for record in job.get("stats", {}).get("stages", []):
+            stage_seconds.setdefault(record["stage"], []).append(record["seconds"])
+
+    llm_calls = [call for stub in stubs for call in stub.calls]
+    llm_by_stage = {}
+    for stage, seconds, _ in llm_calls:
+        llm_by_stage.setdefault(stage, []).append(seconds)
+
+    finished = [j for j in jobs if j["status"] == "succeeded"]
+    diff_filter_totals = {}
+    for job in jobs:
+        for key in ("bytes_skipped", "tokens_skipped_estimate", "files_skipped"):
+            value = job.get("stats", {}).get("diff_filter", {}).get(key, 0)
+            diff_filter_totals[key] = diff_filter_totals.get(key, 0) + value
+    verification_totals = {}
+    for job in jobs:
+        verification = job.get("stats", {}).get("verification", {})
+        for outcome, count in verification.get("summary", {}).items():
+            verification_totals[outcome] = verification_totals.get(outcome, 0) + count
+        if verification:
+            verification_totals["cached"] = verification_totals.get("cached", 0) + verification.get("cached", 0)
+    report = {
+        "config": vars(args),
+        "elapsed_seconds": round(elapsed, 3),
+        "webhook_status_codes": {str(k): v for k, v in sorted(statuses.items())},
+        "jobs": snapshot["counts"],
+        "throughput_prs_per_minute": round(len(finished) / elapsed * 60, 2) if elapsed else None,
+        "latency_seconds": {
+            "webhook_ingest": percentiles(ingest_latencies),
+            "queue_wait": percentiles([j["queue_wait_seconds"] for j in jobs]),
+            "end_to_end": percentiles([j["run_seconds"] for j in finished if j["run_seconds"] is not None]),
+            "stages": {stage: percentiles(values) for stage, values in sorted(stage_seconds.items())},
+            "llm_calls": {stage: percentiles(values) for stage, values in sorted(llm_by_stage.items())},
+        },
+        "llm": {
+            "calls": len(llm_calls),
+            "failures": sum(1 for _, _, ok in llm_calls if not ok),
+            "calls_by_model": {stub.model: len(stub.calls) for stub in stubs},
+            "dispatch": llm_dispatcher.stats(),
+        },
+        "diff_filter": diff_filter_totals,
+        "test_verification": verification_totals,
+        "github_calls": dict(sorted(fake_github.calls.items())),
+        "github_client": github_tool._github_client.stats(),
+        "github_comments_posted": len(fake_github.comments),
+        "github_reviews_posted": len(fake_github.reviews),
+        "peak_rss_mb": peak_rss_mb(),
+        "peak_threads": peak_threads[0],
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+        print(f"Benchmark report written to {args.output}")
+    else:
+        print(output)
+    fake_github.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+"""
+Startup benchmark for the watcher server.
+
+Starts fresh interpreters that import ai_tech_lead_project.watcher_server and
+issue a GET /health through Flask's test client, and reports how long the import
+and the first response took. It also reports whether crewai or litellm were
+loaded by the import, which should stay false now that they are deferred until
+the first job.
+
+Usage (from the repository root):
+    python -m benchmarks.startup_benchmark --runs 5 --max-seconds 1.0
+Exits with status 1 if the median time to the first response exceeds --max-seconds.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, sys, time
+started_at = time.perf_counter()
+from ai_tech_lead_project import watcher_server
+imported_at = time.perf_counter()
+response = watcher_server.app.test_client().get("/health")
+answered_at = time.perf_counter()
+print(json.dumps({
+    "import_seconds": imported_at - started_at,
+    "first_response_seconds": answered_at - started_at,
+    "health_status_code": response.status_code,
+    "heavy_modules_loaded": sorted(m for m in ("crewai", "litellm", "github") if m in sys.modules),
+}))
+"""
+
+
+def run_probe():
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.path.join(ROOT, "src") + os.pathsep + env.get("PYTHONPATH", "")
+    env.setdefault("GITHUB_WEBHOOK_SECRET", "benchmark-secret")
+    env.setdefault("GITHUB_ACCESS_TOKEN", "benchmark-token")
+    env.setdefault("GEMINI_API_KEY", "benchmark-key")
+    # Measure the cold path on its own; the warm-up thread would compete for the GIL
+    env["WARMUP_ON_START"] = "false"
+    # Keep the probe away from any real job store
+    env["QUEUE_EMBEDDED_WORKERS"] = "0"
+    env["QUEUE_DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="ai-tech-lead-startup-"), "jobs.sqlite3")
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE], env=env, cwd=ROOT, capture_output=True, text=True, check=True
+    ).stdout
+    # The server prints start-up messages; the probe result is the last line
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters to start")
+    parser.add_argument("--max-seconds", type=float, default=None,
+                        help="Fail if the median time to the first /health response exceeds this")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    probes = [run_probe() for _ in range(args.runs)]
+    import_seconds = [p["import_seconds"] for p in probes]
+    first_response = [p["first_response_seconds"] for p in probes]
+    report = {
+        "runs": args.runs,
+        "python": sys.version.split()[0],
+        "import_seconds": {"median": round(statistics.median(import_seconds), 4), "max": round(max(import_seconds), 4)},
+        "first_response_seconds": {"median": round(statistics.median(first_response), 4), "max": round(max(first_response), 4)},
+        "health_status_codes": sorted(set(p["health_status_code"] for p in probes)),
+        "heavy_modules_loaded": sorted(set(m for p in probes for m in p["heavy_modules_loaded"])),
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+        print(f"Startup report written to {args.output}")
+    else:
+        print(output)
+
+    if args.max_seconds is not None and report["first_response_seconds"]["median"] > args.max_seconds:
+        print(f"Startup regression: median first response {report['first_response_seconds']['median']}s "
+              f"exceeds {args.max_seconds}s")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
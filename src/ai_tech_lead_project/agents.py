@@ -1,6 +1,8 @@
 import os
-from crewai import Agent, LLM
-from .tools.github_tools import github_tool
+import threading
+
+# crewai, litellm and the GitHub client are imported on first use, not at import
+# time, so the webhook server can bind and answer health checks straight away.
 
 # Model catalog and validation utilities
 
@@ -78,10 +80,10 @@ def get_available_model_names():
     return list(models.keys())
 
 
-def validate_model_compatibility(model_name):
-    """Validate if a model is compatible with CrewAI requirements.
+def get_model_info(model_name):
+    """Look up a model's catalog entry.
     Accepts both Google API-style ids (e.g., 'models/gemini-2.5-pro') and
-    LiteLLM-style ids (e.g., 'gemini/gemini-2.5-pro').
+    LiteLLM-style ids (e.g., 'gemini/gemini-2.5-pro'). Returns None if unknown.
     """
     models = list_models()
 
@@ -101,9 +103,19 @@ def validate_model_compatibility(model_name):
     # Find the first match in our catalog
     model_key = next((k for k in candidate_keys if k in models), None)
     if model_key is None:
+        return None
+    return models[model_key]
+
+
+def validate_model_compatibility(model_name):
+    """Validate if a model is compatible with CrewAI requirements.
+    Accepts both Google API-style ids (e.g., 'models/gemini-2.5-pro') and
+    LiteLLM-style ids (e.g., 'gemini/gemini-2.5-pro').
+    """
+    model_info = get_model_info(model_name)
+    if model_info is None:
         return False
 
-    model_info = models[model_key]
     required_methods = ["generateContent", "countTokens"]
     return all(method in model_info.get("supported_methods", []) for method in required_methods)
 
@@ -123,59 +135,176 @@ def _normalize_model_name(raw: str) -> str:
 _raw_model = os.environ.get("GEMINI_MODEL", "gemini-2.5-flash").strip()
 model_name = _normalize_model_name(_raw_model)
 
-if not os.environ.get("GEMINI_API_KEY"):
-    raise ValueError("GEMINI_API_KEY is not set. Please set it in your environment or .env file.")
-
-if validate_model_compatibility(model_name):
-    # Fixed LLM configuration - removed explicit provider parameter
-    gemini_llm = LLM(
-        model=model_name,
-        api_key=os.environ.get("GEMINI_API_KEY"),
-        temperature=0.5,
-        # LiteLLM retry configuration to mitigate transient 5xx (e.g., Vertex 503 overloaded)
-        num_retries=int(os.environ.get("LITELLM_NUM_RETRIES", "4")),
-        request_timeout=int(os.environ.get("LITELLM_REQUEST_TIMEOUT", "120"))
+_llm_instances = {}
+_llm_lock = threading.Lock()
+_llm_factory = None
+# Default agents on the GEMINI_MODEL LLM, built on first access
+_default_agents = {}
+
+
+def set_llm_factory(factory):
+    """Swap how LLMs are constructed, e.g. for offline benchmark stubs. Pass None to restore LiteLLM.
+
+    Only LLMs obtained through get_llm() afterwards are affected.
+    """
+    global _llm_factory
+    with _llm_lock:
+        _llm_factory = factory
+        _llm_instances.clear()
+        _default_agents.clear()
+
+
+def get_llm(name=None):
+    """Return the shared LLM for a catalog model (default: GEMINI_MODEL), creating it on first use."""
+    normalized = _normalize_model_name(name or model_name)
+    if not validate_model_compatibility(normalized):
+        raise ValueError(f"Model {normalized} is not compatible with CrewAI requirements. Set GEMINI_MODEL to one of: {', '.join(get_available_model_names())}")
+    from .llm_dispatch import InstrumentedLLM, llm_dispatcher
+
+    def backups():
+        return _backup_llms(normalized)
+
+    with _llm_lock:
+        if normalized not in _llm_instances and _llm_factory is not None:
+            _llm_instances[normalized] = InstrumentedLLM(_llm_factory(normalized), backups=backups)
+        if normalized not in _llm_instances:
+            if not os.environ.get("GEMINI_API_KEY"):
+                raise ValueError("GEMINI_API_KEY is not set. Please set it in your environment or .env file.")
+            from crewai import LLM
+            # Fixed LLM configuration - removed explicit provider parameter
+            _llm_instances[normalized] = InstrumentedLLM(LLM(
+                model=normalized,
+                api_key=os.environ.get("GEMINI_API_KEY"),
+                temperature=0.5,
+                # LiteLLM retry configuration to mitigate transient 5xx (e.g., Vertex 503 overloaded).
+                # With hedging, a backup model answers instead of LiteLLM retrying the overloaded one.
+                num_retries=int(os.environ.get("LITELLM_NUM_RETRIES", "1" if llm_dispatcher.hedging else "4")),
+                request_timeout=int(os.environ.get("LITELLM_REQUEST_TIMEOUT", "120"))
+            ), backups=backups)
+        return _llm_instances[normalized]
+
+
+def _backup_llms(primary):
+    """
+    Wrapped LLMs of the LLM_FALLBACK_MODELS catalog models other than `primary`, in order;
+    the dispatcher fails over and hedges to them. Models that cannot be built are left out.
+    """
+    llms = []
+    for name in os.environ.get("LLM_FALLBACK_MODELS", "gemini-2.5-flash,gemini-2.0-flash,gemini-2.5-pro").split(","):
+        if not name.strip() or _normalize_model_name(name.strip()) == primary:
+            continue
+        try:
+            llms.append(get_llm(name.strip()).inner)
+        except ValueError as e:
+            print(f"Skipping backup model {name.strip()}: {e}")
+    return llms
+
+
+def get_gemini_llm():
+    """The default LLM (GEMINI_MODEL) shared by the module-level agents."""
+    return get_llm(model_name)
+
+
+# Agent factories, so a run can pair each agent with the model chosen for it
+def build_reviewer_agent(llm):
+    from crewai import Agent
+    from .tools.github_tools import get_github_tool
+    return Agent(
+        role='Expert AI Code Reviewer',
+        goal='Perform a thorough, line-by-line code review',
+        backstory="You are a Senior Software Engineer with a meticulous eye for detail.",
+        llm=llm,
+        tools=[get_github_tool()],
+        verbose=True,
+        allow_delegation=False
     )
-else:
-    raise ValueError(f"Model {model_name} is not compatible with CrewAI requirements. Set GEMINI_MODEL to one of: {', '.join(get_available_model_names())}")
-
-
-# Agents
-reviewer_agent = Agent(
-    role='Expert AI Code Reviewer',
-    goal='Perform a thorough, line-by-line code review',
-    backstory="You are a Senior Software Engineer with a meticulous eye for detail.",
-    llm=gemini_llm,
-    tools=[github_tool],
-    verbose=True,
-    allow_delegation=False
-)
-
-
-tester_agent = Agent(
-    role='Expert Python QA Engineer',
-    goal='Generate a comprehensive suite of pytest unit tests for the given code.',
-    backstory=(
-        "You are a Quality Assurance Engineer who specializes in the pytest framework. You have a knack for identifying "
-        "edge cases and ensuring complete code coverage. You follow a strict 'generate and verify' protocol to ensure "
-        "the tests you produce are valid and executable."
-    ),
-    llm=gemini_llm,  # Pass the LLM object
-    tools=[github_tool],
-    verbose=True,
-    allow_delegation=False
-)
-
-
-reporter_agent = Agent(
-    role='AI Tech Lead Reporter',
-    goal='Synthesize the code review and test results into a single, well-formatted Markdown report and post it to the GitHub pull request.',
-    backstory=(
-        "You are the communication hub for the AI Tech Lead team. You excel at taking complex technical data "
-        "and presenting it in a clear, concise, and actionable format for human developers."
-    ),
-    llm=gemini_llm,  # Pass the LLM object
-    tools=[github_tool],
-    verbose=True,
-    allow_delegation=False
-)
+
+
+def build_tester_agent(llm):
+    from crewai import Agent
+    from .tools.github_tools import get_github_tool
+    return Agent(
+        role='Expert Python QA Engineer',
+        goal='Generate a comprehensive suite of pytest unit tests for the given code.',
+        backstory=(
+            "You are a Quality Assurance Engineer who specializes in the pytest framework. You have a knack for identifying "
+            "edge cases and ensuring complete code coverage. You follow a strict 'generate and verify' protocol to ensure "
+            "the tests you produce are valid and executable."
+        ),
+        llm=llm,  # Pass the LLM object
+        tools=[get_github_tool()],
+        verbose=True,
+        allow_delegation=False
+    )
+
+
+def build_reporter_agent(llm):
+    from crewai import Agent
+    from .tools.github_tools import get_github_tool
+    from .tools.review_publisher import publisher_enabled
+    # With the review publisher the agent only writes the report; posting it is not its job
+    posts = not publisher_enabled()
+    return Agent(
+        role='AI Tech Lead Reporter',
+        goal='Synthesize the code review and test results into a single, well-formatted Markdown report'
+             + (' and post it to the GitHub pull request.' if posts else '.'),
+        backstory=(
+            "You are the communication hub for the AI Tech Lead team. You excel at taking complex technical data "
+            "and presenting it in a clear, concise, and actionable format for human developers."
+        ),
+        llm=llm,  # Pass the LLM object
+        tools=[get_github_tool()] if posts else [],
+        verbose=True,
+        allow_delegation=False
+    )
+
+
+def reformat_review_output(raw):
+    """
+    Small "reformat only" LLM call that turns a malformed review answer into the review JSON.
+
+    Used by ReviewOutputParser once local repair has failed, instead of re-running the review.
+    REVIEW_REFORMAT_MODEL picks the (cheap) model; REVIEW_REFORMAT=false disables the call.
+    """
+    if os.environ.get("REVIEW_REFORMAT", "true").lower() not in ("1", "true", "yes"):
+        raise RuntimeError("reformat-only calls are disabled (REVIEW_REFORMAT=false)")
+    from .utils.structured_output import reformat_prompt
+    llm = get_llm(os.environ.get("REVIEW_REFORMAT_MODEL", "gemini-2.5-flash"))
+    max_chars = int(os.environ.get("REVIEW_REFORMAT_MAX_CHARS", "60000"))
+    return llm.call([{"role": "user", "content": reformat_prompt(raw, max_chars)}])
+
+
+_AGENT_BUILDERS = {
+    "reviewer_agent": build_reviewer_agent,
+    "tester_agent": build_tester_agent,
+    "reporter_agent": build_reporter_agent,
+}
+
+
+def _get_default_agent(name):
+    llm = get_gemini_llm()
+    with _llm_lock:
+        if name not in _default_agents:
+            _default_agents[name] = _AGENT_BUILDERS[name](llm)
+        return _default_agents[name]
+
+
+def get_reviewer_agent():
+    return _get_default_agent("reviewer_agent")
+
+
+def get_tester_agent():
+    return _get_default_agent("tester_agent")
+
+
+def get_reporter_agent():
+    return _get_default_agent("reporter_agent")
+
+
+def __getattr__(name):
+    # Backwards compatibility for `from .agents import gemini_llm, reviewer_agent, ...`
+    if name == "gemini_llm":
+        return get_gemini_llm()
+    if name in _AGENT_BUILDERS:
+        return _get_default_agent(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,343 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .tools.github_scheduler import PRIORITY_LOW, github_scheduler
+from .utils.checkpoints import checkpoint_store
+from .utils.diff_filter import diff_filter
+from .utils.llm_cache import llm_response_cache
+from .utils.review_cache import review_cache, TESTS_SKIPPED_MESSAGE
+
+KINDS = ("review", "test")
+
+
+def _final_answer(text: str) -> str:
+    # Agent-style answers ("Thought: ... Final Answer: ...") are reduced to the answer itself
+    marker = "Final Answer:"
+    return text.split(marker, 1)[1].strip() if marker in text else text.strip()
+
+
+class BackfillRunner:
+    """
+    Reviews many PRs of one repository in bulk (`ai-tech-lead backfill`).
+
+    Throughput matters more than latency here, so instead of one crew per PR:
+    - diffs are fetched BACKFILL_FETCH_CONCURRENCY at a time, at low GitHub
+      priority so live webhook reviews keep their rate-limit budget;
+    - the review and test prompts of every PR (the same prompts the crew's
+      tasks use, with the diff inlined) are grouped into Gemini batch jobs of
+      BACKFILL_BATCH_SIZE requests, at most BACKFILL_MAX_INFLIGHT_BATCHES at a
+      time (mode "batch"), or sent as individual calls BACKFILL_LLM_CONCURRENCY
+      at a time (mode "sync", for models or environments without batch support);
+    - each PR's result is appended to a JSONL file as soon as both of its answers
+      are in, and stored in the per-file review cache so later webhook runs for
+      the PR only review what changed.
+    The JSONL file doubles as the checkpoint: finished PRs (at the same head SHA)
+    are skipped on the next run, and batch jobs that were submitted but not
+    collected are collected instead of resubmitted. Individual answers are also
+    saved to the stage checkpoint store.
+    """
+
+    def __init__(
+        self,
+        repo_name: str,
+        pr_numbers: Optional[Iterable[int]] = None,
+        state: str = "open",
+        output_path: Optional[str] = None,
+        mode: str = "auto",
+        model: Optional[str] = None,
+        fetch_concurrency: Optional[int] = None,
+        batch_size: Optional[int] = None,
+    ):
+        from .agents import model_name
+        self.repo_name = repo_name
+        self.pr_numbers = list(pr_numbers) if pr_numbers else None
+        self.state = state
+        self.output_path = output_path or os.path.join(
+            os.environ.get("BACKFILL_DIR", os.path.join("tmp", "backfill")), f"{repo_name.replace('/', '__')}.jsonl"
+        )
+        self.model = model or model_name
+        self.mode = self._resolve_mode(mode)
+        self.fetch_concurrency = fetch_concurrency or int(os.environ.get("BACKFILL_FETCH_CONCURRENCY", "8"))
+        self.batch_size = batch_size or int(os.environ.get("BACKFILL_BATCH_SIZE", "50"))
+        self.max_inflight_batches = int(os.environ.get("BACKFILL_MAX_INFLIGHT_BATCHES", "2"))
+        self.llm_concurrency = int(os.environ.get("BACKFILL_LLM_CONCURRENCY", "4"))
+
+        self._lock = threading.Lock()
+        # key -> answer text; key is "<pr>:<head_sha>:<kind>"
+        self._outputs: Dict[str, str] = {}
+        # pr -> (head_sha, diff entry, filtered files, elided filenames) for PRs waiting on answers
+        self._pending_prs: Dict[int, Tuple[str, Dict[str, Any], List[Dict[str, Any]], List[str]]] = {}
+        self._batch_buffer: List[Tuple[str, str]] = []
+        # Keys of batches resumed from an interrupted run, answered once those are collected
+        self._inflight_keys = set()
+        self._batch_pool = ThreadPoolExecutor(max_workers=max(1, self.max_inflight_batches), thread_name_prefix="backfill-batch")
+        self._llm_pool = ThreadPoolExecutor(max_workers=max(1, self.llm_concurrency), thread_name_prefix="backfill-llm")
+        self._futures = []
+        self.stats = {"prs_total": 0, "prs_resumed": 0, "succeeded": 0, "failed": 0, "batches_submitted": 0,
+                      "llm_requests": 0}
+
+    def _resolve_mode(self, mode: str) -> str:
+        if mode != "auto":
+            return mode
+        from .agents import get_model_info
+        info = get_model_info(self.model) or {}
+        batch_capable = "batchGenerateContent" in info.get("supported_methods", [])
+        return "batch" if batch_capable and os.environ.get("GEMINI_API_KEY") else "sync"
+
+    # --- Progress file (results + checkpoint) ---
+
+    def _load_progress(self) -> Tuple[Dict[int, str], List[Dict[str, Any]]]:
+        """Return ({pr: head_sha} of finished PRs, [batch records not yet collected])."""
+        done: Dict[int, str] = {}
+        batches: Dict[str, Dict[str, Any]] = {}
+        try:
+            with open(self.output_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A line cut short by an interrupted write
+                        continue
+                    if record.get("type") == "pr" and record.get("status") == "succeeded":
+                        done[record["pr_number"]] = record["head_sha"]
+                    elif record.get("type") == "batch":
+                        batches[record["name"]] = record
+                    elif record.get("type") == "batch_done":
+                        batches.pop(record["name"], None)
+        except OSError:
+            pass
+        return done, list(batches.values())
+
+    def _append(self, record: Dict[str, Any]):
+        line = json.dumps(record)
+        with self._lock:
+            with open(self.output_path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    # --- LLM answers ---
+
+    def _key(self, pr_number: int, head_sha: str, kind: str) -> str:
+        return f"{pr_number}:{head_sha}:{kind}"
+
+    def _store_answer(self, key: str, answer: Any):
+        pr_number, head_sha, kind = key.split(":", 2)
+        if isinstance(answer, Exception):
+            print(f"Backfill {self.repo_name}# {pr_number}: {kind} request failed: {answer}")
+            answer = None
+        else:
+            answer = _final_answer(answer)
+            checkpoint_store.save(self.repo_name, int(pr_number), head_sha, f"backfill:{kind}", answer)
+        with self._lock:
+            self._outputs[key] = answer
+        self._maybe_finish(int(pr_number))
+
+    def _request(self, key: str, prompt: str):
+        with self._lock:
+            self.stats["llm_requests"] += 1
+        if self.mode == "sync":
+            self._futures.append(self._llm_pool.submit(self._call_sync, key, prompt))
+            return
+        with self._lock:
+            self._batch_buffer.append((key, prompt))
+            full = len(self._batch_buffer) >= self.batch_size
+        if full:
+            self._flush_batch()
+
+    def _call_sync(self, key: str, prompt: str):
+        from .agents import get_llm
+        try:
+            # A re-run backfill replays identical prompts from the LLM response cache
+            with llm_response_cache.scope(self.repo_name):
+                answer = get_llm(self.model).call([{"role": "user", "content": prompt}])
+        except Exception as e:
+            answer = e
+        self._store_answer(key, answer)
+
+    def _flush_batch(self):
+        with self._lock:
+            prompts, self._batch_buffer = self._batch_buffer, []
+        if prompts:
+            # Bounded by the pool: at most BACKFILL_MAX_INFLIGHT_BATCHES jobs are submitted and polled at once
+            self._futures.append(self._batch_pool.submit(self._run_batch, prompts))
+
+    def _batch_client(self):
+        from .tools.gemini_batch import GeminiBatchClient
+        api_key = os.environ.get("GEMINI_API_KEY")
+        if not api_key:
+            raise RuntimeError("GEMINI_API_KEY is not set; batch mode needs it (or use --mode sync).")
+        return GeminiBatchClient(api_key)
+
+    def _run_batch(self, prompts: List[Tuple[str, str]]):
+        keys = [key for key, _ in prompts]
+        try:
+            client = self._batch_client()
+            name = client.submit(self.model, prompts, display_name=f"ai-tech-lead-backfill-{self.repo_name}")
+        except Exception as e:
+            for key in keys:
+                self._store_answer(key, e)
+            return
+        with self._lock:
+            self.stats["batches_submitted"] += 1
+        self._append({"type": "batch", "name": name, "keys": keys, "submitted_at": time.time()})
+        print(f"Backfill {self.repo_name}: submitted batch {name} with {len(keys)} requests.")
+        self._collect_batch(client, name, keys)
+
+    def _collect_batch(self, client, name: str, keys: List[str]):
+        try:
+            results = client.wait(name)
+        except Exception as e:
+            print(f"Backfill {self.repo_name}: batch {name} failed: {e}")
+            if not getattr(e, "retryable", False):
+                # Gone for good: the next run submits these prompts again
+                self._append({"type": "batch_done", "name": name, "error": str(e)})
+            # Otherwise the job record stays open and the next run tries to collect it again
+            for key in keys:
+                self._store_answer(key, e)
+            return
+        self._append({"type": "batch_done", "name": name})
+        for key in keys:
+            self._store_answer(key, results.get(key, RuntimeError("missing from batch results")))
+
+    # --- PRs ---
+
+    def _list_prs(self) -> List[Tuple[int, Optional[str]]]:
+        from .tools.github_tools import get_github_tool
+        if self.pr_numbers:
+            return [(number, None) for number in self.pr_numbers]
+        pulls = get_github_tool().list_pull_requests(self.repo_name, state=self.state)
+        return [(pull["number"], pull["head"]["sha"]) for pull in pulls]
+
+    def _fetch(self, pr_number: int) -> Dict[str, Any]:
+        from .tools.github_tools import get_github_tool
+        # Backfill traffic yields to live reviews when the rate-limit budget is tight
+        with github_scheduler.prioritize(self.repo_name, pr_number, PRIORITY_LOW):
+            return get_github_tool().get_pr_diff_entry(self.repo_name, pr_number)
+
+    def _start_pr(self, pr_number: int, entry: Dict[str, Any]):
+        from .tasks import review_pr_description, test_pr_description
+        from .tools.github_tools import format_prefetched_diff
+        head_sha = entry["head_sha"]
+        filtered = diff_filter.apply(entry["files"], entry.get("gitattributes"))
+        filtered.record_metrics()
+        diff, elided = format_prefetched_diff(
+            dict(entry, files=filtered.files),
+            int(os.environ.get("PREFETCH_MAX_FILE_CHARS", "20000")),
+            int(os.environ.get("PREFETCH_MAX_TOTAL_CHARS", "200000")),
+            skipped=filtered.skipped,
+        )
+        with self._lock:
+            self._pending_prs[pr_number] = (head_sha, entry, filtered.files, elided)
+        builders = {"review": review_pr_description, "test": test_pr_description}
+        for kind in KINDS:
+            key = self._key(pr_number, head_sha, kind)
+            with self._lock:
+                known = key in self._outputs or key in self._inflight_keys
+            if known:
+                continue
+            checkpoint = checkpoint_store.load(self.repo_name, pr_number, head_sha, f"backfill:{kind}")
+            if checkpoint is not None:
+                with self._lock:
+                    self._outputs[key] = checkpoint["output"]
+                continue
+            self._request(key, builders[kind](self.repo_name, pr_number, diff, elided))
+        self._maybe_finish(pr_number)
+
+    def _maybe_finish(self, pr_number: int):
+        from .agents import reformat_review_output
+        from .utils.structured_output import review_output_parser
+        with self._lock:
+            pending = self._pending_prs.get(pr_number)
+            if pending is None:
+                return
+            head_sha, entry, files, elided = pending
+            keys = [self._key(pr_number, head_sha, kind) for kind in KINDS]
+            if not all(key in self._outputs for key in keys):
+                return
+            del self._pending_prs[pr_number]
+            review_raw, tests = (self._outputs[key] for key in keys)
+
+        record = {"type": "pr", "repo_name": self.repo_name, "pr_number": pr_number, "head_sha": head_sha,
+                  "files": len(files), "files_elided": list(elided), "finished_at": time.time()}
+        if review_raw is None or tests is None:
+            record.update(status="failed", error="LLM request failed; rerun the backfill to retry this PR")
+        else:
+            review, method = review_output_parser.parse(review_raw, reformatter=reformat_review_output)
+            record.update(status="succeeded", review=review if review is not None else review_raw,
+                          review_parse=method, tests=tests or TESTS_SKIPPED_MESSAGE)
+            # Later webhook runs for this PR only review files that changed since the backfill.
+            # Elided patches were never shown to the model (batch prompts have no tools to fetch
+            # them), so they are left for the next webhook run to review.
+            reviewed = [f for f in files if f["filename"] not in set(elided)]
+            review_cache.store_run(self.repo_name, reviewed, review, tests)
+        self._append(record)
+        with self._lock:
+            self.stats[record["status"]] += 1
+            done = self.stats["succeeded"] + self.stats["failed"]
+        print(f"Backfill {self.repo_name}# {pr_number} @ {head_sha[:7]}: {record['status']} "
+              f"({done}/{self.stats['prs_total']}).")
+
+    def run(self) -> Dict[str, Any]:
+        started_at = time.time()
+        os.makedirs(os.path.dirname(self.output_path) or ".", exist_ok=True)
+        done, open_batches = self._load_progress()
+
+        if open_batches and self.mode == "batch":
+            # Batches submitted by an interrupted run are collected, not paid for again
+            client = self._batch_client()
+            for batch in open_batches:
+                self._inflight_keys.update(batch["keys"])
+                print(f"Backfill {self.repo_name}: resuming batch {batch['name']}.")
+                self._futures.append(self._batch_pool.submit(self._collect_batch, client, batch["name"], batch["keys"]))
+
+        prs = self._list_prs()
+        todo = [number for number, head_sha in prs if head_sha is None or done.get(number) != head_sha]
+        self.stats["prs_total"] = len(todo)
+        self.stats["prs_resumed"] = len(prs) - len(todo)
+        print(f"Backfill {self.repo_name}: {len(todo)} PR(s) to review, {self.stats['prs_resumed']} already done, "
+              f"mode {self.mode}, model {self.model}.")
+
+        with ThreadPoolExecutor(max_workers=max(1, self.fetch_concurrency), thread_name_prefix="backfill-fetch") as pool:
+            futures = {pool.submit(self._fetch, number): number for number in todo}
+            for future in as_completed(futures):
+                number = futures[future]
+                try:
+                    entry = future.result()
+                except Exception as e:
+                    print(f"Backfill {self.repo_name}# {number}: could not fetch the diff: {e}")
+                    self._append({"type": "pr", "repo_name": self.repo_name, "pr_number": number,
+                                  "status": "failed", "error": str(e), "finished_at": time.time()})
+                    with self._lock:
+                        self.stats["failed"] += 1
+                    continue
+                if done.get(number) == entry["head_sha"]:
+                    # Explicit PR numbers are only resolved to a head SHA here
+                    with self._lock:
+                        self.stats["prs_total"] -= 1
+                        self.stats["prs_resumed"] += 1
+                    continue
+                self._start_pr(number, entry)
+
+        self._flush_batch()
+        # Answers may schedule no further work, so waiting for the known futures is enough
+        while self._futures:
+            self._futures.pop(0).result()
+        self._batch_pool.shutdown(wait=True)
+        self._llm_pool.shutdown(wait=True)
+
+        elapsed = time.time() - started_at
+        finished = self.stats["succeeded"] + self.stats["failed"]
+        summary = dict(
+            self.stats,
+            output=self.output_path,
+            mode=self.mode,
+            elapsed_seconds=round(elapsed, 3),
+            prs_per_hour=round(finished / elapsed * 3600, 1) if elapsed and finished else None,
+        )
+        print(f"Backfill {self.repo_name} finished: {json.dumps(summary)}")
+        return summary
@@ -0,0 +1,50 @@
+import argparse
+import os
+
+from dotenv import load_dotenv
+
+
+def main(argv=None):
+    """Command-line entry point: `python -m ai_tech_lead_project <command>` (or scripts/ai-tech-lead)."""
+    load_dotenv()
+    parser = argparse.ArgumentParser(prog="ai-tech-lead", description="AI Tech Lead GitHub App")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve = commands.add_parser("serve", help="Run the webhook server (Flask development server)")
+    serve.add_argument("--port", type=int, default=int(os.environ.get("PORT", "5001")))
+
+    worker = commands.add_parser("worker", help="Run review jobs from the durable queue (QUEUE_BACKEND)")
+    worker.add_argument("--concurrency", type=int, default=None,
+                        help="Jobs to run at once in this process (default: MAX_WORKERS)")
+
+    backfill = commands.add_parser("backfill", help="Review many PRs of a repository in bulk (batched LLM requests)")
+    backfill.add_argument("repo", help="Repository as owner/name")
+    backfill.add_argument("--pr", type=int, action="append", dest="prs",
+                          help="PR number to review (repeatable; default: every PR in --state)")
+    backfill.add_argument("--state", choices=("open", "closed", "all"), default="open")
+    backfill.add_argument("--mode", choices=("auto", "batch", "sync"), default="auto",
+                          help="batch: Gemini batchGenerateContent jobs; sync: one call per prompt (default: batch when the model supports it)")
+    backfill.add_argument("--model", default=None, help="Model for every prompt (default: GEMINI_MODEL)")
+    backfill.add_argument("--output", default=None,
+                          help="JSONL results and checkpoint file (default: BACKFILL_DIR/<owner>__<repo>.jsonl)")
+    backfill.add_argument("--fetch-concurrency", type=int, default=None)
+    backfill.add_argument("--batch-size", type=int, default=None, help="LLM requests per batch job")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        from .watcher_server import app
+        print(f"Watcher is listening for GitHub webhooks on port {args.port}...")
+        app.run(host="0.0.0.0", port=args.port, debug=False)
+        return 0
+    if args.command == "worker":
+        from .worker import run_worker
+        return run_worker(args.concurrency)
+    if args.command == "backfill":
+        from .backfill import BackfillRunner
+        summary = BackfillRunner(
+            args.repo, pr_numbers=args.prs, state=args.state, output_path=args.output, mode=args.mode,
+            model=args.model, fetch_concurrency=args.fetch_concurrency, batch_size=args.batch_size,
+        ).run()
+        return 1 if summary["failed"] else 0
+    return 2
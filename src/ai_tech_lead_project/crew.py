@@ -1,18 +1,152 @@
 from crewai import Crew, Process
-from .agents import reviewer_agent, tester_agent, reporter_agent
+from .agents import (
+    get_reviewer_agent, get_tester_agent, get_reporter_agent, get_llm, get_model_info,
+    build_reviewer_agent, build_tester_agent, build_reporter_agent, reformat_review_output
+)
+from .llm_dispatch import cancellation, is_overload_error
+from .model_router import ModelRouter
 from .tasks import AITechLeadTasks
+from .tools.github_tools import get_github_tool, format_prefetched_diff
+from .tools.review_publisher import publisher_enabled
+from .utils.checkpoints import checkpoint_store
+from .utils.diff_filter import diff_filter
+from .utils.hunk_index import hunk_index
+from .utils.result_adapter import CrewAIResultAdapter
+from .utils.review_cache import (
+    review_cache, file_fingerprint, merge_reviews, merge_tests, TESTS_SKIPPED_MESSAGE
+)
+from .utils.structured_output import review_output_parser
+from .utils.metrics import STAGE_SECONDS, span
+from .utils.suite_verifier import suite_verifier, split_suites, format_verification
+from .utils.sharding import estimate_tokens, pack_shards, shard_token_budget
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
 import os
+import json
+import hashlib
+import contextvars
 import time
 import random
 
 
+class StageTimeout(Exception):
+    """Raised when a pipeline stage exceeds its STAGE_TIMEOUT_<STAGE> budget."""
+
+
 class AITechLeadCrew:
-    def __init__(self, repo_name: str, pr_number: int):
+    def __init__(self, repo_name: str, pr_number: int, head_sha: str = None, cancel_check=None, bypass_cache=False):
         self.repo_name = repo_name
         self.pr_number = pr_number
+        self.head_sha = head_sha
+        # Forced re-review: no checkpoints, cached file reviews or reused hunk findings either
+        self.bypass_cache = bypass_cache
+        # Callable raising JobCancelled once a newer push has superseded this run
+        self.cancel_check = cancel_check
         self.tasks = AITechLeadTasks()
+        # Per-run measurements (cache hit ratio, tokens saved, ...) for logging and metrics
+        self.run_stats = {}
+        self.review_output = None
+        self.test_output = None
+        self.router = ModelRouter()
+        self.models = {}
+        # "parallel" runs review and test as independent DAG nodes; "sequential" runs them one after the other
+        self.execution_mode = os.environ.get("EXECUTION_MODE", "parallel").strip().lower()
+        self._abort_reason = None
+        # Files the diff filter kept out of the prompts; listed as one summary line each
+        self.skipped_files = []
+
+    def _record_stage(self, stage, model, started_at, **extra):
+        """Remember which model handled a stage and how long it took, for threshold tuning."""
+        record = {"stage": stage, "model": model, "seconds": round(time.time() - started_at, 3)}
+        record.update(extra)
+        self.run_stats.setdefault("stages", []).append(record)
+        STAGE_SECONDS.observe(record["seconds"], stage=stage, model=model)
+        print(f"Stage timing for {self.repo_name}# {self.pr_number}: {record}")
+
+    def _check_cancelled(self, *_):
+        if self._abort_reason is not None:
+            raise StageTimeout(self._abort_reason)
+        if self.cancel_check is not None:
+            self.cancel_check()
+
+    @staticmethod
+    def _stage_timeout(stage):
+        default = "300" if stage in ("report", "verify") else "600"
+        return float(os.environ.get(f"STAGE_TIMEOUT_{stage.upper()}", default))
+
+    def _run_stages(self, stages):
+        """
+        Execute independent stages, each bounded by its own timeout.
+
+        `stages` is a list of (name, callable). In parallel mode all stages start at once,
+        so wall-clock time is that of the slowest stage rather than the sum. A timed-out
+        or failed stage aborts the run: threads still running are abandoned and stop at
+        their next LLM call or task boundary (see cancellation()).
+        """
+        if self.execution_mode == "sequential" and len(stages) > 1:
+            results = {}
+            for stage in stages:
+                results.update(self._run_stages([stage]))
+            return results
+
+        pool = ThreadPoolExecutor(max_workers=len(stages), thread_name_prefix="stage")
+        try:
+            started_at = time.time()
+            # Each stage runs in a copy of this context, so the run's LLM cache scope follows it
+            futures = [(name, pool.submit(contextvars.copy_context().run, fn)) for name, fn in stages]
+            results = {}
+            for name, future in futures:
+                remaining = self._stage_timeout(name) - (time.time() - started_at)
+                try:
+                    results[name] = future.result(timeout=max(0.0, remaining))
+                except FuturesTimeoutError:
+                    self._abort_reason = (
+                        f"Stage '{name}' for {self.repo_name}# {self.pr_number} exceeded its "
+                        f"{self._stage_timeout(name):.0f}s timeout."
+                    )
+                    raise StageTimeout(self._abort_reason)
+                except Exception as e:
+                    if self._abort_reason is None:
+                        self._abort_reason = f"Stage '{name}' for {self.repo_name}# {self.pr_number} failed: {e}"
+                    raise
+            return results
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _prefetch_diff(self):
+        """
+        Fetch the PR diff once, up front, so agents can start reasoning on their first
+        LLM call instead of spending a round-trip on a tool call. Returns the structured
+        diff entry, or None to fall back to tool-driven fetching.
+        """
+        if os.environ.get("PREFETCH_DIFF", "true").lower() not in ("1", "true", "yes"):
+            return None
+        try:
+            with span("diff_fetch"):
+                entry = get_github_tool().get_pr_diff_entry(self.repo_name, self.pr_number, head_sha=self.head_sha)
+        except Exception as e:
+            print(f"Diff prefetch failed for {self.repo_name}# {self.pr_number}, agents will fetch it: {e}")
+            return None
+        print(f"Prefetched diff for {self.repo_name}# {self.pr_number}: {len(entry['files'])} files.")
+        return entry
+
+    def _render_diff(self, entry):
+        max_file_chars = int(os.environ.get("PREFETCH_MAX_FILE_CHARS", "20000"))
+        max_total_chars = int(os.environ.get("PREFETCH_MAX_TOTAL_CHARS", "200000"))
+        return format_prefetched_diff(entry, max_file_chars, max_total_chars, skipped=self.skipped_files)
 
     def run(self):
+        # Every LLM call of the run, including those of abandoned stage threads, checks for cancellation first
+        with cancellation(self._check_cancelled):
+            entry = self._prefetch_diff()
+            if entry is None:
+                return self._run_tool_driven()
+            # Checkpoints are keyed by the SHA actually being reviewed
+            self.head_sha = entry["head_sha"]
+            return self._run_incremental(entry)
+
+    def _run_tool_driven(self):
+        """Original flow: every agent fetches the diff itself through the GitHub tool."""
+        reviewer_agent, tester_agent, reporter_agent = get_reviewer_agent(), get_tester_agent(), get_reporter_agent()
         review_task = self.tasks.review_pr_task(reviewer_agent, self.repo_name, self.pr_number)
         test_task = self.tasks.test_pr_task(tester_agent, self.repo_name, self.pr_number)
 
@@ -27,32 +161,366 @@ class AITechLeadCrew:
             agents=[reviewer_agent, tester_agent, reporter_agent],
             tasks=[review_task, test_task, report_task],
             process=Process.sequential,
-            verbose=True
+            verbose=True,
+            # Invoked after every task: the cooperative cancellation point between stages
+            task_callback=self._check_cancelled
+        )
+        result = self._kickoff(crew, stage="crew")
+        if publisher_enabled():
+            # No diff entry here, so every finding goes into the summary comment
+            self._publish(report_task.output.raw, review_task.output.raw)
+        return result
+
+    def _run_incremental(self, entry):
+        """
+        Review only files whose patch changed since a previous run of this PR, then merge
+        the cached reviewer/tester output for the untouched files before reporting.
+        """
+        # Lockfiles, generated code, vendored trees and oversized patches never reach the LLM
+        filtered = diff_filter.apply(entry["files"], entry.get("gitattributes"))
+        self.skipped_files = filtered.skipped
+        self.run_stats["diff_filter"] = filtered.stats()
+        filtered.record_metrics()
+        if filtered.skipped:
+            print(f"Diff filter for {self.repo_name}# {self.pr_number}: {self.run_stats['diff_filter']}")
+        files = filtered.files
+        incremental = os.environ.get("INCREMENTAL_REVIEW", "true").lower() in ("1", "true", "yes")
+        if incremental and not self.bypass_cache:
+            cached, changed = review_cache.partition(self.repo_name, files)
+        else:
+            cached, changed = [], list(files)
+        reused, hints = [], {}
+        if changed and hunk_index.enabled and not self.bypass_cache:
+            reused, changed, hints = self._match_prior_hunks(changed)
+
+        self.models = self.router.plan(changed or files)
+        self.run_stats["models"] = dict(self.models)
+
+        analysis_started_at = time.time()
+        fresh_reviews, unparsed_reviews, fresh_tests = [], [], []
+        shards = pack_shards(changed, shard_token_budget(get_model_info(self.models["review"]))) if changed else []
+        # Files reused from the hunk index skip the reviewer but still need generated tests
+        test_only = pack_shards(
+            [file for file, _ in reused], shard_token_budget(get_model_info(self.models["test"]))
+        ) if reused else []
+        if shards or test_only:
+            self.run_stats["shards"] = [len(shard) for shard in shards]
+            if test_only:
+                self.run_stats["test_only_shards"] = [len(shard) for shard in test_only]
+            jobs = [(shard, True) for shard in shards] + [(shard, False) for shard in test_only]
+            fanout = max(1, min(len(jobs), int(os.environ.get("REVIEW_SHARD_FANOUT", "4"))))
+            print(f"Reviewing {len(changed)} files of {self.repo_name}# {self.pr_number} in {len(shards)} shard(s), "
+                  f"{len(test_only)} test-only shard(s), fan-out {fanout}.")
+            with ThreadPoolExecutor(max_workers=fanout, thread_name_prefix="review-shard") as pool:
+                futures = [
+                    pool.submit(contextvars.copy_context().run, self._analyze_shard, entry, i, shard,
+                                hints=hints, review=review)
+                    for i, (shard, review) in enumerate(jobs)
+                ]
+                results = [future.result() for future in futures]
+
+            parse_methods = {}
+            reused_findings = {file["filename"]: findings for file, findings in reused}
+            for (shard, review), (review_raw, tests_raw) in zip(jobs, results):
+                fresh_tests.append(tests_raw)
+                if not review:
+                    # Cache the reused findings with the new tests so the next run skips both stages
+                    review_cache.store_run(
+                        self.repo_name, shard,
+                        merge_reviews({}, [reused_findings[f["filename"]] for f in shard]), tests_raw
+                    )
+                    continue
+                # Malformed JSON is repaired locally, or by a small reformat-only call, never by re-reviewing
+                parsed, method = review_output_parser.parse(review_raw, reformatter=reformat_review_output)
+                parse_methods[method] = parse_methods.get(method, 0) + 1
+                review_cache.store_run(self.repo_name, shard, parsed, tests_raw)
+                hunk_index.add_review(self.repo_name, shard, parsed, pr_number=self.pr_number)
+                if parsed is None:
+                    unparsed_reviews.append(review_raw)
+                else:
+                    fresh_reviews.append(parsed)
+            self.run_stats["review_parse"] = parse_methods
+
+        cached_patch_tokens = sum(estimate_tokens(f.get("patch") or "") for f, _ in cached)
+        self.run_stats["review_cache"] = {
+            "files_total": len(files),
+            "files_cached": len(cached),
+            "files_reviewed": len(changed),
+            "files_reused": len(reused),
+            "hit_ratio": round(len(cached) / len(files), 3) if files else 0.0,
+            # Both the reviewer and the tester would have read each cached patch
+            "tokens_saved_estimate": cached_patch_tokens * 2,
+        }
+        print(f"Incremental review stats for {self.repo_name}# {self.pr_number}: {self.run_stats['review_cache']}")
+
+        cached_findings = [e["findings"] for _, e in cached] + [findings for _, findings in reused]
+        merged_review = merge_reviews({}, fresh_reviews + cached_findings)
+        for review in fresh_reviews:
+            # Scalar fields (summary, overall_score, ...) come from the first shard that set them
+            for key, value in review.items():
+                if not isinstance(value, list):
+                    merged_review.setdefault(key, value)
+        review_output = json.dumps(merged_review, indent=2)
+        if unparsed_reviews:
+            # Unparseable shard output is handed through verbatim alongside the structured findings
+            review_output += "\n\nAdditional review output:\n" + "\n\n".join(unparsed_reviews)
+        test_output = merge_tests(
+            "\n\n".join(t.strip() for t in fresh_tests if t and t.strip() != TESTS_SKIPPED_MESSAGE),
+            [(f["filename"], e["tests"]) for f, e in cached]
+        )
+        self.review_output, self.test_output = review_output, test_output
+
+        self._check_cancelled()
+
+        verification = None
+        # Off by default: running PR code needs a sandbox (see SuiteVerifier)
+        if os.environ.get("VERIFY_TESTS", "false").lower() in ("1", "true", "yes"):
+            verification = self._run_stages([
+                ("verify", lambda: self._verify_tests(test_output, [f["filename"] for f in files]))
+            ])["verify"]
+            self._check_cancelled()
+
+        def build_report():
+            reporter = build_reporter_agent(get_llm(self.models["report"]))
+            task = self.tasks.report_task(
+                reporter,
+                self.repo_name,
+                self.pr_number,
+                review_output=review_output,
+                test_output=test_output,
+                verification=verification
+            )
+            return self._single_task_crew(reporter, task), task
+
+        report_started_at = time.time()
+        result = self._run_stages([
+            ("report", lambda: self._run_stage("report", self.models["report"], build_report))
+        ])["report"]
+        self.run_stats["wall_clock"] = {
+            "analysis_seconds": round(report_started_at - analysis_started_at, 3),
+            "report_seconds": round(time.time() - report_started_at, 3),
+            "total_seconds": round(time.time() - analysis_started_at, 3),
+        }
+        print(f"Wall-clock for {self.repo_name}# {self.pr_number}: {self.run_stats['wall_clock']}")
+        if publisher_enabled():
+            self._publish(result, merged_review, files)
+        return result
+
+    def _publish(self, report, review, files=None):
+        """
+        Post the report as the PR's summary comment and new findings as one inline review
+        (see ReviewPublisher). Transient GitHub errors (network, 429, 5xx) are retried up to
+        PUBLISH_MAX_ATTEMPTS times; a publish that still fails is recorded in
+        run_stats["publish"] instead of failing the job, so the finished review stays in the
+        job's result. Republishing edits the summary comment rather than duplicating it.
+        """
+        started_at = time.time()
+        analysis = CrewAIResultAdapter(reformatter=reformat_review_output).transform_crew_results(
+            {"review_results": review}, {"number": self.pr_number, "repo_name": self.repo_name}
+        )["analysis"]
+        max_attempts = max(1, int(os.environ.get("PUBLISH_MAX_ATTEMPTS", "3")))
+        base_delay = float(os.environ.get("PUBLISH_BASE_DELAY", "2.0"))
+        for attempt in range(1, max_attempts + 1):
+            try:
+                self.run_stats["publish"] = get_github_tool().publish_review(
+                    self.repo_name, self.pr_number, self.head_sha, report, analysis, files=files
+                )
+                break
+            except RuntimeError as e:
+                print(f"Not posting the review of {self.repo_name}# {self.pr_number}: {e}")
+                return
+            except Exception as e:
+                status = getattr(e, "status", None)
+                transient = status is None or status in (0, 429) or status >= 500
+                if attempt < max_attempts and transient:
+                    delay = base_delay * (2 ** (attempt - 1)) * (0.8 + 0.4 * random.random())
+                    print(f"Publishing the review of {self.repo_name}# {self.pr_number} failed (attempt {attempt}): {e}. Retrying in {delay:.1f}s...")
+                    time.sleep(delay)
+                    self._check_cancelled()
+                    continue
+                print(f"Could not publish the review of {self.repo_name}# {self.pr_number}: {e}")
+                self.run_stats["publish"] = {"error": str(e), "status": status, "attempts": attempt}
+                self._record_stage("publish", "github", started_at, error=str(e), attempts=attempt)
+                return
+        self._record_stage("publish", "github", started_at, **self.run_stats["publish"])
+
+    def _match_prior_hunks(self, files):
+        """
+        Look the hunks of `files` up in the cross-PR hunk index. A file whose every hunk
+        has the normalized hash of a hunk reviewed in another PR is not reviewed again:
+        the prior findings are reused. Similar but not identical hunks (a one-token fix
+        still scores close to 1.0) are only handed to the reviewer as hints, down to
+        HUNK_ATTACH_THRESHOLD. Returns (reused [(file, findings)], to_review, hints).
+        """
+        attach_at = float(os.environ.get("HUNK_ATTACH_THRESHOLD", "0.85"))
+        try:
+            matches = hunk_index.lookup(self.repo_name, files, pr_number=self.pr_number)
+        except Exception as e:
+            print(f"Hunk index lookup failed for {self.repo_name}# {self.pr_number}: {e}")
+            return [], files, {}
+
+        reused, to_review, hints = [], [], {}
+        for file in files:
+            file_matches = matches.get(file["filename"]) or []
+            if file_matches and all(m["exact"] for m in file_matches):
+                findings = {}
+                for match in file_matches:
+                    for item in match["findings"]:
+                        findings.setdefault(item["category"], []).append(item["finding"])
+                reused.append((file, findings))
+                continue
+            to_review.append(file)
+            attached = [
+                item for m in file_matches if (m["similarity"] or 0) >= attach_at for item in m["findings"]
+            ]
+            if attached:
+                hints[file["filename"]] = attached
+        self.run_stats["hunk_index"] = dict(
+            hunk_index.stats(), files_reused=len(reused), files_with_hints=len(hints)
+        )
+        if reused or hints:
+            print(f"Hunk index for {self.repo_name}# {self.pr_number}: {self.run_stats['hunk_index']}")
+        return reused, to_review, hints
+
+    def _verify_tests(self, test_output, filenames):
+        """
+        Run the generated suites against the PR head (see SuiteVerifier) and return the
+        Markdown summary for the reporter, or None when there was nothing to run.
+        Verification problems never fail the review; they are reported instead.
+        """
+        suites = split_suites(test_output, filenames)
+        if not suites:
+            return None
+        started_at = time.time()
+
+        def fetch_source(dest_path):
+            return get_github_tool().download_source(self.repo_name, self.pr_number, self.head_sha, dest_path)
+
+        try:
+            report = suite_verifier.verify(self.repo_name, self.head_sha, suites, fetch_source)
+        except Exception as e:
+            print(f"Test verification skipped for {self.repo_name}# {self.pr_number}: {e}")
+            report = {"status": "skipped", "reason": str(e)}
+        self.run_stats["verification"] = {
+            key: report[key] for key in ("status", "summary", "cached", "reason") if key in report
+        }
+        self._record_stage("verify", "pytest", started_at, suites=len(suites))
+        return format_verification(report)
+
+    def _analyze_shard(self, entry, shard_index, files, hints=None, review=True):
+        """
+        Run the reviewer and tester over one shard of the diff. Returns (review_raw, tests_raw).
+        `hints` maps filenames to prior findings on near-identical hunks (see _match_prior_hunks).
+        With review=False only the tester runs and review_raw is None.
+        """
+        self._check_cancelled()
+        diff, elided = self._render_diff(dict(entry, files=files))
+        shard_id = hashlib.sha256("".join(file_fingerprint(f) for f in files).encode("utf-8")).hexdigest()[:16]
+
+        def build_review():
+            # Each stage gets its own agent: agent executors are not safe to share across threads
+            reviewer = build_reviewer_agent(get_llm(self.models["review"]))
+            task = self.tasks.review_pr_task(
+                reviewer, self.repo_name, self.pr_number, diff=diff, elided_files=elided,
+                async_execution=False,
+                prior_findings=[item for f in files for item in (hints or {}).get(f["filename"], [])]
+            )
+            return self._single_task_crew(reviewer, task), task
+
+        def build_test():
+            tester = build_tester_agent(get_llm(self.models["test"]))
+            task = self.tasks.test_pr_task(
+                tester, self.repo_name, self.pr_number, diff=diff, elided_files=elided,
+                async_execution=False
+            )
+            return self._single_task_crew(tester, task), task
+
+        test_stage = ("test", lambda: self._run_stage(
+            "test", self.models["test"], build_test,
+            checkpoint_key=f"test:{shard_id}", shard=shard_index, files=len(files)
+        ))
+        if not review:
+            return None, self._run_stages([test_stage])["test"]
+        # Review and test generation are independent: run them side by side and join for the reporter
+        results = self._run_stages([
+            ("review", lambda: self._run_stage(
+                "review", self.models["review"], build_review,
+                checkpoint_key=f"review:{shard_id}", shard=shard_index, files=len(files)
+            )),
+            test_stage,
+        ])
+        return results["review"], results["test"]
+
+    def _single_task_crew(self, agent, task):
+        return Crew(
+            agents=[agent],
+            tasks=[task],
+            process=Process.sequential,
+            verbose=True,
+            task_callback=self._check_cancelled
         )
 
-        # Orchestration-level retry to handle transient LLM 5xx errors (e.g., Vertex 503 overloaded)
-        max_attempts = int(os.environ.get("CREW_KICKOFF_MAX_ATTEMPTS", "2"))
+    def _run_stage(self, stage, model, build, checkpoint_key=None, **extra):
+        """
+        Run one pipeline stage, resuming from its checkpoint when a previous attempt
+        (or a previous process) already completed it. `build` returns (crew, task);
+        the task's raw output is checkpointed and returned.
+        """
+        checkpoint_key = checkpoint_key or stage
+        checkpoint = None
+        if not self.bypass_cache:
+            checkpoint = checkpoint_store.load(self.repo_name, self.pr_number, self.head_sha, checkpoint_key)
+        if checkpoint is not None:
+            print(f"Resuming {self.repo_name}# {self.pr_number} from checkpoint '{checkpoint_key}'.")
+            self.run_stats.setdefault("resumed_stages", []).append(checkpoint_key)
+            return checkpoint["output"]
+
+        started_at = time.time()
+        crew, task = build()
+        self._kickoff(crew, stage=stage)
+        output = task.output.raw
+        checkpoint_store.save(self.repo_name, self.pr_number, self.head_sha, checkpoint_key, output)
+        self._record_stage(stage, model, started_at, **extra)
+        return output
+
+    @staticmethod
+    def _retry_policy(stage):
+        """Per-stage retry budget: STAGE_MAX_ATTEMPTS_<STAGE> / STAGE_RETRY_BUDGET_<STAGE>, with global fallbacks."""
+        suffix = stage.upper().replace("+", "_")
+        max_attempts = int(os.environ.get(
+            f"STAGE_MAX_ATTEMPTS_{suffix}",
+            os.environ.get("STAGE_MAX_ATTEMPTS", os.environ.get("CREW_KICKOFF_MAX_ATTEMPTS", "2"))
+        ))
+        # Total seconds of backoff sleep a stage may spend before giving up
+        budget = float(os.environ.get(f"STAGE_RETRY_BUDGET_{suffix}", os.environ.get("STAGE_RETRY_BUDGET", "90")))
+        return max_attempts, budget
+
+    def _kickoff(self, crew, stage="crew"):
+        # Stage-level retry to handle transient LLM 5xx errors (e.g., Vertex 503 overloaded)
+        max_attempts, budget = self._retry_policy(stage)
         base_delay = float(os.environ.get("CREW_KICKOFF_BASE_DELAY", "2.0"))
         max_delay = float(os.environ.get("CREW_KICKOFF_MAX_DELAY", "30.0"))
 
         last_exc = None
+        slept = 0.0
         for attempt in range(1, max_attempts + 1):
+            self._check_cancelled()
             try:
-                print(f"Crew kickoff attempt {attempt}/{max_attempts} for {self.repo_name}# {self.pr_number}...")
+                print(f"Stage '{stage}' attempt {attempt}/{max_attempts} for {self.repo_name}# {self.pr_number}...")
                 result = crew.kickoff()
                 return result
             except Exception as e:
-                msg = str(e).lower()
-                is_overload = ("503" in msg) or ("overloaded" in msg) or ("unavailable" in msg)
-                if attempt < max_attempts and is_overload:
-                    # Exponential backoff with jitter
-                    delay = min(max_delay, base_delay * (2 ** (attempt - 1)))
-                    delay = delay * (0.8 + 0.4 * random.random())
-                    print(f"Transient LLM error encountered (attempt {attempt}): {e}. Retrying in {delay:.1f}s...")
+                is_overload = is_overload_error(e)
+                # Exponential backoff with jitter
+                delay = min(max_delay, base_delay * (2 ** (attempt - 1)))
+                delay = delay * (0.8 + 0.4 * random.random())
+                if attempt < max_attempts and is_overload and slept + delay <= budget:
+                    print(f"Transient LLM error in stage '{stage}' (attempt {attempt}): {e}. Retrying in {delay:.1f}s...")
                     time.sleep(delay)
+                    slept += delay
                     last_exc = e
                     continue
-                # non-retryable or exhausted attempts
+                # non-retryable, out of budget or exhausted attempts
                 last_exc = e
                 break
 
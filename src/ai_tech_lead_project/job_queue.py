@@ -0,0 +1,517 @@
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from .utils.metrics import JOBS_FINISHED, SPAN_SECONDS
+
+
+class QueueFullError(Exception):
+    """Raised when the job queue has reached its configured depth limit."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class DuplicateDeliveryError(Exception):
+    """Raised when a webhook delivery ID has already been accepted."""
+
+
+class JobCancelled(Exception):
+    """Raised inside a running job once a newer head SHA has superseded it."""
+
+
+@dataclass
+class Job:
+    repo_name: str
+    pr_number: int
+    head_sha: Optional[str] = None
+    delivery_id: Optional[str] = None
+    id: str = field(default_factory=lambda: uuid.uuid4().hex[:12])
+    status: str = "queued"
+    enqueued_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+    superseded_shas: List[str] = field(default_factory=list)
+    # "low" for re-reviews of a PR that has already been reviewed once
+    priority: str = "normal"
+    # Times a worker has picked the job up; above 1 after a lease expired (durable queues only)
+    attempts: int = 0
+    # Forced re-review: skip LLM response cache lookups (see LLMResponseCache)
+    bypass_cache: bool = False
+    # Measurements reported by the handler (stage timings, cache stats, ...)
+    stats: Dict[str, Any] = field(default_factory=dict)
+    cancel_event: threading.Event = field(default_factory=threading.Event, repr=False)
+
+    @property
+    def key(self):
+        return (self.repo_name, self.pr_number)
+
+    def is_cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    def raise_if_cancelled(self):
+        """Cooperative cancellation point, called between pipeline stages."""
+        if self.cancel_event.is_set():
+            raise JobCancelled(
+                f"Job {self.id} for {self.repo_name}# {self.pr_number} was superseded by a newer push."
+            )
+
+    def to_dict(self) -> Dict[str, Any]:
+        now = time.time()
+        queue_wait = (self.started_at or now) - self.enqueued_at
+        run_time = None
+        if self.started_at is not None:
+            run_time = (self.finished_at or now) - self.started_at
+        return {
+            "id": self.id,
+            "repo_name": self.repo_name,
+            "pr_number": self.pr_number,
+            "head_sha": self.head_sha,
+            "delivery_id": self.delivery_id,
+            "priority": self.priority,
+            "attempts": self.attempts,
+            "bypass_cache": self.bypass_cache,
+            "status": self.status,
+            "enqueued_at": self.enqueued_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "queue_wait_seconds": round(queue_wait, 3),
+            "run_seconds": round(run_time, 3) if run_time is not None else None,
+            "error": self.error,
+            "superseded_shas": list(self.superseded_shas),
+            "stats": self.stats,
+        }
+
+
+class JobQueue:
+    """
+    Bounded executor for crew runs triggered by webhooks.
+
+    Jobs are held in a FIFO queue and picked up by a fixed pool of worker
+    threads. A job is only started when both the global cap (MAX_WORKERS)
+    and the per-repository cap (MAX_WORKERS_PER_REPO) allow it, so a burst
+    of pushes to one repository cannot starve the others. Once the number of
+    queued jobs reaches MAX_QUEUE_DEPTH, submit() raises QueueFullError with
+    a Retry-After estimate.
+
+    Jobs are coalesced per (repo, PR): a pending job is updated in place to
+    the newest head SHA, and a running job for an older SHA is signalled to
+    stop at its next stage boundary. Webhook redeliveries carrying an already
+    seen X-GitHub-Delivery ID are rejected with DuplicateDeliveryError.
+
+    A PR that has already been reviewed once gets a low-priority job for new
+    pushes; low-priority jobs start only when no first review is waiting, and
+    their GitHub requests yield to first reviews when the rate limit is tight.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[Job], Any],
+        max_workers: Optional[int] = None,
+        max_per_repo: Optional[int] = None,
+        max_depth: Optional[int] = None,
+    ):
+        self._handler = handler
+        self.max_workers = max_workers if max_workers is not None else int(os.environ.get("MAX_WORKERS", "2"))
+        # In-process queue: the worker threads are the whole concurrency cap
+        self.max_running = self.max_workers
+        self.max_per_repo = max_per_repo if max_per_repo is not None else int(os.environ.get("MAX_WORKERS_PER_REPO", "1"))
+        self.max_depth = max_depth if max_depth is not None else int(os.environ.get("MAX_QUEUE_DEPTH", "50"))
+        self.default_retry_after = int(os.environ.get("QUEUE_RETRY_AFTER", "60"))
+
+        self._pending: deque = deque()
+        self._running: Dict[str, Job] = {}
+        self._running_per_repo: Dict[str, int] = {}
+        self._history: deque = deque(maxlen=int(os.environ.get("JOB_HISTORY_SIZE", "50")))
+        self._cond = threading.Condition()
+        self._workers: List[threading.Thread] = []
+        self._shutdown = False
+        self._seen_deliveries: OrderedDict = OrderedDict()
+        self._delivery_memory = int(os.environ.get("DELIVERY_DEDUP_SIZE", "1000"))
+        # (repo, PR) -> last successfully reviewed head SHA, bounded like the delivery memory
+        self._reviewed: OrderedDict = OrderedDict()
+
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.cancelled = 0
+        self.coalesced = 0
+        self.duplicates = 0
+
+    # --- Submission ---
+
+    def submit(
+        self,
+        repo_name: str,
+        pr_number: int,
+        head_sha: Optional[str] = None,
+        delivery_id: Optional[str] = None,
+        bypass_cache: bool = False,
+    ) -> Job:
+        """
+        Queue a crew run for the given pull request.
+
+        Returns the job that will review `head_sha`; this may be an existing
+        pending job for the same PR that has been retargeted to the new SHA.
+        `bypass_cache` (a forced re-review) sticks to a pending job it coalesces into.
+        """
+        with self._cond:
+            if delivery_id:
+                if delivery_id in self._seen_deliveries:
+                    self.duplicates += 1
+                    raise DuplicateDeliveryError(f"Delivery {delivery_id} was already accepted.")
+                self._seen_deliveries[delivery_id] = time.time()
+                while len(self._seen_deliveries) > self._delivery_memory:
+                    self._seen_deliveries.popitem(last=False)
+
+            key = (repo_name, pr_number)
+
+            # A newer push makes any in-flight review of an older SHA stale
+            for running in self._running.values():
+                if running.key == key and head_sha and running.head_sha != head_sha:
+                    running.cancel_event.set()
+
+            for pending in self._pending:
+                if pending.key == key:
+                    pending.bypass_cache = pending.bypass_cache or bypass_cache
+                    if head_sha and pending.head_sha != head_sha:
+                        if pending.head_sha:
+                            pending.superseded_shas.append(pending.head_sha)
+                        pending.head_sha = head_sha
+                        pending.delivery_id = delivery_id
+                        self.coalesced += 1
+                    return pending
+
+            if len(self._pending) >= self.max_depth:
+                self.rejected += 1
+                raise QueueFullError(
+                    f"Job queue is full ({len(self._pending)}/{self.max_depth} pending).",
+                    retry_after=self._retry_after_locked(),
+                )
+            job = Job(
+                repo_name=repo_name, pr_number=pr_number, head_sha=head_sha, delivery_id=delivery_id,
+                bypass_cache=bypass_cache
+            )
+            if key in self._reviewed:
+                job.priority = "low"
+            self._pending.append(job)
+            self._ensure_workers_locked()
+            self._cond.notify_all()
+            return job
+
+    def _retry_after_locked(self) -> int:
+        """Estimate how long until a queue slot frees up, in seconds."""
+        durations = [
+            j.finished_at - j.started_at
+            for j in self._history
+            if j.started_at is not None and j.finished_at is not None
+        ]
+        if not durations:
+            return self.default_retry_after
+        # A pending slot frees up whenever any running job finishes.
+        average = sum(durations) / len(durations)
+        return max(1, int(average / max(1, self.max_workers)))
+
+    # --- Workers ---
+
+    def _ensure_workers_locked(self):
+        self._workers = [w for w in self._workers if w.is_alive()]
+        while len(self._workers) < self.max_workers:
+            worker = threading.Thread(
+                target=self._worker_loop,
+                name=f"crew-worker-{len(self._workers) + 1}",
+                daemon=True,
+            )
+            worker.start()
+            self._workers.append(worker)
+
+    def _next_runnable_locked(self) -> Optional[Job]:
+        running_keys = {j.key for j in self._running.values()}
+        # First reviews go ahead of re-reviews; FIFO within each priority
+        for priority in ("normal", "low"):
+            for job in self._pending:
+                if job.priority != priority:
+                    continue
+                # Never run two reviews of the same PR side by side
+                if job.key in running_keys:
+                    continue
+                if self._running_per_repo.get(job.repo_name, 0) < self.max_per_repo:
+                    self._pending.remove(job)
+                    return job
+        return None
+
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                job = self._next_runnable_locked()
+                while job is None and not self._shutdown:
+                    self._cond.wait()
+                    job = self._next_runnable_locked()
+                if job is None:
+                    return
+                job.status = "running"
+                job.started_at = time.time()
+                SPAN_SECONDS.observe(job.started_at - job.enqueued_at, span="queue_wait")
+                self._running[job.id] = job
+                self._running_per_repo[job.repo_name] = self._running_per_repo.get(job.repo_name, 0) + 1
+
+            try:
+                job.raise_if_cancelled()
+                self._handler(job)
+                job.status = "succeeded"
+            except JobCancelled as e:
+                job.status = "cancelled"
+                job.error = str(e)
+            except Exception as e:
+                job.status = "failed"
+                job.error = str(e)
+            finally:
+                with self._cond:
+                    job.finished_at = time.time()
+                    self._running.pop(job.id, None)
+                    remaining = self._running_per_repo.get(job.repo_name, 1) - 1
+                    if remaining > 0:
+                        self._running_per_repo[job.repo_name] = remaining
+                    else:
+                        self._running_per_repo.pop(job.repo_name, None)
+                    if job.status == "succeeded":
+                        self._reviewed[job.key] = job.head_sha
+                        self._reviewed.move_to_end(job.key)
+                        while len(self._reviewed) > self._delivery_memory:
+                            self._reviewed.popitem(last=False)
+                    if job.status == "failed":
+                        self.failed += 1
+                    elif job.status == "cancelled":
+                        self.cancelled += 1
+                    else:
+                        self.completed += 1
+                    self._history.append(job)
+                    JOBS_FINISHED.inc(status=job.status)
+                    self._cond.notify_all()
+
+    def shutdown(self):
+        """Stop idle workers; running jobs are allowed to finish."""
+        with self._cond:
+            self._shutdown = True
+            self._cond.notify_all()
+
+    # --- Introspection ---
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "limits": {
+                    "max_workers": self.max_workers,
+                    "max_per_repo": self.max_per_repo,
+                    "max_queue_depth": self.max_depth,
+                },
+                "counts": {
+                    "pending": len(self._pending),
+                    "running": len(self._running),
+                    "completed": self.completed,
+                    "failed": self.failed,
+                    "rejected": self.rejected,
+                    "cancelled": self.cancelled,
+                    "coalesced": self.coalesced,
+                    "duplicate_deliveries": self.duplicates,
+                },
+                "running": [j.to_dict() for j in self._running.values()],
+                "pending": [j.to_dict() for j in self._pending],
+                "recent": [j.to_dict() for j in reversed(self._history)],
+            }
+
+
+class DurableJobQueue:
+    """
+    Job queue backed by SQLite or Redis (see queue_backends), shared by every
+    gunicorn worker and `ai-tech-lead worker` process pointing at the same store.
+
+    submit() only writes to the store, so webhooks are accepted as fast as the
+    store allows and nothing is lost when a process dies. QUEUE_EMBEDDED_WORKERS
+    threads in this process (default MAX_WORKERS; 0 for ingest-only web nodes)
+    lease jobs, renew the lease every third of QUEUE_VISIBILITY_TIMEOUT while
+    the handler runs, and record the outcome. However many processes and
+    threads lease, at most MAX_WORKERS jobs run at once: the backend refuses
+    leases beyond that. A job whose lease expires is run
+    again by another worker, up to JOB_MAX_ATTEMPTS times.
+
+    Exposes the same submit()/snapshot()/shutdown() interface as JobQueue.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[Job], Any],
+        backend,
+        workers: Optional[int] = None,
+        max_per_repo: Optional[int] = None,
+        max_depth: Optional[int] = None,
+    ):
+        self._handler = handler
+        self.backend = backend
+        if workers is None:
+            workers = int(os.environ.get("QUEUE_EMBEDDED_WORKERS", os.environ.get("MAX_WORKERS", "2")))
+        self.max_workers = workers
+        # Global cap on running jobs, enforced by the backend's lease() across every process
+        self.max_running = int(os.environ.get("MAX_WORKERS", "2"))
+        self.max_per_repo = max_per_repo if max_per_repo is not None else int(os.environ.get("MAX_WORKERS_PER_REPO", "1"))
+        self.max_depth = max_depth if max_depth is not None else int(os.environ.get("MAX_QUEUE_DEPTH", "50"))
+        self.default_retry_after = int(os.environ.get("QUEUE_RETRY_AFTER", "60"))
+        self.visibility_timeout = float(os.environ.get("QUEUE_VISIBILITY_TIMEOUT", "120"))
+        self.poll_interval = float(os.environ.get("QUEUE_POLL_INTERVAL", "1.0"))
+        self.max_attempts = int(os.environ.get("JOB_MAX_ATTEMPTS", "3"))
+        self.history_size = int(os.environ.get("JOB_HISTORY_SIZE", "50"))
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._running: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._workers: List[threading.Thread] = []
+        for i in range(self.max_workers):
+            worker = threading.Thread(target=self._worker_loop, name=f"crew-worker-{i + 1}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def submit(
+        self,
+        repo_name: str,
+        pr_number: int,
+        head_sha: Optional[str] = None,
+        delivery_id: Optional[str] = None,
+        bypass_cache: bool = False,
+    ) -> Job:
+        """Persist a crew run for the pull request; see JobQueue.submit()."""
+        job = self.backend.enqueue(
+            repo_name, pr_number, head_sha, delivery_id, max_depth=self.max_depth, retry_after=self._retry_after(),
+            bypass_cache=bypass_cache
+        )
+        # Stop a run of an older SHA in this process right away; other processes notice on their next renewal
+        with self._lock:
+            for running in self._running.values():
+                if running.key == job.key and head_sha and running.head_sha != head_sha:
+                    running.cancel_event.set()
+        self._wakeup.set()
+        return job
+
+    def _retry_after(self) -> int:
+        durations = self.backend.recent_durations()
+        if not durations:
+            return self.default_retry_after
+        average = sum(durations) / len(durations)
+        return max(1, int(average / max(1, self.max_running)))
+
+    def _worker_loop(self):
+        while not self._stop.is_set():
+            try:
+                job = self.backend.lease(
+                    self.worker_id, self.visibility_timeout, self.max_per_repo, self.max_attempts,
+                    max_running=self.max_running,
+                )
+            except Exception as e:
+                print(f"--- Job queue backend error while leasing: {e} ---")
+                job = None
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            self._run(job)
+
+    def _renew_lease(self, job: Job, done: threading.Event):
+        while not done.wait(self.visibility_timeout / 3):
+            try:
+                cancel_requested = self.backend.renew(job.id, self.worker_id, self.visibility_timeout)
+            except Exception as e:
+                print(f"--- Could not renew the lease of job {job.id}: {e} ---")
+                continue
+            if cancel_requested is None:
+                print(f"--- Lease of job {job.id} was lost; stopping at the next stage boundary ---")
+                job.cancel_event.set()
+            elif cancel_requested:
+                job.cancel_event.set()
+
+    def _run(self, job: Job):
+        SPAN_SECONDS.observe(job.started_at - job.enqueued_at, span="queue_wait")
+        with self._lock:
+            self._running[job.id] = job
+        done = threading.Event()
+        renewer = threading.Thread(target=self._renew_lease, args=(job, done), daemon=True)
+        renewer.start()
+        try:
+            job.raise_if_cancelled()
+            self._handler(job)
+            job.status = "succeeded"
+        except JobCancelled as e:
+            job.status = "cancelled"
+            job.error = str(e)
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            done.set()
+            job.finished_at = time.time()
+            with self._lock:
+                self._running.pop(job.id, None)
+            try:
+                if self.backend.finish(job, self.worker_id):
+                    JOBS_FINISHED.inc(status=job.status)
+            except Exception as e:
+                # The lease expires and another worker runs the job again
+                print(f"--- Could not record the outcome of job {job.id}: {e} ---")
+
+    def shutdown(self, wait: bool = False):
+        """Stop leasing new jobs; running jobs finish (or are re-run after their lease expires)."""
+        self._stop.set()
+        self._wakeup.set()
+        if wait:
+            for worker in self._workers:
+                worker.join()
+
+    def snapshot(self) -> Dict[str, Any]:
+        state = self.backend.snapshot(self.history_size)
+        counters = state["counters"]
+        return {
+            "backend": self.backend.describe(),
+            "limits": {
+                "max_workers": self.max_workers,
+                "max_running": self.max_running,
+                "max_per_repo": self.max_per_repo,
+                "max_queue_depth": self.max_depth,
+            },
+            "counts": {
+                "pending": len(state["pending"]),
+                "running": len(state["running"]),
+                "completed": counters.get("completed", 0),
+                "failed": counters.get("failed", 0),
+                "rejected": counters.get("rejected", 0),
+                "cancelled": counters.get("cancelled", 0),
+                "coalesced": counters.get("coalesced", 0),
+                "duplicate_deliveries": counters.get("duplicates", 0),
+            },
+            "running": [j.to_dict() for j in state["running"]],
+            "pending": [j.to_dict() for j in state["pending"]],
+            "recent": [j.to_dict() for j in state["recent"]],
+        }
+
+
+def create_job_queue(handler: Callable[[Job], Any], workers: Optional[int] = None):
+    """
+    Build the queue selected by QUEUE_BACKEND: "sqlite" (default), "redis", or
+    "memory" for the in-process JobQueue that loses jobs on restart.
+    """
+    backend_name = os.environ.get("QUEUE_BACKEND", "sqlite").strip().lower()
+    if backend_name == "memory":
+        return JobQueue(handler, max_workers=workers)
+    from .queue_backends import create_backend
+    backend = create_backend(
+        backend_name,
+        dedup_size=int(os.environ.get("DELIVERY_DEDUP_SIZE", "1000")),
+        history_size=int(os.environ.get("JOB_HISTORY_SIZE", "50")),
+    )
+    return DurableJobQueue(handler, backend, workers=workers)
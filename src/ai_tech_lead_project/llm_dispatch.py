@@ -0,0 +1,417 @@
+import contextvars
+import copy
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+from crewai.llms.base_llm import BaseLLM
+
+from .utils.llm_cache import llm_response_cache
+from .utils.metrics import (
+    LLM_BREAKER_OPEN, LLM_CALL_SECONDS, LLM_DISPATCH_EVENTS, LLM_ERRORS, LLM_TOKENS, llm_error_window
+)
+from .utils.sharding import estimate_tokens
+
+
+# Callable raising once the run making the current LLM calls was aborted; see cancellation()
+_cancel_check: contextvars.ContextVar = contextvars.ContextVar("llm_cancel_check", default=None)
+
+
+@contextmanager
+def cancellation(check: Callable[[], None]):
+    """
+    Make LLM calls in this context (and in contexts copied from it) call `check()` first,
+    so threads of a stage abandoned on timeout stop spending tokens once the run is over.
+    """
+    token = _cancel_check.set(check)
+    try:
+        yield
+    finally:
+        _cancel_check.reset(token)
+
+
+def _messages_text(messages) -> str:
+    if isinstance(messages, str):
+        return messages
+    parts = []
+    for message in messages or []:
+        content = message.get("content", "") if isinstance(message, dict) else message
+        parts.append(content if isinstance(content, str) else str(content))
+    return "\n".join(parts)
+
+
+def is_overload_error(error: Exception) -> bool:
+    """Transient provider overload (e.g. Gemini 503 "model is overloaded"), as opposed to a bad request."""
+    msg = str(error).lower()
+    return ("503" in msg) or ("overloaded" in msg) or ("unavailable" in msg)
+
+
+class CircuitBreaker:
+    """
+    Per-model breaker: opens after LLM_BREAKER_FAILURES consecutive overload errors,
+    and after LLM_BREAKER_COOLDOWN seconds lets a single probe call through
+    (half-open). A successful probe closes it, a failed one opens it again; until
+    the probe's own outcome is recorded no other call is let through.
+    """
+
+    def __init__(self, failure_threshold: int, cooldown: float):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state_locked()
+
+    def _state_locked(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.time() - self.opened_at >= self.cooldown:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> Optional[str]:
+        """None when the call must go elsewhere, "probe" for the half-open probe, else "closed"."""
+        with self._lock:
+            state = self._state_locked()
+            if state == "closed":
+                return "closed"
+            if state == "half_open" and not self._probing:
+                self._probing = True
+                return "probe"
+            return None
+
+    def release_probe(self):
+        """The probe was granted but never sent (e.g. cancelled); let the next call probe."""
+        with self._lock:
+            self._probing = False
+
+    def record(self, ok: bool, overload: bool = False, probe: bool = False) -> bool:
+        """Record a call's outcome; returns True when this outcome opened the breaker."""
+        with self._lock:
+            if probe:
+                self._probing = False
+            if ok:
+                self.failures, self.opened_at = 0, None
+                return False
+            if not overload:
+                return False
+            self.failures += 1
+            was_open = self.opened_at is not None
+            if self.failures >= self.failure_threshold or was_open:
+                self.opened_at = time.time()
+                return not was_open
+            return False
+
+
+class LLMDispatcher:
+    """
+    Sends each LLM call to a healthy model and hedges slow ones.
+
+    - Every model has a CircuitBreaker; calls skip models whose breaker is open and
+      go to the next backup (LLM_FALLBACK_MODELS, from the list_models() catalog).
+      An overload error fails the call over to the next backup right away.
+    - When a call has not answered within the LLM_HEDGE_PERCENTILE latency of its
+      model (LLM_HEDGE_DEFAULT_DELAY until LLM_HEDGE_MIN_SAMPLES calls were seen),
+      a duplicate goes to a backup model and whichever answers first wins. The
+      loser is cancelled if it has not started; a call already in flight cannot be
+      interrupted, so it is abandoned and its answer discarded.
+
+    With LLM_HEDGING=false attempts run one after the other on the caller's
+    thread; breakers and failover still apply.
+    """
+
+    def __init__(self):
+        self.hedging = os.environ.get("LLM_HEDGING", "true").lower() in ("1", "true", "yes")
+        self.percentile = float(os.environ.get("LLM_HEDGE_PERCENTILE", "95"))
+        self.min_samples = int(os.environ.get("LLM_HEDGE_MIN_SAMPLES", "20"))
+        self.default_delay = float(os.environ.get("LLM_HEDGE_DEFAULT_DELAY", "30"))
+        self.min_delay = float(os.environ.get("LLM_HEDGE_MIN_DELAY", "1"))
+        self.max_threads = int(os.environ.get("LLM_DISPATCH_MAX_THREADS", "64"))
+        self.failure_threshold = int(os.environ.get("LLM_BREAKER_FAILURES", "3"))
+        self.cooldown = float(os.environ.get("LLM_BREAKER_COOLDOWN", "30"))
+        self._lock = threading.Lock()
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._latencies: Dict[str, deque] = {}
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self.events: Dict[str, int] = {}
+        LLM_BREAKER_OPEN.set_function(
+            lambda: {(model,): float(b.state != "closed") for model, b in list(self._breakers.items())}
+        )
+
+    def breaker(self, model: str) -> CircuitBreaker:
+        with self._lock:
+            if model not in self._breakers:
+                self._breakers[model] = CircuitBreaker(self.failure_threshold, self.cooldown)
+            return self._breakers[model]
+
+    def _count(self, event: str):
+        with self._lock:
+            self.events[event] = self.events.get(event, 0) + 1
+        LLM_DISPATCH_EVENTS.inc(event=event)
+
+    def hedge_delay(self, model: str) -> float:
+        """Seconds to wait for `model` before sending a hedged duplicate."""
+        with self._lock:
+            samples = sorted(self._latencies.get(model, ()))
+        if len(samples) < self.min_samples:
+            return self.default_delay
+        index = min(len(samples) - 1, int(len(samples) * self.percentile / 100))
+        return max(self.min_delay, samples[index])
+
+    def _record(self, model: str, started_at: float, error: Optional[Exception], probe: bool):
+        if error is None:
+            with self._lock:
+                self._latencies.setdefault(model, deque(maxlen=200)).append(time.perf_counter() - started_at)
+        if self.breaker(model).record(error is None, error is not None and is_overload_error(error), probe=probe):
+            print(f"Circuit breaker opened for {model} after repeated overload errors; routing to backup models.")
+            self._count("breaker_opened")
+
+    def _attempt(self, llm, invoke, probe: bool = False):
+        started_at = time.perf_counter()
+        try:
+            result = invoke(llm)
+        except Exception as e:
+            self._record(llm.model, started_at, e, probe)
+            raise
+        self._record(llm.model, started_at, None, probe)
+        return result
+
+    def _executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_threads, thread_name_prefix="llm-dispatch")
+            return self._pool
+
+    def call(self, primary, backups: Callable[[], List[Any]], invoke: Callable[[Any], Any]):
+        """
+        Run `invoke(llm)` on `primary` or, per the rules above, on backups (a callable
+        returning the backup LLMs, resolved only when needed). Returns (llm, answer) for
+        the first answer, so callers can attribute it to the model that gave it.
+        """
+        resolved: List[Any] = []
+        tried = set()
+        # Models whose breaker granted this call its half-open probe
+        probes = set()
+
+        def admit(llm) -> bool:
+            permit = self.breaker(llm.model).allow()
+            if permit is None:
+                return False
+            tried.add(llm.model)
+            if permit == "probe":
+                probes.add(llm.model)
+            return True
+
+        def next_llm():
+            # Healthy models first, in order; the primary is skipped while its breaker is open
+            if not resolved:
+                resolved.append(primary)
+                try:
+                    resolved.extend(b for b in backups() if b.model != primary.model)
+                except Exception as e:
+                    print(f"Backup models unavailable: {e}")
+            for llm in resolved:
+                if llm.model not in tried and admit(llm):
+                    return llm
+            return None
+
+        if admit(primary):
+            first = primary
+        else:
+            first = next_llm()
+            if first is None:
+                # Every breaker is open: the primary is still the best guess
+                first = primary
+                tried.add(primary.model)
+            else:
+                self._count("rerouted")
+
+        if not self.hedging:
+            llm = first
+            while True:
+                try:
+                    result = self._attempt(llm, invoke, llm.model in probes)
+                except Exception as e:
+                    llm = next_llm() if is_overload_error(e) else None
+                    if llm is None:
+                        raise
+                    self._count("failover_sent")
+                    continue
+                if llm is not first:
+                    self._count("failover_won")
+                return llm, result
+
+        pool = self._executor()
+        # future -> (llm, how it was sent: primary, hedge or failover)
+        pending = {}
+
+        def send(llm, kind):
+            if kind != "primary":
+                self._count(f"{kind}_sent")
+            future = pool.submit(contextvars.copy_context().run, self._attempt, llm, invoke, llm.model in probes)
+            pending[future] = (llm, kind)
+
+        send(first, "primary")
+
+        hedged = False
+        last_error: Optional[Exception] = None
+        while pending:
+            timeout = None if hedged else self.hedge_delay(first.model)
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                # Only one duplicate per call, so overload does not multiply the load
+                hedged = True
+                backup = next_llm()
+                if backup is not None:
+                    send(backup, "hedge")
+                continue
+            for future in done:
+                llm, kind = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    last_error = e
+                    if not pending and is_overload_error(e):
+                        backup = next_llm()
+                        if backup is not None:
+                            send(backup, "failover")
+                    continue
+                if kind != "primary":
+                    self._count(f"{kind}_won")
+                for loser, (loser_llm, _) in pending.items():
+                    if loser.cancel() and loser_llm.model in probes:
+                        self.breaker(loser_llm.model).release_probe()
+                return llm, result
+        raise last_error
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            models = list(self._breakers)
+            events = dict(self.events)
+        return {
+            "events": events,
+            "breakers": {model: self.breaker(model).state for model in models},
+            "hedge_delay": {model: round(self.hedge_delay(model), 3) for model in models},
+        }
+
+
+# One dispatcher per process: breakers and latency percentiles are shared by every run
+llm_dispatcher = LLMDispatcher()
+
+
+class InstrumentedLLM(BaseLLM):
+    """
+    Transparent wrapper around the LLM an agent talks to.
+
+    Every call is timed into ai_tech_lead_llm_call_seconds, estimated prompt and
+    completion tokens are counted, and the outcome feeds the recent error rate
+    reported on /health. Within a run's cache scope, answers to byte-identical
+    prompts come from the LLM response cache (see LLMResponseCache) without
+    calling the wrapped LLM. Other calls go through the LLMDispatcher, which
+    may answer them from a backup model. Anything not overridden here is delegated to the
+    wrapped LLM. The stop words CrewAI sets on the agent's LLM stay on this wrapper and
+    are applied to whichever model answers (see _with_stop).
+
+    Works with both the plain BaseLLM of crewai<1 and the pydantic model of crewai 1.x:
+    `inner` and `backups` are set after BaseLLM.__init__ as ordinary instance attributes.
+    """
+
+    def __init__(self, inner, backups: Optional[Callable[[], List[Any]]] = None):
+        super().__init__(
+            model=inner.model,
+            temperature=getattr(inner, "temperature", None),
+            stop=list(getattr(inner, "stop", None) or []),
+        )
+        object.__setattr__(self, "inner", inner)
+        # Returns the LLMs of the backup models, for failover and hedging (see LLMDispatcher)
+        object.__setattr__(self, "backups", backups or (lambda: []))
+
+    def __getattr__(self, name):
+        if name in ("inner", "backups") or name.startswith("__"):
+            raise AttributeError(name)
+        # pydantic keeps private attributes behind its own __getattr__
+        parent = getattr(super(), "__getattr__", None)
+        if parent is not None:
+            try:
+                return parent(name)
+            except AttributeError:
+                pass
+        return getattr(self.inner, name)
+
+    def _call_stop(self) -> List[str]:
+        """Stop words for this call: crewai 1.x scopes per-call overrides through `stop_sequences`."""
+        if isinstance(getattr(type(self), "stop_sequences", None), property):
+            return list(self.stop_sequences or [])
+        return list(self.stop or [])
+
+    @staticmethod
+    def _with_stop(llm, stop: List[str]):
+        """`llm`, or a shallow copy of it with `stop` when it would stop on other words."""
+        if not stop or not llm.supports_stop_words() or list(getattr(llm, "stop", None) or []) == stop:
+            return llm
+        # Models are shared by every agent's calls: this call gets its own copy with this
+        # agent's stop words instead of changing them under everyone else
+        llm = copy.copy(llm)
+        llm.stop = list(stop)
+        return llm
+
+    def call(self, messages, tools=None, callbacks=None, available_functions=None, **kwargs):
+        check = _cancel_check.get()
+        if check is not None:
+            check()
+        temperature = getattr(self.inner, "temperature", None)
+        cached = llm_response_cache.get(self.inner.model, temperature, messages, tools)
+        if cached is not None:
+            return cached
+
+        def invoke(llm):
+            return self._invoke(llm, messages, tools, callbacks, available_functions, kwargs)
+
+        stop = self._call_stop()
+        try:
+            answered_by, result = llm_dispatcher.call(
+                self._with_stop(self.inner, stop), lambda: [self._with_stop(llm, stop) for llm in self.backups()], invoke
+            )
+        except Exception:
+            llm_error_window.record(False)
+            raise
+        llm_error_window.record(True)
+        # A backup's answer must not be replayed as if the primary model had given it
+        llm_response_cache.put(answered_by.model, getattr(answered_by, "temperature", None), messages, result, tools)
+        return result
+
+    @staticmethod
+    def _invoke(llm, messages, tools, callbacks, available_functions, kwargs):
+        """One attempt on one model, timed and counted under that model's name."""
+        model = llm.model
+        started_at = time.perf_counter()
+        try:
+            result = llm.call(
+                messages, tools=tools, callbacks=callbacks, available_functions=available_functions, **kwargs
+            )
+        except Exception:
+            LLM_CALL_SECONDS.observe(time.perf_counter() - started_at, model=model, outcome="error")
+            LLM_ERRORS.inc(model=model)
+            raise
+        LLM_CALL_SECONDS.observe(time.perf_counter() - started_at, model=model, outcome="ok")
+        LLM_TOKENS.inc(estimate_tokens(_messages_text(messages)), model=model, direction="prompt")
+        LLM_TOKENS.inc(estimate_tokens(result if isinstance(result, str) else str(result)), model=model, direction="completion")
+        return result
+
+    def supports_function_calling(self) -> bool:
+        return self.inner.supports_function_calling()
+
+    def supports_stop_words(self) -> bool:
+        return self.inner.supports_stop_words()
+
+    def get_context_window_size(self) -> int:
+        return self.inner.get_context_window_size()
@@ -0,0 +1,83 @@
+import os
+from typing import Any, Dict, List
+
+from .agents import model_name as default_model_name, validate_model_compatibility
+
+
+# Files whose review benefits from a stronger model; docs/config-only PRs stay on the fast one
+DEFAULT_CODE_EXTENSIONS = ".py,.go,.java,.kt,.rs,.c,.cc,.cpp,.h,.hpp,.cs,.ts,.tsx,.js,.jsx,.rb,.php,.scala,.swift"
+
+
+def summarize_diff(files: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Size and file-type features of a diff that routing decisions are based on."""
+    code_extensions = tuple(
+        ext.strip().lower()
+        for ext in os.environ.get("MODEL_ROUTER_CODE_EXTENSIONS", DEFAULT_CODE_EXTENSIONS).split(",")
+        if ext.strip()
+    )
+    code_files = [f for f in files if f["filename"].lower().endswith(code_extensions)]
+    return {
+        "files": len(files),
+        "changed_lines": sum(_changed(f) for f in files),
+        "code_changed_lines": sum(_changed(f) for f in code_files),
+        "code_files": len(code_files),
+    }
+
+
+def _changed(file: Dict[str, Any]) -> int:
+    return (file.get("additions") or 0) + (file.get("deletions") or 0)
+
+
+class ModelRouter:
+    """
+    Picks a catalog model for each agent stage of a run.
+
+    Policies (MODEL_ROUTING_POLICY):
+      - latency:  every stage uses the fast model.
+      - balanced: the reporter uses the fast model; the reviewer escalates to the
+                  strong model above MODEL_ROUTER_ESCALATE_LINES changed lines of
+                  code, the tester above MODEL_ROUTER_TESTER_ESCALATE_LINES.
+      - quality:  reviewer and tester always use the strong model.
+    Only lines in MODEL_ROUTER_CODE_EXTENSIONS files count toward the thresholds.
+    Off by default: unless MODEL_ROUTING=true every stage uses GEMINI_MODEL.
+    """
+
+    STAGES = ("review", "test", "report")
+
+    def __init__(self):
+        self.enabled = os.environ.get("MODEL_ROUTING", "false").lower() in ("1", "true", "yes")
+        self.policy = os.environ.get("MODEL_ROUTING_POLICY", "balanced").strip().lower()
+        self.fast_model = self._validated(os.environ.get("MODEL_ROUTER_FAST_MODEL", "gemini-2.5-flash"))
+        self.strong_model = self._validated(os.environ.get("MODEL_ROUTER_STRONG_MODEL", "gemini-2.5-pro"))
+        self.escalate_lines = int(os.environ.get("MODEL_ROUTER_ESCALATE_LINES", "400"))
+        self.tester_escalate_lines = int(
+            os.environ.get("MODEL_ROUTER_TESTER_ESCALATE_LINES", str(self.escalate_lines * 2))
+        )
+
+    @staticmethod
+    def _validated(name: str) -> str:
+        if validate_model_compatibility(name.strip()):
+            return name.strip()
+        print(f"Warning: routed model '{name}' is not in the catalog, falling back to {default_model_name}.")
+        return default_model_name
+
+    def select(self, stage: str, diff_summary: Dict[str, Any]) -> str:
+        """Return the model name to use for `stage` given summarize_diff() output."""
+        if stage not in self.STAGES:
+            raise ValueError(f"Unknown stage '{stage}'. Expected one of: {', '.join(self.STAGES)}")
+        if not self.enabled:
+            return default_model_name
+        if stage == "report" or self.policy == "latency":
+            return self.fast_model
+        if self.policy == "quality":
+            return self.strong_model
+
+        threshold = self.escalate_lines if stage == "review" else self.tester_escalate_lines
+        if diff_summary["code_changed_lines"] >= threshold:
+            return self.strong_model
+        return self.fast_model
+
+    def plan(self, files: List[Dict[str, Any]]) -> Dict[str, str]:
+        """Model choice for every stage of a run."""
+        summary = summarize_diff(files)
+        return {stage: self.select(stage, summary) for stage in self.STAGES}
@@ -0,0 +1,603 @@
+"""
+Durable storage for review jobs, shared by every process that serves webhooks or runs workers.
+
+Both backends implement the same operations used by DurableJobQueue:
+
+- enqueue():  dedupe the delivery, coalesce with a pending job for the same PR,
+              flag an in-flight review of an older SHA for cancellation, and
+              enforce the queue depth.
+- lease():    hand the oldest runnable job to a worker for `visibility_timeout`
+              seconds. A job whose lease expires (worker killed, OOM, deploy) is
+              handed out again, so delivery is at-least-once; if a newer push for
+              the same PR is already pending, the expired job is merged into it.
+- renew():    extend a lease while the job runs; also reports cancellation.
+- finish():   record the outcome, unless the lease was lost to another worker.
+- snapshot(): counts and recent jobs for /jobs and /health.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+from .job_queue import DuplicateDeliveryError, Job, QueueFullError
+
+PRIORITY_RANK = {"normal": 0, "low": 1}
+
+
+def _job_record(job: Job) -> Dict[str, Any]:
+    return {
+        "id": job.id,
+        "repo_name": job.repo_name,
+        "pr_number": job.pr_number,
+        "head_sha": job.head_sha,
+        "delivery_id": job.delivery_id,
+        "priority": job.priority,
+        "status": job.status,
+        "enqueued_at": job.enqueued_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+        "error": job.error,
+        "superseded_shas": list(job.superseded_shas),
+        "stats": job.stats,
+        "attempts": job.attempts,
+        "bypass_cache": job.bypass_cache,
+    }
+
+
+def _merge_expired(expired: Dict[str, Any], pending: Dict[str, Any]) -> str:
+    """
+    Fold an expired running job into the pending job for the same PR, as enqueue()
+    coalesces pushes: the pending job keeps the newest head SHA and a forced re-review
+    sticks. Updates `pending` in place and returns the expired job's error message.
+    """
+    superseded = pending.get("superseded_shas") or []
+    if isinstance(superseded, str):
+        superseded = json.loads(superseded)
+    superseded = list(superseded)
+    if not pending.get("head_sha"):
+        pending["head_sha"] = expired.get("head_sha")
+    elif expired.get("head_sha") and expired["head_sha"] != pending["head_sha"] and expired["head_sha"] not in superseded:
+        superseded.append(expired["head_sha"])
+    pending["superseded_shas"] = superseded
+    pending["bypass_cache"] = bool(pending.get("bypass_cache") or expired.get("bypass_cache"))
+    return f"Lease expired; merged into pending job {pending['id']} for the same pull request."
+
+
+def _job_from_record(record: Dict[str, Any]) -> Job:
+    superseded = record.get("superseded_shas") or []
+    stats = record.get("stats") or {}
+    return Job(
+        repo_name=record["repo_name"],
+        pr_number=int(record["pr_number"]),
+        head_sha=record.get("head_sha"),
+        delivery_id=record.get("delivery_id"),
+        id=record["id"],
+        status=record["status"],
+        enqueued_at=record["enqueued_at"],
+        started_at=record.get("started_at"),
+        finished_at=record.get("finished_at"),
+        error=record.get("error"),
+        superseded_shas=json.loads(superseded) if isinstance(superseded, str) else list(superseded),
+        priority=record.get("priority") or "normal",
+        stats=json.loads(stats) if isinstance(stats, str) else stats,
+        attempts=int(record.get("attempts") or 0),
+        bypass_cache=bool(record.get("bypass_cache")),
+    )
+
+
+class SQLiteQueueBackend:
+    """
+    Job store in a single SQLite database in WAL mode (QUEUE_DB_PATH).
+
+    Fine for any number of gunicorn workers and worker processes on one host;
+    use the Redis backend to spread workers over several machines.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            repo_name TEXT NOT NULL,
+            pr_number INTEGER NOT NULL,
+            head_sha TEXT,
+            delivery_id TEXT,
+            priority TEXT NOT NULL DEFAULT 'normal',
+            status TEXT NOT NULL,
+            enqueued_at REAL NOT NULL,
+            started_at REAL,
+            finished_at REAL,
+            error TEXT,
+            superseded_shas TEXT NOT NULL DEFAULT '[]',
+            stats TEXT NOT NULL DEFAULT '{}',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            bypass_cache INTEGER NOT NULL DEFAULT 0,
+            lease_owner TEXT,
+            lease_expires_at REAL,
+            cancel_requested INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS jobs_by_status ON jobs (status, priority, enqueued_at);
+        CREATE INDEX IF NOT EXISTS jobs_by_key ON jobs (repo_name, pr_number, status);
+        CREATE TABLE IF NOT EXISTS deliveries (delivery_id TEXT PRIMARY KEY, seen_at REAL NOT NULL);
+        CREATE TABLE IF NOT EXISTS reviewed (
+            repo_name TEXT NOT NULL, pr_number INTEGER NOT NULL, head_sha TEXT, reviewed_at REAL NOT NULL,
+            PRIMARY KEY (repo_name, pr_number)
+        );
+        CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+    """
+
+    def __init__(self, path: Optional[str] = None, dedup_size: int = 1000, retention_seconds: Optional[float] = None):
+        self.path = path or os.environ.get("QUEUE_DB_PATH", "tmp/jobs.sqlite3")
+        self.dedup_size = dedup_size
+        self.retention_seconds = retention_seconds or float(os.environ.get("QUEUE_RETENTION_SECONDS", str(7 * 24 * 3600)))
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(self.SCHEMA)
+        # Databases created before a column was added get it here
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+        if "bypass_cache" not in columns:
+            conn.execute("ALTER TABLE jobs ADD COLUMN bypass_cache INTEGER NOT NULL DEFAULT 0")
+
+    def describe(self) -> str:
+        return f"sqlite:{self.path}"
+
+    def _connection(self) -> sqlite3.Connection:
+        # One connection per thread; SQLite serialises writers across processes via the WAL lock
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        # IMMEDIATE takes the write lock up front so lease() never hands one job to two workers
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def _bump(conn, name: str, amount: int = 1):
+        conn.execute(
+            "INSERT INTO counters (name, value) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+            (name, amount),
+        )
+
+    def enqueue(self, repo_name: str, pr_number: int, head_sha: Optional[str], delivery_id: Optional[str],
+                max_depth: int, retry_after: int, bypass_cache: bool = False) -> Job:
+        with self._transaction() as conn:
+            # Rejections are returned rather than raised so their counters are committed
+            result = self._enqueue_locked(
+                conn, repo_name, pr_number, head_sha, delivery_id, max_depth, retry_after, bypass_cache
+            )
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def _enqueue_locked(self, conn, repo_name, pr_number, head_sha, delivery_id, max_depth, retry_after, bypass_cache):
+        now = time.time()
+        if delivery_id:
+            if conn.execute("SELECT 1 FROM deliveries WHERE delivery_id = ?", (delivery_id,)).fetchone():
+                self._bump(conn, "duplicates")
+                return DuplicateDeliveryError(f"Delivery {delivery_id} was already accepted.")
+            conn.execute("INSERT INTO deliveries (delivery_id, seen_at) VALUES (?, ?)", (delivery_id, now))
+            conn.execute(
+                "DELETE FROM deliveries WHERE delivery_id NOT IN "
+                "(SELECT delivery_id FROM deliveries ORDER BY seen_at DESC LIMIT ?)",
+                (self.dedup_size,),
+            )
+
+        # A newer push makes any in-flight review of an older SHA stale
+        if head_sha:
+            conn.execute(
+                "UPDATE jobs SET cancel_requested = 1 WHERE repo_name = ? AND pr_number = ? "
+                "AND status = 'running' AND (head_sha IS NULL OR head_sha != ?)",
+                (repo_name, pr_number, head_sha),
+            )
+
+        row = conn.execute(
+            "SELECT * FROM jobs WHERE repo_name = ? AND pr_number = ? AND status = 'queued' LIMIT 1",
+            (repo_name, pr_number),
+        ).fetchone()
+        if row is not None:
+            job = _job_from_record(dict(row))
+            if bypass_cache and not job.bypass_cache:
+                job.bypass_cache = True
+                conn.execute("UPDATE jobs SET bypass_cache = 1 WHERE id = ?", (job.id,))
+            if head_sha and job.head_sha != head_sha:
+                if job.head_sha:
+                    job.superseded_shas.append(job.head_sha)
+                job.head_sha = head_sha
+                job.delivery_id = delivery_id
+                conn.execute(
+                    "UPDATE jobs SET head_sha = ?, delivery_id = ?, superseded_shas = ? WHERE id = ?",
+                    (head_sha, delivery_id, json.dumps(job.superseded_shas), job.id),
+                )
+                self._bump(conn, "coalesced")
+            return job
+
+        pending = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+        if pending >= max_depth:
+            self._bump(conn, "rejected")
+            return QueueFullError(f"Job queue is full ({pending}/{max_depth} pending).", retry_after=retry_after)
+
+        job = Job(
+            repo_name=repo_name, pr_number=pr_number, head_sha=head_sha, delivery_id=delivery_id,
+            bypass_cache=bypass_cache
+        )
+        if conn.execute(
+            "SELECT 1 FROM reviewed WHERE repo_name = ? AND pr_number = ?", (repo_name, pr_number)
+        ).fetchone():
+            job.priority = "low"
+        conn.execute(
+            "INSERT INTO jobs (id, repo_name, pr_number, head_sha, delivery_id, priority, bypass_cache, status, enqueued_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, 'queued', ?)",
+            (job.id, repo_name, pr_number, head_sha, delivery_id, job.priority, int(bypass_cache), job.enqueued_at),
+        )
+        return job
+
+    def lease(self, owner: str, visibility_timeout: float, max_per_repo: int, max_attempts: int,
+              max_running: Optional[int] = None) -> Optional[Job]:
+        now = time.time()
+        with self._transaction() as conn:
+            # Jobs whose worker vanished go back to the queue, or fail once they have used up their attempts
+            for row in conn.execute(
+                "SELECT * FROM jobs WHERE status = 'running' AND lease_expires_at < ?", (now,)
+            ).fetchall():
+                pending = conn.execute(
+                    "SELECT * FROM jobs WHERE repo_name = ? AND pr_number = ? AND status = 'queued' LIMIT 1",
+                    (row["repo_name"], row["pr_number"]),
+                ).fetchone()
+                if row["attempts"] >= max_attempts:
+                    conn.execute(
+                        "UPDATE jobs SET status = 'failed', finished_at = ?, lease_owner = NULL, "
+                        "error = 'Lease expired after the maximum number of attempts.' WHERE id = ?",
+                        (now, row["id"]),
+                    )
+                    self._bump(conn, "failed")
+                elif pending is not None:
+                    # A push coalesced in while the job ran: one pending job per PR, as enqueue() keeps it
+                    merged = dict(pending)
+                    error = _merge_expired(dict(row), merged)
+                    conn.execute(
+                        "UPDATE jobs SET head_sha = ?, superseded_shas = ?, bypass_cache = ? WHERE id = ?",
+                        (merged["head_sha"], json.dumps(merged["superseded_shas"]), int(merged["bypass_cache"]),
+                         merged["id"]),
+                    )
+                    conn.execute(
+                        "UPDATE jobs SET status = 'cancelled', finished_at = ?, lease_owner = NULL, "
+                        "lease_expires_at = NULL, error = ? WHERE id = ?",
+                        (now, error, row["id"]),
+                    )
+                    self._bump(conn, "coalesced")
+                    self._bump(conn, "cancelled")
+                else:
+                    conn.execute(
+                        "UPDATE jobs SET status = 'queued', lease_owner = NULL, lease_expires_at = NULL WHERE id = ?",
+                        (row["id"],),
+                    )
+
+            running = conn.execute(
+                "SELECT repo_name, pr_number FROM jobs WHERE status = 'running'"
+            ).fetchall()
+            # MAX_WORKERS caps running jobs across every process sharing the store
+            if max_running is not None and len(running) >= max_running:
+                return None
+            running_keys = {(r["repo_name"], r["pr_number"]) for r in running}
+            per_repo: Dict[str, int] = {}
+            for r in running:
+                per_repo[r["repo_name"]] = per_repo.get(r["repo_name"], 0) + 1
+
+            # First reviews go ahead of re-reviews; FIFO within each priority
+            for row in conn.execute(
+                "SELECT * FROM jobs WHERE status = 'queued' "
+                "ORDER BY CASE priority WHEN 'normal' THEN 0 ELSE 1 END, enqueued_at"
+            ).fetchall():
+                # Never run two reviews of the same PR side by side
+                if (row["repo_name"], row["pr_number"]) in running_keys:
+                    continue
+                if per_repo.get(row["repo_name"], 0) >= max_per_repo:
+                    continue
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', started_at = ?, lease_owner = ?, lease_expires_at = ?, "
+                    "attempts = attempts + 1, cancel_requested = 0 WHERE id = ?",
+                    (now, owner, now + visibility_timeout, row["id"]),
+                )
+                record = dict(row)
+                record.update(status="running", started_at=now, attempts=row["attempts"] + 1)
+                return _job_from_record(record)
+        return None
+
+    def renew(self, job_id: str, owner: str, visibility_timeout: float) -> Optional[bool]:
+        """Extend the lease; returns None if it was lost, else whether cancellation was requested."""
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT cancel_requested FROM jobs WHERE id = ? AND status = 'running' AND lease_owner = ?",
+                (job_id, owner),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE jobs SET lease_expires_at = ? WHERE id = ?", (time.time() + visibility_timeout, job_id))
+            return bool(row["cancel_requested"])
+
+    def finish(self, job: Job, owner: str) -> bool:
+        now = time.time()
+        with self._transaction() as conn:
+            updated = conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, error = ?, stats = ?, lease_owner = NULL, "
+                "lease_expires_at = NULL WHERE id = ? AND status = 'running' AND lease_owner = ?",
+                (job.status, job.finished_at or now, job.error, json.dumps(job.stats, default=str), job.id, owner),
+            ).rowcount
+            if not updated:
+                return False
+            self._bump(conn, {"succeeded": "completed"}.get(job.status, job.status))
+            if job.status == "succeeded":
+                conn.execute(
+                    "INSERT OR REPLACE INTO reviewed (repo_name, pr_number, head_sha, reviewed_at) VALUES (?, ?, ?, ?)",
+                    (job.repo_name, job.pr_number, job.head_sha, now),
+                )
+            conn.execute(
+                "DELETE FROM jobs WHERE status IN ('succeeded', 'failed', 'cancelled') AND finished_at < ?",
+                (now - self.retention_seconds,),
+            )
+            return True
+
+    def recent_durations(self, limit: int = 50) -> List[float]:
+        conn = self._connection()
+        rows = conn.execute(
+            "SELECT finished_at - started_at FROM jobs WHERE finished_at IS NOT NULL AND started_at IS NOT NULL "
+            "ORDER BY finished_at DESC LIMIT ?",
+            (limit,),
+        ).fetchall()
+        return [r[0] for r in rows]
+
+    def snapshot(self, history_size: int) -> Dict[str, Any]:
+        conn = self._connection()
+        counters = {r["name"]: r["value"] for r in conn.execute("SELECT name, value FROM counters")}
+        running = [_job_from_record(dict(r)) for r in conn.execute(
+            "SELECT * FROM jobs WHERE status = 'running' ORDER BY started_at")]
+        pending = [_job_from_record(dict(r)) for r in conn.execute(
+            "SELECT * FROM jobs WHERE status = 'queued' ORDER BY enqueued_at")]
+        recent = [_job_from_record(dict(r)) for r in conn.execute(
+            "SELECT * FROM jobs WHERE status IN ('succeeded', 'failed', 'cancelled') "
+            "ORDER BY finished_at DESC LIMIT ?", (history_size,))]
+        return {"counters": counters, "running": running, "pending": pending, "recent": recent}
+
+
+class RedisQueueBackend:
+    """
+    Job store in Redis (REDIS_URL), for workers spread over several machines.
+
+    Every operation runs under a short Redis lock, which keeps the coalescing
+    and per-repository rules identical to the SQLite backend; webhook and
+    lease rates are far below what that serialisation can sustain.
+    Requires the `redis` package.
+    """
+
+    def __init__(self, url: Optional[str] = None, dedup_size: int = 1000, history_size: int = 50):
+        try:
+            import redis
+        except ImportError as e:
+            raise ImportError("QUEUE_BACKEND=redis requires the 'redis' package (pip install redis).") from e
+        self.url = url or os.environ.get("REDIS_URL", "redis://localhost:6379/0")
+        self.prefix = os.environ.get("QUEUE_REDIS_PREFIX", "ai-tech-lead:queue:")
+        self.dedup_size = dedup_size
+        self.history_size = history_size
+        self._redis = redis.Redis.from_url(self.url, decode_responses=True)
+
+    def describe(self) -> str:
+        return f"redis:{self.url}"
+
+    def _key(self, name: str) -> str:
+        return self.prefix + name
+
+    @contextmanager
+    def _locked(self):
+        with self._redis.lock(self._key("lock"), timeout=30, blocking_timeout=30):
+            yield self._redis
+
+    def _load(self, r, job_id: str) -> Optional[Dict[str, Any]]:
+        raw = r.hget(self._key("jobs"), job_id)
+        return json.loads(raw) if raw else None
+
+    def _save(self, r, record: Dict[str, Any]):
+        r.hset(self._key("jobs"), record["id"], json.dumps(record, default=str))
+
+    @staticmethod
+    def _pr_key(repo_name: str, pr_number: int) -> str:
+        return f"{repo_name}#{pr_number}"
+
+    def _bump(self, r, name: str):
+        r.hincrby(self._key("counters"), name, 1)
+
+    def enqueue(self, repo_name: str, pr_number: int, head_sha: Optional[str], delivery_id: Optional[str],
+                max_depth: int, retry_after: int, bypass_cache: bool = False) -> Job:
+        now = time.time()
+        pr_key = self._pr_key(repo_name, pr_number)
+        with self._locked() as r:
+            if delivery_id:
+                if r.zscore(self._key("deliveries"), delivery_id) is not None:
+                    self._bump(r, "duplicates")
+                    raise DuplicateDeliveryError(f"Delivery {delivery_id} was already accepted.")
+                r.zadd(self._key("deliveries"), {delivery_id: now})
+                r.zremrangebyrank(self._key("deliveries"), 0, -self.dedup_size - 1)
+
+            running_id = r.hget(self._key("running_keys"), pr_key)
+            if running_id and head_sha:
+                record = self._load(r, running_id)
+                if record and record.get("head_sha") != head_sha:
+                    record["cancel_requested"] = True
+                    self._save(r, record)
+
+            pending_id = r.hget(self._key("pending_keys"), pr_key)
+            record = self._load(r, pending_id) if pending_id else None
+            if pending_id and record is None:
+                # The job record was trimmed or lost; forget the dangling index entries
+                r.hdel(self._key("pending_keys"), pr_key)
+                r.zrem(self._key("pending"), pending_id)
+            if record is not None:
+                if bypass_cache and not record.get("bypass_cache"):
+                    record["bypass_cache"] = True
+                    self._save(r, record)
+                if head_sha and record["head_sha"] != head_sha:
+                    if record["head_sha"]:
+                        record["superseded_shas"].append(record["head_sha"])
+                    record["head_sha"] = head_sha
+                    record["delivery_id"] = delivery_id
+                    self._save(r, record)
+                    self._bump(r, "coalesced")
+                return _job_from_record(record)
+
+            pending = r.zcard(self._key("pending"))
+            if pending >= max_depth:
+                self._bump(r, "rejected")
+                raise QueueFullError(f"Job queue is full ({pending}/{max_depth} pending).", retry_after=retry_after)
+
+            job = Job(
+                repo_name=repo_name, pr_number=pr_number, head_sha=head_sha, delivery_id=delivery_id,
+                bypass_cache=bypass_cache
+            )
+            if r.hexists(self._key("reviewed"), pr_key):
+                job.priority = "low"
+            self._save(r, _job_record(job))
+            r.hset(self._key("pending_keys"), pr_key, job.id)
+            # Score orders first reviews ahead of re-reviews, then by arrival
+            r.zadd(self._key("pending"), {job.id: PRIORITY_RANK[job.priority] * 1e11 + job.enqueued_at})
+            return job
+
+    def _finish_locked(self, r, record: Dict[str, Any]):
+        r.zrem(self._key("running"), record["id"])
+        pr_key = self._pr_key(record["repo_name"], record["pr_number"])
+        if r.hget(self._key("running_keys"), pr_key) == record["id"]:
+            r.hdel(self._key("running_keys"), pr_key)
+        record["lease_owner"] = None
+        self._save(r, record)
+        r.lpush(self._key("history"), record["id"])
+        for stale in r.lrange(self._key("history"), self.history_size, -1):
+            r.hdel(self._key("jobs"), stale)
+        r.ltrim(self._key("history"), 0, self.history_size - 1)
+
+    def lease(self, owner: str, visibility_timeout: float, max_per_repo: int, max_attempts: int,
+              max_running: Optional[int] = None) -> Optional[Job]:
+        now = time.time()
+        with self._locked() as r:
+            for job_id in r.zrangebyscore(self._key("running"), "-inf", now):
+                record = self._load(r, job_id)
+                if record is None:
+                    r.zrem(self._key("running"), job_id)
+                    continue
+                pr_key = self._pr_key(record["repo_name"], record["pr_number"])
+                pending_id = r.hget(self._key("pending_keys"), pr_key)
+                pending = self._load(r, pending_id) if pending_id else None
+                if record.get("attempts", 0) >= max_attempts:
+                    record.update(status="failed", finished_at=now,
+                                  error="Lease expired after the maximum number of attempts.")
+                    self._finish_locked(r, record)
+                    self._bump(r, "failed")
+                elif pending is not None:
+                    # A push coalesced in while the job ran: one pending job per PR, as enqueue() keeps it
+                    error = _merge_expired(record, pending)
+                    self._save(r, pending)
+                    record.update(status="cancelled", finished_at=now, error=error)
+                    self._finish_locked(r, record)
+                    self._bump(r, "coalesced")
+                    self._bump(r, "cancelled")
+                else:
+                    record.update(status="queued", lease_owner=None)
+                    self._save(r, record)
+                    r.zrem(self._key("running"), job_id)
+                    r.hdel(self._key("running_keys"), pr_key)
+                    r.hset(self._key("pending_keys"), pr_key, job_id)
+                    r.zadd(self._key("pending"), {job_id: PRIORITY_RANK.get(record.get("priority"), 0) * 1e11 + record["enqueued_at"]})
+
+            if max_running is not None and r.zcard(self._key("running")) >= max_running:
+                return None
+            per_repo: Dict[str, int] = {}
+            running_keys = set(r.hkeys(self._key("running_keys")))
+            for pr_key in running_keys:
+                repo = pr_key.rsplit("#", 1)[0]
+                per_repo[repo] = per_repo.get(repo, 0) + 1
+
+            for job_id in r.zrange(self._key("pending"), 0, -1):
+                record = self._load(r, job_id)
+                if record is None:
+                    r.zrem(self._key("pending"), job_id)
+                    continue
+                pr_key = self._pr_key(record["repo_name"], record["pr_number"])
+                if pr_key in running_keys or per_repo.get(record["repo_name"], 0) >= max_per_repo:
+                    continue
+                record.update(status="running", started_at=now, lease_owner=owner,
+                              attempts=record.get("attempts", 0) + 1, cancel_requested=False)
+                self._save(r, record)
+                r.zrem(self._key("pending"), job_id)
+                r.hdel(self._key("pending_keys"), pr_key)
+                r.hset(self._key("running_keys"), pr_key, job_id)
+                r.zadd(self._key("running"), {job_id: now + visibility_timeout})
+                return _job_from_record(record)
+        return None
+
+    def renew(self, job_id: str, owner: str, visibility_timeout: float) -> Optional[bool]:
+        with self._locked() as r:
+            record = self._load(r, job_id)
+            if record is None or record.get("status") != "running" or record.get("lease_owner") != owner:
+                return None
+            r.zadd(self._key("running"), {job_id: time.time() + visibility_timeout})
+            return bool(record.get("cancel_requested"))
+
+    def finish(self, job: Job, owner: str) -> bool:
+        now = time.time()
+        with self._locked() as r:
+            record = self._load(r, job.id)
+            if record is None or record.get("status") != "running" or record.get("lease_owner") != owner:
+                return False
+            record.update(_job_record(job))
+            record["finished_at"] = job.finished_at or now
+            self._finish_locked(r, record)
+            self._bump(r, {"succeeded": "completed"}.get(job.status, job.status))
+            if job.status == "succeeded":
+                r.hset(self._key("reviewed"), self._pr_key(job.repo_name, job.pr_number), job.head_sha or "")
+            return True
+
+    def recent_durations(self, limit: int = 50) -> List[float]:
+        durations = []
+        for job_id in self._redis.lrange(self._key("history"), 0, limit - 1):
+            record = self._load(self._redis, job_id)
+            if record and record.get("started_at") and record.get("finished_at"):
+                durations.append(record["finished_at"] - record["started_at"])
+        return durations
+
+    def snapshot(self, history_size: int) -> Dict[str, Any]:
+        r = self._redis
+
+        def load_all(ids):
+            return [_job_from_record(rec) for rec in (self._load(r, i) for i in ids) if rec]
+
+        counters = {name: int(value) for name, value in r.hgetall(self._key("counters")).items()}
+        return {
+            "counters": counters,
+            "running": load_all(r.zrange(self._key("running"), 0, -1)),
+            "pending": load_all(r.zrange(self._key("pending"), 0, -1)),
+            "recent": load_all(r.lrange(self._key("history"), 0, history_size - 1)),
+        }
+
+
+def create_backend(name: str, dedup_size: int, history_size: int):
+    """Instantiate the backend selected by QUEUE_BACKEND."""
+    if name == "sqlite":
+        return SQLiteQueueBackend(dedup_size=dedup_size)
+    if name == "redis":
+        return RedisQueueBackend(dedup_size=dedup_size, history_size=history_size)
+    raise ValueError(f"Unknown QUEUE_BACKEND {name!r}; expected 'sqlite', 'redis' or 'memory'.")
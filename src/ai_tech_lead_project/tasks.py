@@ -1,62 +1,147 @@
 from crewai import Task
 from textwrap import dedent
-from .tools.github_tools import github_tool
+import json
+from .tools.github_tools import get_github_tool
+from .tools.review_publisher import publisher_enabled
+from .utils.review_cache import TEST_SECTION_MARKER
+
+
+def _prefetched_diff_section(diff, elided_files):
+    """Prompt section carrying a diff that was fetched before the crew started."""
+    section = dedent("""
+
+        **Pull Request Diff (already fetched for you):**
+        Do NOT call the GitHub tool to fetch the diff again; it is included below.
+    """)
+    if elided_files:
+        section += (
+            "The patches for these files were elided for size; use the `get_pr_diff` command with the "
+            f"GitHub tool only if you need them: {', '.join(elided_files)}\n"
+        )
+    return section + "\n```diff\n" + diff + "\n```\n"
+
+
+def _prior_findings_section(prior_findings):
+    """Findings from earlier reviews of near-identical hunks (see utils.hunk_index), as hints."""
+    lines = [
+        f"- [{item['category']}] {json.dumps(item['finding'])}"
+        for item in prior_findings
+    ]
+    return dedent("""
+
+        **Findings from earlier reviews of near-identical changes:**
+        The changes below closely match code that was already reviewed in another pull request.
+        Keep each of these findings if it still applies to this diff, drop it if it does not, and
+        spend your attention on what differs.
+    """) + "\n".join(lines) + "\n"
+
+
+def review_pr_description(repo_name, pr_number, diff=None, elided_files=None, prior_findings=None):
+    """Prompt of the review task; also sent as-is by the batch backfill."""
+    if diff is None:
+        fetch_instructions = dedent("""
+            You MUST use the 'GitHub Tool' to fetch the code diff before you begin your analysis.
+        """)
+        first_step = "1. Use the `get_pr_diff` command with the GitHub tool to get the code changes."
+    else:
+        fetch_instructions = _prefetched_diff_section(diff, elided_files)
+        first_step = "1. Read the code changes from the diff provided below."
+
+    return dedent(f"""
+            Analyze the code changes in the pull request #{pr_number} from the repository '{repo_name}'.
+            
+            **Follow these steps:**
+            {first_step}
+            2. Perform a thorough, line-by-line code review on the diff.
+            3. Analyze the code against these criteria: Potential Bugs, Style & Formatting, Optimization, and Documentation.
+            4. Consolidate all findings into a single, well-formed JSON object.
+               Every finding MUST include the `file` path it refers to, exactly as shown in the diff.
+
+            **Example of Desired JSON Output:**
+            ```json
+            {{
+              "style_issues": [
+                {{"file": "src/app.py", "line": 5, "description": "Variable 'x' is too generic. Consider renaming to 'user_count'."}}
+              ],
+              "potential_bugs": [],
+              "documentation_issues": [],
+              "optimization_recommendations": []
+            }}
+            ```
+            Your final answer MUST be only the JSON object.
+        """) + (_prior_findings_section(prior_findings) if prior_findings else "") + fetch_instructions
+
+
+def test_pr_description(repo_name, pr_number, diff=None, elided_files=None):
+    """Prompt of the test-generation task; also sent as-is by the batch backfill."""
+    if diff is None:
+        fetch_instructions = ""
+        first_step = "1. Use the `get_pr_diff` command with the GitHub tool to get the code changes."
+    else:
+        fetch_instructions = _prefetched_diff_section(diff, elided_files)
+        first_step = "1. Read the code changes from the diff provided below."
+
+    return dedent(f"""
+            Analyze the code changes in Pull Request #{pr_number} from repository '{repo_name}'.
+            Your task is to generate a comprehensive suite of unit tests.
+            Assume the code is Python and the testing framework is pytest.
+
+            **Follow these steps:**
+            {first_step}
+            2. Identify the new or modified functions in the diff.
+            3. For each function, write a valid, executable pytest test suite that covers the happy path, edge cases, and error conditions.
+            4. Group the tests by source file. Start each group with the marker line
+               `{TEST_SECTION_MARKER.format(filename='<path as shown in the diff>')}` and make each group self-contained (its own imports).
+
+            Your final answer MUST be a single string containing the raw Python code for the tests.
+            If you cannot generate tests (e.g., the code is not Python or has severe syntax errors),
+            your output should be the single line: "Tests SKIPPED due to non-testable code."
+        """) + fetch_instructions
+
 
 class AITechLeadTasks():
-    def review_pr_task(self, agent, repo_name, pr_number):
+    def review_pr_task(self, agent, repo_name, pr_number, diff=None, elided_files=None, async_execution=True,
+                       prior_findings=None):
         return Task(
-            description=dedent(f"""
-                Analyze the code changes in the pull request #{pr_number} from the repository '{repo_name}'.
-                You MUST use the 'GitHub Tool' to fetch the code diff before you begin your analysis.
-                
-                **Follow these steps:**
-                1. Use the `get_pr_diff` command with the GitHub tool to get the code changes.
-                2. Perform a thorough, line-by-line code review on the diff.
-                3. Analyze the code against these criteria: Potential Bugs, Style & Formatting, Optimization, and Documentation.
-                4. Consolidate all findings into a single, well-formed JSON object.
-
-                **Example of Desired JSON Output:**
-                ```json
-                {{
-                  "style_issues": [
-                    {{"line": 5, "description": "Variable 'x' is too generic. Consider renaming to 'user_count'."}}
-                  ],
-                  "potential_bugs":,
-                  "documentation_issues":,
-                  "optimization_recommendations":
-                }}
-                ```
-                Your final answer MUST be only the JSON object.
-            """),
+            description=review_pr_description(repo_name, pr_number, diff, elided_files, prior_findings),
             expected_output="A single JSON object containing categorized code review feedback.",
             agent=agent,
-            tools=[github_tool],
-            async_execution=True
+            tools=[get_github_tool()],
+            async_execution=async_execution
         )
 
-    def test_pr_task(self, agent, repo_name, pr_number):
+    def test_pr_task(self, agent, repo_name, pr_number, diff=None, elided_files=None, async_execution=True):
         return Task(
-            description=dedent(f"""
-                Analyze the code changes in Pull Request #{pr_number} from repository '{repo_name}'.
-                Your task is to generate a comprehensive suite of unit tests.
-                Assume the code is Python and the testing framework is pytest.
-
-                **Follow these steps:**
-                1. Use the `get_pr_diff` command with the GitHub tool to get the code changes.
-                2. Identify the new or modified functions in the diff.
-                3. For each function, write a valid, executable pytest test suite that covers the happy path, edge cases, and error conditions.
-
-                Your final answer MUST be a single string containing the raw Python code for the tests.
-                If you cannot generate tests (e.g., the code is not Python or has severe syntax errors),
-                your output should be the single line: "Tests SKIPPED due to non-testable code."
-            """),
+            description=test_pr_description(repo_name, pr_number, diff, elided_files),
             expected_output="A string containing the raw Python code for a pytest test suite, or a skip message.",
             agent=agent,
-            tools=[github_tool],
-            async_execution=True
+            tools=[get_github_tool()],
+            async_execution=async_execution
         )
 
-    def report_task(self, agent, repo_name, pr_number, context):
+    def report_task(self, agent, repo_name, pr_number, context=None, review_output=None, test_output=None,
+                    verification=None):
+        results_section = ""
+        if review_output is not None or test_output is not None:
+            # Results assembled outside the crew (e.g. merged with cached per-file output)
+            results_section = (
+                "\n**Code Review Analysis (JSON):**\n```json\n" + (review_output or "{}") + "\n```\n"
+                "\n**Generated Unit Tests:**\n```python\n" + (test_output or "") + "\n```\n"
+            )
+        if verification:
+            results_section += "\n**Test Execution Results:**\n" + verification + "\n"
+        if publisher_enabled():
+            # Posting happens in code after the crew (ReviewPublisher); the report is the final answer
+            posting = "\nYour final answer MUST be only the Markdown report; it is posted to the pull request for you.\n"
+            expected_output = "The complete Markdown report."
+            tools = []
+        else:
+            posting = (
+                f"\nAfter generating the report, use the `post_pr_comment` command with the GitHub tool to post it\n"
+                f"on Pull Request #{pr_number} in repository '{repo_name}'.\n"
+            )
+            expected_output = "A confirmation message stating that the report has been successfully posted."
+            tools = [get_github_tool()]
         return Task(
             description=dedent(f"""
                 Synthesize the code review analysis and unit test results from the context into a single,
@@ -68,12 +153,11 @@ class AITechLeadTasks():
                 3.  Create a "Code Review" section with subheadings for each category of issue (e.g., ### Potential Bugs).
                 4.  Under each subheading, list the issues as bullet points.
                 5.  Create a "Unit Tests" section. If tests were generated, add `### Generated Pytest Suite` and place the test code inside a Python code block. If skipped, state the reason.
-
-                After generating the report, use the `post_pr_comment` command with the GitHub tool to post it
-                on Pull Request #{pr_number} in repository '{repo_name}'.
-            """),
-            expected_output="A confirmation message stating that the report has been successfully posted.",
+                    If test execution results are provided, add `### Test Results` listing each suite as passed,
+                    failed or collection error, and quote the relevant failure output for suites that did not pass.
+            """) + posting + results_section,
+            expected_output=expected_output,
             agent=agent,
             context=context,
-            tools=[github_tool]
+            tools=tools
         )
\ No newline at end of file
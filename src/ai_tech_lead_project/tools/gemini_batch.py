@@ -0,0 +1,125 @@
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+
+
+class GeminiBatchError(Exception):
+    """
+    A batch job could not be submitted, failed, or did not finish in time.
+
+    `retryable` is True when the job may still complete (network error, timeout
+    while polling) and False when it is gone for good.
+    """
+
+    def __init__(self, message: str, retryable: bool = False):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+def _response_text(response: Dict[str, Any]) -> str:
+    candidates = response.get("candidates") or []
+    if not candidates:
+        return ""
+    parts = (candidates[0].get("content") or {}).get("parts") or []
+    return "".join(part.get("text", "") for part in parts)
+
+
+class GeminiBatchClient:
+    """
+    Minimal client for the Gemini Batch API (`models/{model}:batchGenerateContent`).
+
+    A batch carries many independent prompts as inline requests, each tagged with
+    a key; it runs asynchronously at a lower price and higher throughput than
+    one generateContent call per prompt, which suits backfills where latency per
+    PR does not matter. GEMINI_API_URL overrides the endpoint.
+    """
+
+    def __init__(self, api_key: str, base_url: Optional[str] = None):
+        self.base_url = (
+            base_url or os.environ.get("GEMINI_API_URL", "https://generativelanguage.googleapis.com/v1beta")
+        ).rstrip("/")
+        self.poll_interval = float(os.environ.get("GEMINI_BATCH_POLL_INTERVAL", "30"))
+        self.timeout = float(os.environ.get("GEMINI_BATCH_TIMEOUT", str(24 * 3600)))
+        self._session = requests.Session()
+        self._session.headers.update({"x-goog-api-key": api_key, "Content-Type": "application/json"})
+
+    @staticmethod
+    def _model_path(model: str) -> str:
+        core = model.split("/", 1)[1] if model.startswith(("models/", "gemini/")) else model
+        return f"models/{core}"
+
+    def _request(self, method: str, path: str, **kwargs) -> Dict[str, Any]:
+        try:
+            response = self._session.request(method, f"{self.base_url}/{path}", timeout=60, **kwargs)
+        except requests.RequestException as e:
+            raise GeminiBatchError(f"{method} {path} failed: {e}", retryable=True)
+        if response.status_code >= 400:
+            raise GeminiBatchError(
+                f"{method} {path} returned {response.status_code}: {response.text[:500]}",
+                retryable=response.status_code == 429 or response.status_code >= 500,
+            )
+        return response.json()
+
+    def submit(self, model: str, prompts: List[Tuple[str, str]], display_name: str = "ai-tech-lead") -> str:
+        """Submit [(key, prompt)] as one batch job; returns the batch name (e.g. `batches/123`)."""
+        payload = {
+            "batch": {
+                "display_name": display_name,
+                "input_config": {
+                    "requests": {
+                        "requests": [
+                            {
+                                "request": {"contents": [{"role": "user", "parts": [{"text": prompt}]}]},
+                                "metadata": {"key": key},
+                            }
+                            for key, prompt in prompts
+                        ]
+                    }
+                },
+            }
+        }
+        operation = self._request("POST", f"{self._model_path(model)}:batchGenerateContent", json=payload)
+        name = operation.get("name") or (operation.get("metadata") or {}).get("name")
+        if not name:
+            raise GeminiBatchError(f"batchGenerateContent returned no batch name: {operation}")
+        return name
+
+    @staticmethod
+    def _state(batch: Dict[str, Any]) -> str:
+        return (batch.get("metadata") or {}).get("state") or batch.get("state") or ""
+
+    def wait(self, name: str) -> Dict[str, Any]:
+        """
+        Poll a batch job until it finishes; returns {key: text or GeminiBatchError}.
+
+        Raises GeminiBatchError if the whole job failed, was cancelled or expired,
+        or is still running after GEMINI_BATCH_TIMEOUT seconds.
+        """
+        deadline = time.time() + self.timeout
+        while True:
+            batch = self._request("GET", name)
+            state = self._state(batch)
+            if batch.get("done") or state in ("BATCH_STATE_SUCCEEDED", "JOB_STATE_SUCCEEDED"):
+                break
+            if state in ("BATCH_STATE_FAILED", "BATCH_STATE_CANCELLED", "BATCH_STATE_EXPIRED"):
+                raise GeminiBatchError(f"Batch {name} ended in {state}: {batch.get('error')}")
+            if time.time() >= deadline:
+                raise GeminiBatchError(f"Batch {name} still {state or 'pending'} after {self.timeout:.0f}s", retryable=True)
+            time.sleep(self.poll_interval)
+
+        if batch.get("error"):
+            raise GeminiBatchError(f"Batch {name} failed: {batch['error']}")
+        output = batch.get("response") or (batch.get("metadata") or {}).get("output") or {}
+        inlined = (output.get("inlinedResponses") or {}).get("inlinedResponses") or []
+        results: Dict[str, Any] = {}
+        for item in inlined:
+            key = (item.get("metadata") or {}).get("key")
+            if key is None:
+                continue
+            if item.get("error"):
+                results[key] = GeminiBatchError(str(item["error"]))
+            else:
+                results[key] = _response_text(item.get("response") or {})
+        return results
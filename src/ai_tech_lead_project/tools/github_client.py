@@ -0,0 +1,305 @@
+import base64
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from github import GithubException
+
+from .github_scheduler import PRIORITY_NORMAL, RateLimitScheduler, github_scheduler
+
+# GitHub returns at most this many files from the compare endpoint, however it is paged
+COMPARE_MAX_FILES = 300
+
+
+class GithubClient:
+    """
+    Thin, thread-safe GitHub REST client used by GithubTools.
+
+    - One pooled `requests.Session` (GITHUB_POOL_SIZE connections) is shared by
+      all worker threads instead of a new connection per call.
+    - Repo and PR metadata is cached for GITHUB_METADATA_TTL seconds, so the
+      get_repo/get_pull pair that precedes every tool command is usually free.
+      get_pull(head_sha=...) revalidates when the cached head is not the expected one.
+    - GETs carry If-None-Match with the last ETag seen for the URL; a 304 reuses
+      the cached body and does not count against the rate limit. Stored bodies are
+      bounded by GITHUB_ETAG_CACHE_SIZE entries and GITHUB_ETAG_CACHE_BYTES; diffs
+      and file contents are never stored here (DiffCache keeps what is worth keeping).
+    - Every request passes through the shared RateLimitScheduler, which paces
+      requests against X-RateLimit-Remaining and retries once a rate-limited
+      response's window has passed.
+    GITHUB_API_URL points the client at GitHub Enterprise or a local fake server.
+    """
+
+    def __init__(self, token: str, base_url: Optional[str] = None, scheduler: Optional[RateLimitScheduler] = None):
+        self.base_url = (base_url or os.environ.get("GITHUB_API_URL", "https://api.github.com")).rstrip("/")
+        self.timeout = float(os.environ.get("GITHUB_REQUEST_TIMEOUT", "30"))
+        self.metadata_ttl = float(os.environ.get("GITHUB_METADATA_TTL", "30"))
+        self.etag_cache_size = int(os.environ.get("GITHUB_ETAG_CACHE_SIZE", "2000"))
+        self.etag_cache_bytes = int(os.environ.get("GITHUB_ETAG_CACHE_BYTES", str(32 * 1024 * 1024)))
+        pool_size = int(os.environ.get("GITHUB_POOL_SIZE", "10"))
+        self.rate_limit_retries = int(os.environ.get("GITHUB_RATE_LIMIT_RETRIES", "2"))
+        self.scheduler = scheduler or github_scheduler
+
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+        self._session.headers.update({
+            "Authorization": f"Bearer {token}",
+            "Accept": "application/vnd.github+json",
+            "X-GitHub-Api-Version": "2022-11-28",
+            "User-Agent": "ai-tech-lead",
+        })
+
+        self._lock = threading.Lock()
+        # url -> (etag, body, size in bytes)
+        self._etags: OrderedDict = OrderedDict()
+        self._etag_bytes = 0
+        # url -> (expires_at, body)
+        self._ttl_cache: Dict[str, Any] = {}
+
+        self.requests_sent = 0
+        self.not_modified = 0
+        self.ttl_hits = 0
+
+    # --- Low-level request handling ---
+
+    def _url(self, path: str) -> str:
+        return path if path.startswith("http") else f"{self.base_url}{path}"
+
+    def _raise_for_status(self, response: requests.Response):
+        if response.status_code < 400:
+            return
+        try:
+            data = response.json()
+        except ValueError:
+            data = {"message": response.text}
+        raise GithubException(response.status_code, data, dict(response.headers))
+
+    def _send(self, method: str, url: str, priority: str = PRIORITY_NORMAL, **kwargs) -> requests.Response:
+        attempt = 0
+        while True:
+            try:
+                self.scheduler.acquire(priority)
+            except TimeoutError as e:
+                raise GithubException(429, {"message": str(e)}, None)
+            with self._lock:
+                self.requests_sent += 1
+            try:
+                response = self._session.request(method, url, timeout=self.timeout, **kwargs)
+            except requests.RequestException as e:
+                raise GithubException(0, {"message": str(e)}, None)
+            rate_limited = self.scheduler.observe(response.status_code, response.headers)
+            if not rate_limited or attempt >= self.rate_limit_retries:
+                return response
+            attempt += 1
+            print(f"GitHub rate limit hit for {method} {url}; waiting for the scheduler before retry {attempt}.")
+
+    def get(
+        self,
+        path: str,
+        ttl: Optional[float] = None,
+        params: Optional[Dict[str, Any]] = None,
+        priority: str = PRIORITY_NORMAL,
+        fresh: bool = False,
+    ) -> Any:
+        """
+        GET with optional short-TTL caching and ETag revalidation.
+
+        `fresh` skips the TTL tier; an unchanged resource still costs only a 304.
+        """
+        url = self._url(path)
+        cache_key = url if not params else f"{url}?{sorted(params.items())}"
+        now = time.time()
+        with self._lock:
+            cached = self._ttl_cache.get(cache_key)
+            if not fresh and cached is not None and cached[0] > now:
+                self.ttl_hits += 1
+                return cached[1]
+            etag_entry = self._etags.get(cache_key)
+
+        headers = {"If-None-Match": etag_entry[0]} if etag_entry else {}
+        response = self._send("GET", url, priority=priority, params=params, headers=headers)
+        if response.status_code == 304 and etag_entry:
+            body = etag_entry[1]
+            with self._lock:
+                self.not_modified += 1
+                self._etags.move_to_end(cache_key)
+        else:
+            self._raise_for_status(response)
+            body = response.json()
+            etag = response.headers.get("ETag")
+            if etag:
+                self._remember_etag(cache_key, etag, body, len(response.content))
+
+        if ttl:
+            with self._lock:
+                self._ttl_cache[cache_key] = (time.time() + ttl, body)
+                # Drop expired entries opportunistically to keep the map small
+                if len(self._ttl_cache) > self.etag_cache_size:
+                    expired = [k for k, (expires_at, _) in self._ttl_cache.items() if expires_at <= now]
+                    for k in expired:
+                        del self._ttl_cache[k]
+        return body
+
+    def _remember_etag(self, cache_key: str, etag: str, body: Any, size: int):
+        with self._lock:
+            previous = self._etags.pop(cache_key, None)
+            if previous is not None:
+                self._etag_bytes -= previous[2]
+            # One oversized body must not flush everything else
+            if size > self.etag_cache_bytes // 4:
+                return
+            self._etags[cache_key] = (etag, body, size)
+            self._etag_bytes += size
+            while len(self._etags) > self.etag_cache_size or self._etag_bytes > self.etag_cache_bytes:
+                _, (_, _, evicted) = self._etags.popitem(last=False)
+                self._etag_bytes -= evicted
+
+    def get_pages(self, path: str, params: Optional[Dict[str, Any]] = None, priority: str = PRIORITY_NORMAL,
+                  max_pages: Optional[int] = None) -> List[Any]:
+        """Uncached GET of every page of `path` (or the first `max_pages`), following the Link: rel="next" headers."""
+        url, pages = self._url(path), []
+        while url and (max_pages is None or len(pages) < max_pages):
+            response = self._send("GET", url, priority=priority, params=params)
+            self._raise_for_status(response)
+            pages.append(response.json())
+            url = response.links.get("next", {}).get("url")
+            # The next link already carries the query string
+            params = None
+        return pages
+
+    def post(self, path: str, payload: Dict[str, Any], priority: str = PRIORITY_NORMAL) -> Any:
+        response = self._send("POST", self._url(path), priority=priority, json=payload)
+        self._raise_for_status(response)
+        return response.json()
+
+    def patch(self, path: str, payload: Dict[str, Any], priority: str = PRIORITY_NORMAL) -> Any:
+        response = self._send("PATCH", self._url(path), priority=priority, json=payload)
+        self._raise_for_status(response)
+        return response.json()
+
+    # --- GitHub resources used by the tools ---
+
+    def get_authenticated_user(self, priority: str = PRIORITY_NORMAL) -> Dict[str, Any]:
+        """The user the token belongs to; it does not change while the process runs."""
+        return self.get("/user", ttl=3600, priority=priority)
+
+    def get_repo(self, repo_name: str, priority: str = PRIORITY_NORMAL) -> Dict[str, Any]:
+        return self.get(f"/repos/{repo_name}", ttl=self.metadata_ttl, priority=priority)
+
+    def get_pull(
+        self, repo_name: str, pr_number: int, priority: str = PRIORITY_NORMAL, head_sha: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        PR metadata, TTL-cached. With `head_sha` (e.g. the SHA a webhook announced), a cached
+        copy pointing at another head is revalidated, so a push within the TTL is not missed.
+        """
+        path = f"/repos/{repo_name}/pulls/{pr_number}"
+        pull = self.get(path, ttl=self.metadata_ttl, priority=priority)
+        if head_sha and pull.get("head", {}).get("sha") != head_sha:
+            pull = self.get(path, ttl=self.metadata_ttl, priority=priority, fresh=True)
+        return pull
+
+    def list_pulls(self, repo_name: str, state: str = "open", priority: str = PRIORITY_NORMAL) -> List[Dict[str, Any]]:
+        """All pull requests in `state` (open, closed or all), following pagination."""
+        pulls: List[Dict[str, Any]] = []
+        page = 1
+        while True:
+            batch = self.get(
+                f"/repos/{repo_name}/pulls", params={"state": state, "per_page": 100, "page": page}, priority=priority
+            )
+            pulls.extend(batch)
+            if len(batch) < 100:
+                return pulls
+            page += 1
+
+    def compare(self, repo_name: str, base_sha: str, head_sha: str, priority: str = PRIORITY_NORMAL) -> Dict[str, Any]:
+        """
+        Comparison of two SHAs. Only the first page is fetched: GitHub pages this endpoint by
+        commits and lists the changed files, capped at COMPARE_MAX_FILES, on the first page
+        alone; use list_pull_files() for larger diffs. Not cached here: the body can be
+        megabytes and DiffCache keeps the diff.
+        """
+        return self.get_pages(
+            f"/repos/{repo_name}/compare/{base_sha}...{head_sha}", params={"per_page": 100}, priority=priority,
+            max_pages=1
+        )[0]
+
+    def list_pull_files(self, repo_name: str, pr_number: int, priority: str = PRIORITY_NORMAL) -> List[Dict[str, Any]]:
+        """Every changed file of a PR (up to GitHub's 3000), for diffs too large for compare()."""
+        pages = self.get_pages(f"/repos/{repo_name}/pulls/{pr_number}/files", params={"per_page": 100}, priority=priority)
+        return [file for page in pages for file in page]
+
+    def get_file_text(self, repo_name: str, path: str, ref: str, priority: str = PRIORITY_NORMAL) -> Optional[str]:
+        """Contents of a text file at `ref`, or None if it does not exist."""
+        try:
+            data = self.get_pages(f"/repos/{repo_name}/contents/{path}", params={"ref": ref}, priority=priority)[0]
+        except GithubException as e:
+            if e.status == 404:
+                return None
+            raise
+        if data.get("encoding") == "base64":
+            return base64.b64decode(data.get("content", "")).decode("utf-8", errors="replace")
+        return data.get("content")
+
+    def download_tarball(self, repo_name: str, ref: str, dest_path: str, priority: str = PRIORITY_NORMAL) -> int:
+        """Stream the gzipped source archive of `ref` to `dest_path`. Returns the number of bytes written."""
+        response = self._send("GET", self._url(f"/repos/{repo_name}/tarball/{ref}"), priority=priority, stream=True)
+        try:
+            self._raise_for_status(response)
+            written = 0
+            with open(dest_path, "wb") as f:
+                for chunk in response.iter_content(chunk_size=65536):
+                    f.write(chunk)
+                    written += len(chunk)
+            return written
+        finally:
+            response.close()
+
+    def create_issue_comment(
+        self, repo_name: str, pr_number: int, body: str, priority: str = PRIORITY_NORMAL
+    ) -> Dict[str, Any]:
+        return self.post(f"/repos/{repo_name}/issues/{pr_number}/comments", {"body": body}, priority=priority)
+
+    def list_issue_comments(
+        self, repo_name: str, pr_number: int, priority: str = PRIORITY_NORMAL
+    ) -> List[Dict[str, Any]]:
+        """All conversation comments of a PR, oldest first, following pagination."""
+        comments: List[Dict[str, Any]] = []
+        page = 1
+        while True:
+            batch = self.get(
+                f"/repos/{repo_name}/issues/{pr_number}/comments",
+                params={"per_page": 100, "page": page}, priority=priority
+            )
+            comments.extend(batch)
+            if len(batch) < 100:
+                return comments
+            page += 1
+
+    def update_issue_comment(
+        self, repo_name: str, comment_id: int, body: str, priority: str = PRIORITY_NORMAL
+    ) -> Dict[str, Any]:
+        return self.patch(f"/repos/{repo_name}/issues/comments/{comment_id}", {"body": body}, priority=priority)
+
+    def create_review(
+        self, repo_name: str, pr_number: int, payload: Dict[str, Any], priority: str = PRIORITY_NORMAL
+    ) -> Dict[str, Any]:
+        """Submit a pull request review; `payload` carries event, body, commit_id and line `comments`."""
+        return self.post(f"/repos/{repo_name}/pulls/{pr_number}/reviews", payload, priority=priority)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "requests_sent": self.requests_sent,
+                "not_modified": self.not_modified,
+                "ttl_hits": self.ttl_hits,
+                "etag_entries": len(self._etags),
+                "etag_bytes": self._etag_bytes,
+                "rate_limit": self.scheduler.snapshot(),
+            }
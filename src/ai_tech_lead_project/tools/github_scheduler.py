@@ -0,0 +1,194 @@
+import heapq
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Mapping, Optional
+
+from ..utils.metrics import GITHUB_RATE_LIMIT_REMAINING, GITHUB_THROTTLED, SPAN_SECONDS
+
+PRIORITY_NORMAL = "normal"
+PRIORITY_LOW = "low"
+_PRIORITY_RANK = {PRIORITY_NORMAL: 0, PRIORITY_LOW: 1}
+
+
+class RateLimitScheduler:
+    """
+    Gatekeeper in front of every GitHub REST request.
+
+    The budget reported in X-RateLimit-Remaining/X-RateLimit-Reset is spread
+    over the time left until the reset with a token bucket (GITHUB_RATE_LIMIT_BURST
+    tokens deep), so concurrent crews slow down gradually instead of draining the
+    token and then failing. GITHUB_RATE_LIMIT_BUFFER requests are never spent;
+    low-priority requests (re-reviews of a PR that was already reviewed) also
+    leave GITHUB_LOW_PRIORITY_RESERVE requests for first reviews, and always
+    queue behind normal-priority requests that are waiting for a token.
+    """
+
+    def __init__(self, buffer: Optional[int] = None, burst: Optional[int] = None):
+        self.buffer = buffer if buffer is not None else int(os.environ.get("GITHUB_RATE_LIMIT_BUFFER", "100"))
+        self.burst = burst or int(os.environ.get("GITHUB_RATE_LIMIT_BURST", "10"))
+        self.low_priority_reserve = int(os.environ.get("GITHUB_LOW_PRIORITY_RESERVE", str(self.buffer)))
+        self.max_wait = float(os.environ.get("GITHUB_RATE_LIMIT_MAX_WAIT", "3600"))
+
+        self._cond = threading.Condition()
+        self._waiters: list = []
+        self._tickets = itertools.count()
+        self._tokens = float(self.burst)
+        self._last_refill = time.time()
+
+        self.limit: Optional[int] = None
+        self.remaining: Optional[int] = None
+        self.reset_at: Optional[float] = None
+        # Set by secondary rate limits (Retry-After) regardless of the primary budget
+        self.paused_until = 0.0
+
+        self._priorities: Dict[tuple, str] = {}
+        self.throttled = 0
+        self.throttled_seconds = 0.0
+
+    # --- Priority of the PR a request is made for ---
+
+    @contextmanager
+    def prioritize(self, repo_name: str, pr_number: int, priority: str):
+        """Mark GitHub requests for this PR with `priority` while the block runs."""
+        key = (repo_name, int(pr_number))
+        with self._cond:
+            self._priorities[key] = priority
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._priorities.pop(key, None)
+
+    def priority_for(self, repo_name: str, pr_number: int) -> str:
+        with self._cond:
+            return self._priorities.get((repo_name, int(pr_number)), PRIORITY_NORMAL)
+
+    # --- Token bucket ---
+
+    def _floor(self, priority: str) -> int:
+        return self.buffer + (self.low_priority_reserve if priority == PRIORITY_LOW else 0)
+
+    def _refill_locked(self, now: float):
+        elapsed = max(0.0, now - self._last_refill)
+        self._last_refill = now
+        if self.reset_at is not None and now >= self.reset_at:
+            # The window has rolled over; the next response reports the fresh budget
+            self.remaining = None
+            self.reset_at = None
+        if self.remaining is None:
+            self._tokens = float(self.burst)
+            return
+        rate = max(0, self.remaining - self.buffer) / max(1.0, self.reset_at - now)
+        self._tokens = min(float(self.burst), self._tokens + elapsed * rate)
+
+    def _wait_time_locked(self, now: float, priority: str) -> float:
+        if self.paused_until > now:
+            return self.paused_until - now
+        if self.remaining is None:
+            return 0.0
+        if self.remaining <= self._floor(priority):
+            return self.reset_at - now
+        if self._tokens >= 1:
+            return 0.0
+        rate = max(0, self.remaining - self.buffer) / max(1.0, self.reset_at - now)
+        return (1 - self._tokens) / rate if rate else self.reset_at - now
+
+    def acquire(self, priority: str = PRIORITY_NORMAL) -> float:
+        """
+        Block until a request may be sent; returns the seconds spent waiting.
+
+        Raises TimeoutError if the wait would exceed GITHUB_RATE_LIMIT_MAX_WAIT.
+        """
+        started_at = time.time()
+        with self._cond:
+            ticket = (_PRIORITY_RANK.get(priority, 0), next(self._tickets))
+            heapq.heappush(self._waiters, ticket)
+            try:
+                while True:
+                    now = time.time()
+                    self._refill_locked(now)
+                    wait = None
+                    if self._waiters[0] == ticket:
+                        wait = self._wait_time_locked(now, priority)
+                        if wait <= 0:
+                            self._tokens -= 1
+                            if self.remaining is not None:
+                                # Optimistic until the response reports the real value
+                                self.remaining -= 1
+                            break
+                        if now - started_at + wait > self.max_wait:
+                            raise TimeoutError(
+                                f"GitHub rate limit: {self.remaining} requests left, "
+                                f"next reset in {int(wait)}s exceeds GITHUB_RATE_LIMIT_MAX_WAIT."
+                            )
+                    # Re-check at least once a second so a reset or a new response can unblock us
+                    self._cond.wait(timeout=min(wait, 1.0) if wait else 1.0)
+            finally:
+                self._waiters.remove(ticket)
+                heapq.heapify(self._waiters)
+                self._cond.notify_all()
+
+        waited = time.time() - started_at
+        if waited > 0.001:
+            with self._cond:
+                self.throttled += 1
+                self.throttled_seconds += waited
+            GITHUB_THROTTLED.inc(priority=priority)
+            SPAN_SECONDS.observe(waited, span="github_throttle")
+        return waited
+
+    # --- Feedback from responses ---
+
+    def observe(self, status_code: int, headers: Mapping[str, Any]) -> bool:
+        """
+        Update the budget from a response's rate-limit headers.
+
+        Returns True when the response was rejected by a rate limit and the
+        request should be retried once the scheduler lets it through again.
+        """
+        now = time.time()
+        rate_limited = False
+        with self._cond:
+            remaining = headers.get("X-RateLimit-Remaining")
+            reset = headers.get("X-RateLimit-Reset")
+            limit = headers.get("X-RateLimit-Limit")
+            if remaining is not None and reset is not None:
+                try:
+                    self.remaining = int(remaining)
+                    self.reset_at = float(reset)
+                    self.limit = int(limit) if limit is not None else self.limit
+                except ValueError:
+                    pass
+            if status_code in (403, 429):
+                retry_after = headers.get("Retry-After")
+                if retry_after is not None:
+                    self.paused_until = now + float(retry_after)
+                    rate_limited = True
+                elif self.remaining == 0:
+                    rate_limited = True
+            self._cond.notify_all()
+            remaining_now = self.remaining
+        if remaining_now is not None:
+            GITHUB_RATE_LIMIT_REMAINING.set(remaining_now)
+        return rate_limited
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._cond:
+            now = time.time()
+            return {
+                "limit": self.limit,
+                "remaining": self.remaining,
+                "buffer": self.buffer,
+                "reset_in_seconds": round(self.reset_at - now, 1) if self.reset_at else None,
+                "paused_for_seconds": round(max(0.0, self.paused_until - now), 1),
+                "waiting": len(self._waiters),
+                "throttled": self.throttled,
+                "throttled_seconds": round(self.throttled_seconds, 3),
+            }
+
+
+# Shared by every GithubClient in the process so all crews draw from one budget
+github_scheduler = RateLimitScheduler()
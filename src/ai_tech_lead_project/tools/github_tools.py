@@ -1,9 +1,16 @@
-from github import Github, GithubException
+from github import GithubException
 from crewai.tools import BaseTool
 from dotenv import load_dotenv
 import os
-from typing import Literal
+import threading
+from typing import Any, Dict, List, Literal, Optional, Tuple
 from pydantic import BaseModel, Field, PrivateAttr
+from ..utils.diff_cache import diff_cache
+from ..utils.diff_filter import DiffFilter, FilteredDiff, diff_filter as default_diff_filter, skipped_summary_line
+from ..utils.metrics import span
+from .github_client import COMPARE_MAX_FILES, GithubClient
+from .github_scheduler import PRIORITY_LOW, github_scheduler
+from .review_publisher import ReviewPublisher
 
 
 class GithubToolInput(BaseModel):
@@ -13,13 +20,75 @@ class GithubToolInput(BaseModel):
     comment_body: str = Field(default="", description="Comment body text to post (required for post_pr_comment)")
 
 
+def iter_pr_diff(base_sha: str, head_sha: str, files: List[Dict[str, Any]], skipped: List[Dict[str, Any]] = ()):
+    """Yield the diff text one header line or patch at a time; skipped files get a one-line summary."""
+    yield f"Comparing {base_sha[:7]}...{head_sha[:7]}"
+    yield f"Files changed: {len(files) + len(skipped)}"
+    yield ""
+
+    for file in files:
+        yield f"--- a/{file['filename']}"
+        yield f"+++ b/{file['filename']}"
+        yield f"@@ Status: {file['status']} | Changes: +{file['additions']} -{file['deletions']} @@"
+
+        # Add patch content if available
+        if file['patch']:
+            yield file['patch']
+        elif file.get('changes', file['additions'] + file['deletions']):
+            yield "Patch not available (diff too large for GitHub to include)"
+        else:
+            yield "Binary file or no patch content available"
+        yield ""
+
+    if skipped:
+        yield f"Skipped {len(skipped)} file(s) not worth reviewing (generated, vendored, binary or over the size caps):"
+        for skip in skipped:
+            yield skipped_summary_line(skip)
+        yield ""
+
+
+def format_pr_diff(base_sha: str, head_sha: str, files: List[Dict[str, Any]], skipped: List[Dict[str, Any]] = ()) -> str:
+    """Render the per-file patches of a comparison as a single diff string."""
+    return "\n".join(iter_pr_diff(base_sha, head_sha, files, skipped))
+
+
+def render_pr_diff(entry: Dict[str, Any], diff_filter: Optional[DiffFilter] = None) -> Tuple[str, FilteredDiff]:
+    """Filter a cached diff entry (see DiffFilter) and render what is left. Returns (text, filtered)."""
+    filtered = (diff_filter or default_diff_filter).apply(entry["files"], entry.get("gitattributes"))
+    return format_pr_diff(entry["base_sha"], entry["head_sha"], filtered.files, filtered.skipped), filtered
+
+
+def format_prefetched_diff(entry: Dict[str, Any], max_file_chars: int, max_total_chars: int,
+                           skipped: List[Dict[str, Any]] = ()):
+    """
+    Render a cached diff entry for direct inclusion in a task prompt.
+
+    Patches longer than `max_file_chars`, or that would push the prompt past
+    `max_total_chars`, are replaced by a placeholder so the agent knows to
+    fetch them through the GitHub tool. `skipped` files (see DiffFilter) are
+    listed as summary lines. Returns (text, elided_filenames).
+    """
+    files = []
+    elided = []
+    total = 0
+    for file in entry["files"]:
+        patch = file["patch"] or ""
+        if len(patch) > max_file_chars or total + len(patch) > max_total_chars:
+            elided.append(file["filename"])
+            file = dict(file, patch=f"[Patch elided ({len(patch)} characters). Use get_pr_diff to inspect this file.]")
+        else:
+            total += len(patch)
+        files.append(file)
+    return format_pr_diff(entry["base_sha"], entry["head_sha"], files, skipped), elided
+
+
 class GithubTools(BaseTool):
     name: str = "GitHub Tool"
     description: str = "A tool for interacting with GitHub repositories to fetch pull request diffs and post comments."
     args_schema: type[BaseModel] = GithubToolInput
 
     # Add type annotation for the private attribute
-    _github_client: Github | None = PrivateAttr(default=None)
+    _github_client: GithubClient | None = PrivateAttr(default=None)
     _enabled: bool = PrivateAttr(default=False)
 
     def __init__(self):
@@ -34,7 +103,8 @@ class GithubTools(BaseTool):
             self._github_client = None
             self._enabled = False
         else:
-            self._github_client = Github(token)
+            # Pooled, caching client shared by every worker thread
+            self._github_client = GithubClient(token)
             self._enabled = True
 
     def _run(self, command: str, repo_name: str, pr_number: int, comment_body: str = "", **kwargs):
@@ -43,37 +113,19 @@ class GithubTools(BaseTool):
                 "GitHub tool is disabled: GITHUB_ACCESS_TOKEN is not set. "
                 "Set it in your environment or .env file to enable GitHub operations."
             )
+        # Re-reviews of an already reviewed PR yield to first reviews when the budget is tight
+        priority = github_scheduler.priority_for(repo_name, pr_number)
         try:
-            repo = self._github_client.get_repo(repo_name)
-            pr = repo.get_pull(pr_number)
+            pr = self._github_client.get_pull(repo_name, pr_number, priority=priority)
         except GithubException as e:
             return f"Error accessing GitHub repository or pull request: {e}"
 
         if command == 'get_pr_diff':
             try:
-                # Get the comparison between base and head
-                comparison = repo.compare(pr.base.sha, pr.head.sha)
-
-                # Build a formatted diff string
-                diff_content = []
-                diff_content.append(f"Comparing {pr.base.sha[:7]}...{pr.head.sha[:7]}")
-                diff_content.append(f"Files changed: {len(comparison.files)}")
-                diff_content.append("")
-
-                for file in comparison.files:
-                    diff_content.append(f"--- a/{file.filename}")
-                    diff_content.append(f"+++ b/{file.filename}")
-                    diff_content.append(f"@@ Status: {file.status} | Changes: +{file.additions} -{file.deletions} @@")
-
-                    # Add patch content if available
-                    if file.patch:
-                        diff_content.append(file.patch)
-                    else:
-                        diff_content.append("Binary file or no patch content available")
-                    diff_content.append("")
-
-                return "\n".join(diff_content)
-
+                text, filtered = render_pr_diff(self._get_diff_entry(repo_name, pr, priority))
+                if filtered.skipped:
+                    print(f"Diff filter for {repo_name}# {pr_number}: {filtered.stats()}")
+                return text
             except GithubException as e:
                 return f"Error getting PR diff: {e}"
 
@@ -81,13 +133,134 @@ class GithubTools(BaseTool):
             if not comment_body:
                 return "Error: comment_body is required to post a comment."
             try:
-                pr.create_issue_comment(comment_body)
+                with span("comment_post"):
+                    self._github_client.create_issue_comment(repo_name, pr_number, comment_body, priority=priority)
                 return "Comment posted successfully."
             except GithubException as e:
                 return f"Error posting comment: {e}"
         else:
             return "Invalid command. Available commands: get_pr_diff, post_pr_comment"
 
+    def get_pr_diff_entry(self, repo_name: str, pr_number: int, head_sha: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Fetch the structured diff for a PR outside of the agent loop. `head_sha` is the
+        head the caller expects (e.g. from the webhook); cached PR metadata for another
+        head is refreshed first.
+
+        Raises RuntimeError when the tool is disabled and GithubException on API errors.
+        """
+        if not self._enabled or self._github_client is None:
+            raise RuntimeError("GitHub tool is disabled: GITHUB_ACCESS_TOKEN is not set.")
+        priority = github_scheduler.priority_for(repo_name, pr_number)
+        pr = self._github_client.get_pull(repo_name, pr_number, priority=priority, head_sha=head_sha)
+        return self._get_diff_entry(repo_name, pr, priority)
+
+    def list_pull_requests(self, repo_name: str, state: str = "open") -> List[Dict[str, Any]]:
+        """
+        List a repository's pull requests, e.g. for a backfill, at low priority.
+
+        Raises RuntimeError when the tool is disabled and GithubException on API errors.
+        """
+        if not self._enabled or self._github_client is None:
+            raise RuntimeError("GitHub tool is disabled: GITHUB_ACCESS_TOKEN is not set.")
+        return self._github_client.list_pulls(repo_name, state=state, priority=PRIORITY_LOW)
+
+    def download_source(self, repo_name: str, pr_number: int, ref: str, dest_path: str) -> int:
+        """
+        Download the source archive of `ref` (a tarball) for local test runs.
+
+        Raises RuntimeError when the tool is disabled and GithubException on API errors.
+        """
+        if not self._enabled or self._github_client is None:
+            raise RuntimeError("GitHub tool is disabled: GITHUB_ACCESS_TOKEN is not set.")
+        priority = github_scheduler.priority_for(repo_name, pr_number)
+        with span("github_tarball"):
+            return self._github_client.download_tarball(repo_name, ref, dest_path, priority=priority)
+
+    def publish_review(
+        self,
+        repo_name: str,
+        pr_number: int,
+        head_sha: Optional[str],
+        report: Optional[str],
+        analysis: Dict[str, Any],
+        files: Optional[List[Dict[str, Any]]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Post a run's report and inline findings outside of the agent loop (see ReviewPublisher).
+
+        Raises RuntimeError when the tool is disabled and GithubException on API errors.
+        """
+        if not self._enabled or self._github_client is None:
+            raise RuntimeError("GitHub tool is disabled: GITHUB_ACCESS_TOKEN is not set.")
+        priority = github_scheduler.priority_for(repo_name, pr_number)
+        with span("comment_post"):
+            return ReviewPublisher(self._github_client).publish(
+                repo_name, pr_number, head_sha, report, analysis, files=files, priority=priority
+            )
+
+    def _get_diff_entry(self, repo_name: str, pr: Dict[str, Any], priority: str = "normal") -> Dict[str, Any]:
+        """Return the cached diff for the PR's current base/head, fetching it on a miss."""
+        base_sha, head_sha = pr["base"]["sha"], pr["head"]["sha"]
+        entry = diff_cache.get(repo_name, base_sha, head_sha)
+        if entry is not None:
+            return entry
+
+        # Get the comparison between base and head
+        with span("github_compare"):
+            comparison = self._github_client.compare(repo_name, base_sha, head_sha, priority=priority)
+            changed = comparison.get("files", [])
+            if len(changed) >= COMPARE_MAX_FILES:
+                # compare truncates large diffs; the PR's file list pages up to 3000 files
+                changed = self._github_client.list_pull_files(repo_name, pr["number"], priority=priority)
+        files = [
+            {
+                "filename": f["filename"],
+                "status": f["status"],
+                "additions": f.get("additions", 0),
+                "deletions": f.get("deletions", 0),
+                "changes": f.get("changes", f.get("additions", 0) + f.get("deletions", 0)),
+                # Binary files, and text diffs over GitHub's size limit, come back without a patch
+                "patch": f.get("patch"),
+            }
+            for f in changed
+        ]
+        entry = {
+            "base_sha": base_sha,
+            "head_sha": head_sha,
+            "files": files,
+            # linguist-generated/linguist-vendored rules for the diff filter; rendering happens per use
+            "gitattributes": self._get_gitattributes(repo_name, head_sha, priority),
+        }
+        diff_cache.put(repo_name, base_sha, head_sha, entry)
+        return entry
+
+    def _get_gitattributes(self, repo_name: str, ref: str, priority: str = "normal") -> Optional[str]:
+        if not default_diff_filter.use_gitattributes:
+            return None
+        try:
+            return self._github_client.get_file_text(repo_name, ".gitattributes", ref, priority=priority)
+        except GithubException as e:
+            print(f"Could not read .gitattributes of {repo_name} @ {ref[:7]}, ignoring it: {e}")
+            return None
+
+
+# The tool is created on first use so importing this module stays cheap
+_github_tool = None
+_github_tool_lock = threading.Lock()
+
+
+def get_github_tool() -> GithubTools:
+    """Return the shared GithubTools instance used by agents, creating it on first call."""
+    global _github_tool
+    with _github_tool_lock:
+        if _github_tool is None:
+            _github_tool = GithubTools()
+        return _github_tool
+
 
-# Create an instance of the tool to be used by agents
-github_tool = GithubTools()
+def __getattr__(name):
+    # Backwards compatibility for `from .github_tools import github_tool`
+    if name == "github_tool":
+        return get_github_tool()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
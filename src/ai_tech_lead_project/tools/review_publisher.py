@@ -0,0 +1,227 @@
+import hashlib
+import json
+import os
+import re
+from typing import Any, Dict, List, Optional, Set
+
+from github import GithubException
+
+from ..utils.hunk_index import split_hunks
+from ..utils.metrics import REVIEW_POSTS
+from .github_client import GithubClient
+from .github_scheduler import PRIORITY_NORMAL
+
+SUMMARY_MARKER = "<!-- ai-tech-lead:summary"
+_MARKER_RE = re.compile(r"<!-- ai-tech-lead:summary (\{.*?\}) -->", re.DOTALL)
+
+# Adapter categories (see CrewAIResultAdapter) that are worth a line comment
+_INLINE_CATEGORIES = (
+    "Style Issues", "Documentation Issues", "Potential Bugs", "Error Handling Issues",
+    "Security Concerns", "Performance Issues", "Optimization",
+)
+
+
+def publisher_enabled() -> bool:
+    """REVIEW_POSTING=publisher (default) posts from code after the crew; "agent" leaves it to the reporter's tool call."""
+    return os.environ.get("REVIEW_POSTING", "publisher").strip().lower() != "agent"
+
+
+def commentable_lines(patch: Optional[str]) -> Set[int]:
+    """New-side line numbers of a patch that GitHub accepts review comments on (added and context lines)."""
+    lines: Set[int] = set()
+    for hunk in split_hunks({"filename": "", "patch": patch}):
+        line = hunk.start
+        for text in hunk.lines:
+            if text.startswith("-"):
+                continue
+            if not text.startswith("\\"):
+                lines.add(line)
+                line += 1
+    return lines
+
+
+def finding_fingerprint(category: str, file: Optional[str], description: str) -> str:
+    """Identity of a finding across pushes: line numbers are left out because they shift."""
+    text = "\0".join([category, file or "", " ".join(str(description).lower().split())])
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:12]
+
+
+def analysis_findings(analysis: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Flatten CrewAIResultAdapter's `issues` and `recommendations` into findings with a fingerprint."""
+    findings = []
+    for item in (analysis.get("issues") or []) + (analysis.get("recommendations") or []):
+        detail = item.get("description")
+        if isinstance(detail, dict):
+            file, line = detail.get("file"), detail.get("line")
+            description = detail.get("description") or detail.get("issue") or json.dumps(detail)
+        else:
+            file, line, description = None, None, str(detail)
+        findings.append({
+            "category": item.get("category", ""),
+            "file": file,
+            "line": line if isinstance(line, int) else None,
+            "description": description,
+            "fingerprint": finding_fingerprint(item.get("category", ""), file, description),
+        })
+    return findings
+
+
+def render_summary(analysis: Dict[str, Any]) -> str:
+    """Markdown summary built from the analysis alone, for runs without a reporter answer."""
+    sections = ["## AI Tech Lead Analysis", "", str(analysis.get("summary", "No summary provided."))]
+    by_category: Dict[str, List[str]] = {}
+    for finding in analysis_findings(analysis):
+        where = f"`{finding['file']}`" + (f" line {finding['line']}" if finding["line"] else "") + ": " if finding["file"] else ""
+        by_category.setdefault(finding["category"], []).append(f"- {where}{finding['description']}")
+    for category, lines in by_category.items():
+        sections += ["", f"### {category}"] + lines
+    return "\n".join(sections)
+
+
+class ReviewPublisher:
+    """
+    Posts the result of a run to a pull request with as few GitHub writes as possible.
+
+    - The report is one summary comment per PR, carrying a hidden marker with the
+      fingerprints of the findings it covers. Later pushes edit that comment in place
+      (or skip the write when nothing changed) instead of appending a new one. Only
+      comments written by the bot's own account (REVIEW_BOT_LOGIN, else the token's
+      user) count: anyone can paste the marker into a comment of their own.
+    - Findings with a file and a line inside the diff become line comments of a single
+      review, submitted in one API call; only findings not already posted inline on an
+      earlier push are sent. Findings outside the diff stay in the summary only.
+
+    Runs after the crew, in code, so the reporter agent never spends a tool call on posting.
+    """
+
+    def __init__(self, client: GithubClient):
+        self.client = client
+        self.inline = os.environ.get("REVIEW_INLINE_COMMENTS", "true").lower() in ("1", "true", "yes")
+        self.max_inline = int(os.environ.get("REVIEW_MAX_INLINE_COMMENTS", "30"))
+        self.bot_login = os.environ.get("REVIEW_BOT_LOGIN", "").strip()
+
+    def _own_login(self, priority: str) -> Optional[str]:
+        if self.bot_login:
+            return self.bot_login
+        try:
+            return self.client.get_authenticated_user(priority=priority).get("login")
+        except GithubException as e:
+            # Installation tokens cannot read /user
+            print(f"Cannot tell which comments are ours, set REVIEW_BOT_LOGIN; posting a new summary: {e}")
+            return None
+
+    def _find_summary(self, repo_name: str, pr_number: int, priority: str) -> Optional[Dict[str, Any]]:
+        login = self._own_login(priority)
+        if not login:
+            return None
+        # Listing is revalidated with ETags, so an unchanged comment list costs no rate limit
+        summary = None
+        for comment in self.client.list_issue_comments(repo_name, pr_number, priority=priority):
+            author = (comment.get("user") or {}).get("login", "")
+            if author.lower() == login.lower() and SUMMARY_MARKER in (comment.get("body") or ""):
+                summary = comment
+        return summary
+
+    @staticmethod
+    def _state(comment: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        match = _MARKER_RE.search((comment or {}).get("body") or "")
+        if not match:
+            return {}
+        try:
+            return json.loads(match.group(1))
+        except json.JSONDecodeError:
+            return {}
+
+    def _inline_candidates(self, findings, files, posted):
+        if not self.inline or files is None:
+            return []
+        diff_lines = {f["filename"]: commentable_lines(f.get("patch")) for f in files}
+        candidates = [
+            f for f in findings
+            if f["category"] in _INLINE_CATEGORIES and f["fingerprint"] not in posted
+            and f["line"] in diff_lines.get(f["file"], ())
+        ]
+        return candidates[:self.max_inline]
+
+    def publish(
+        self,
+        repo_name: str,
+        pr_number: int,
+        head_sha: Optional[str],
+        report: Optional[str],
+        analysis: Dict[str, Any],
+        files: Optional[List[Dict[str, Any]]] = None,
+        priority: str = PRIORITY_NORMAL,
+    ) -> Dict[str, Any]:
+        """
+        Post `report` (or a summary rendered from `analysis`) and inline comments for new findings.
+
+        `files` are the diff's files (with patches), used to keep line comments on lines
+        GitHub accepts; without them everything goes into the summary. Returns what was written.
+        """
+        findings = analysis_findings(analysis)
+        current = {f["fingerprint"] for f in findings}
+        previous = self._find_summary(repo_name, pr_number, priority)
+        state = self._state(previous)
+        posted = set(state.get("posted", [])) & current
+        if head_sha and state.get("head_sha") == head_sha:
+            # A retry of the same push reports the change against the push before it
+            new, resolved = state.get("delta", [0, 0])
+        elif previous is not None:
+            new = len(current - set(state.get("findings", [])))
+            resolved = len(set(state.get("findings", [])) - current)
+        else:
+            new, resolved = len(current), 0
+        result = {"summary": None, "inline_posted": 0, "new_findings": new, "resolved_findings": resolved, "writes": 0}
+
+        inline = self._inline_candidates(findings, files, posted)
+        if inline:
+            payload = {
+                "event": "COMMENT",
+                "body": f"{len(inline)} new finding(s)" + (f" on {head_sha[:7]}" if head_sha else "") + ", see the summary comment.",
+                "comments": [
+                    {"path": f["file"], "line": f["line"], "side": "RIGHT", "body": f"**{f['category']}**: {f['description']}"}
+                    for f in inline
+                ],
+            }
+            if head_sha:
+                payload["commit_id"] = head_sha
+            try:
+                self.client.create_review(repo_name, pr_number, payload, priority=priority)
+                posted |= {f["fingerprint"] for f in inline}
+                result["inline_posted"] = len(inline)
+                REVIEW_POSTS.inc(action="review_created")
+            except GithubException as e:
+                # 422: a line is outside the diff after all; the findings are still in the summary
+                print(f"Inline review for {repo_name}# {pr_number} rejected, keeping findings in the summary: {e}")
+                REVIEW_POSTS.inc(action="review_rejected")
+            result["writes"] += 1
+
+        body = (report or render_summary(analysis)).rstrip()
+        # The first summary has nothing to compare against
+        delta = [new, resolved] if previous is not None else [0, 0]
+        if any(delta):
+            body += f"\n\n_Since the previous review: {new} new finding(s), {resolved} resolved._"
+        marker = json.dumps(
+            {"head_sha": head_sha, "delta": delta, "findings": sorted(current), "posted": sorted(posted)}, separators=(",", ":")
+        )
+        body += f"\n\n{SUMMARY_MARKER} {marker} -->"
+
+        if previous is not None and previous.get("body") == body:
+            result["summary"] = "unchanged"
+        elif previous is not None:
+            try:
+                self.client.update_issue_comment(repo_name, previous["id"], body, priority=priority)
+                result["summary"] = "updated"
+            except GithubException as e:
+                if e.status != 404:
+                    raise
+                # Deleted in the meantime
+                previous = None
+            result["writes"] += 1
+        if previous is None:
+            self.client.create_issue_comment(repo_name, pr_number, body, priority=priority)
+            result["summary"] = "created"
+            result["writes"] += 1
+        REVIEW_POSTS.inc(action=f"summary_{result['summary']}")
+        return result
@@ -0,0 +1,84 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+
+class CheckpointStore:
+    """
+    On-disk store of completed pipeline stage outputs.
+
+    A checkpoint is keyed by (repo, PR, head SHA, stage), so a retry after a
+    transient LLM failure, or a restarted process, resumes from the first
+    stage that has not completed instead of paying for finished ones again.
+    Files older than CHECKPOINT_TTL_SECONDS are pruned when the store opens.
+    """
+
+    def __init__(self, directory: Optional[str] = None, ttl_seconds: Optional[int] = None):
+        self.directory = directory if directory is not None else os.environ.get("CHECKPOINT_DIR", "tmp/checkpoints")
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else int(
+            os.environ.get("CHECKPOINT_TTL_SECONDS", str(7 * 24 * 3600))
+        )
+        self.enabled = os.environ.get("CHECKPOINTS", "true").lower() in ("1", "true", "yes") and bool(self.directory)
+        self._lock = threading.Lock()
+        if self.enabled:
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                self.prune()
+            except OSError as e:
+                print(f"Warning: checkpoints disabled, cannot use {self.directory}: {e}")
+                self.enabled = False
+
+    @staticmethod
+    def _key(repo_name: str, pr_number: int, head_sha: str, stage: str) -> str:
+        return hashlib.sha256(f"{repo_name}\0{pr_number}\0{head_sha}\0{stage}".encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def load(self, repo_name: str, pr_number: int, head_sha: Optional[str], stage: str) -> Optional[Dict[str, Any]]:
+        if not self.enabled or not head_sha:
+            return None
+        try:
+            with open(self._path(self._key(repo_name, pr_number, head_sha, stage)), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, repo_name: str, pr_number: int, head_sha: Optional[str], stage: str, output: Any):
+        if not self.enabled or not head_sha:
+            return
+        path = self._path(self._key(repo_name, pr_number, head_sha, stage))
+        record = {
+            "repo_name": repo_name,
+            "pr_number": pr_number,
+            "head_sha": head_sha,
+            "stage": stage,
+            "saved_at": time.time(),
+            "output": output,
+        }
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(record, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Warning: could not checkpoint stage '{stage}' for {repo_name}# {pr_number}: {e}")
+
+    def prune(self):
+        """Delete checkpoints older than the TTL."""
+        cutoff = time.time() - self.ttl_seconds
+        with self._lock:
+            for name in os.listdir(self.directory):
+                path = os.path.join(self.directory, name)
+                try:
+                    if name.endswith(".json") and os.path.getmtime(path) < cutoff:
+                        os.remove(path)
+                except OSError:
+                    continue
+
+
+# Shared instance used by all crew runs in this process
+checkpoint_store = CheckpointStore()
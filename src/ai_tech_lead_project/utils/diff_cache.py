@@ -0,0 +1,121 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+class DiffCache:
+    """
+    Content-addressed cache for pull request diffs.
+
+    Entries are keyed by (repo, base_sha, head_sha). Commit SHAs are
+    immutable, so an entry never goes stale and there is no TTL. The
+    in-memory tier is an LRU bounded by total bytes; an optional on-disk tier
+    (DIFF_CACHE_DIR) survives process restarts. All operations are guarded by
+    a lock so the cache can be shared by concurrent crew worker threads.
+    """
+
+    def __init__(self, max_bytes: Optional[int] = None, disk_dir: Optional[str] = None):
+        self.max_bytes = max_bytes if max_bytes is not None else int(
+            os.environ.get("DIFF_CACHE_MAX_BYTES", str(64 * 1024 * 1024))
+        )
+        self.disk_dir = disk_dir if disk_dir is not None else os.environ.get("DIFF_CACHE_DIR", "")
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+        self._entries: OrderedDict = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(repo_name: str, base_sha: str, head_sha: str) -> str:
+        return hashlib.sha256(f"{repo_name}\0{base_sha}\0{head_sha}".encode("utf-8")).hexdigest()
+
+    def get(self, repo_name: str, base_sha: str, head_sha: str) -> Optional[Dict[str, Any]]:
+        key = self.make_key(repo_name, base_sha, head_sha)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+
+        entry = self._read_disk(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._store_locked(key, entry, len(json.dumps(entry)))
+            return entry
+
+    def put(self, repo_name: str, base_sha: str, head_sha: str, entry: Dict[str, Any]):
+        key = self.make_key(repo_name, base_sha, head_sha)
+        serialized = json.dumps(entry)
+        with self._lock:
+            self._store_locked(key, entry, len(serialized))
+        self._write_disk(key, serialized)
+
+    def _store_locked(self, key: str, entry: Dict[str, Any], size: int):
+        if size > self.max_bytes:
+            # Too large for the memory tier; it can still live on disk
+            return
+        if key in self._entries:
+            self._bytes -= self._sizes[key]
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        self._sizes[key] = size
+        self._bytes += size
+        while self._bytes > self.max_bytes and self._entries:
+            old_key, _ = self._entries.popitem(last=False)
+            self._bytes -= self._sizes.pop(old_key)
+            self.evictions += 1
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _read_disk(self, key: str) -> Optional[Dict[str, Any]]:
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._disk_path(key), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_disk(self, key: str, serialized: str):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(serialized)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Warning: could not persist diff cache entry {key[:12]}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round((self.hits + self.disk_hits) / lookups, 3) if lookups else 0.0,
+            }
+
+
+# Shared instance used by the GitHub tool across all worker threads
+diff_cache = DiffCache()
@@ -0,0 +1,205 @@
+import os
+from dataclasses import dataclass, field
+from fnmatch import fnmatchcase
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .metrics import DIFF_SKIPPED_BYTES, DIFF_SKIPPED_TOKENS
+from .sharding import estimate_tokens
+
+# Files that are almost never worth a reviewer's tokens: dependency lockfiles,
+# minified/bundled assets, generated protobuf code, test snapshots and vendored trees.
+DEFAULT_EXCLUDES = (
+    "package-lock.json", "yarn.lock", "pnpm-lock.yaml", "npm-shrinkwrap.json",
+    "poetry.lock", "Pipfile.lock", "uv.lock", "Cargo.lock", "go.sum", "composer.lock", "Gemfile.lock",
+    "*.min.js", "*.min.css", "*.map", "*.bundle.js",
+    "*_pb2.py", "*_pb2_grpc.py", "*.pb.go", "*.pb.cc", "*.pb.h",
+    "*.snap", "**/__snapshots__/**",
+    "vendor/**", "node_modules/**", "third_party/**", "dist/**",
+)
+
+
+def _split_patterns(value: Optional[str]) -> List[str]:
+    return [p.strip() for p in (value or "").split(",") if p.strip()]
+
+
+def glob_match(path: str, pattern: str) -> bool:
+    """
+    gitignore-style matching: a pattern without a slash matches the file name in
+    any directory, otherwise the path from the repository root; `dir/` means
+    everything below `dir`, and a leading `**/` also matches at the root.
+    """
+    pattern = pattern.lstrip("/")
+    if pattern.endswith("/"):
+        pattern += "**"
+    if "/" not in pattern:
+        return fnmatchcase(path.rsplit("/", 1)[-1], pattern)
+    if fnmatchcase(path, pattern):
+        return True
+    return pattern.startswith("**/") and fnmatchcase(path, pattern[3:])
+
+
+def parse_gitattributes(text: Optional[str]) -> List[Tuple[str, Dict[str, bool]]]:
+    """
+    Parse the linguist/diff attributes of a .gitattributes file.
+
+    Returns [(pattern, {attribute: enabled})] in file order; later lines win.
+    `attr`, `attr=true` set an attribute, `-attr`, `attr=false` unset it, and
+    `binary` implies `-diff`.
+    """
+    rules = []
+    for line in (text or "").splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        pattern, *attrs = line.split()
+        values: Dict[str, bool] = {}
+        for attr in attrs:
+            if attr.startswith("-") or attr.startswith("!"):
+                values[attr[1:]] = False
+            elif "=" in attr:
+                name, value = attr.split("=", 1)
+                values[name] = value.lower() not in ("false", "0", "no")
+            else:
+                values[attr] = True
+            if attr == "binary":
+                values["diff"] = False
+        if values:
+            rules.append((pattern, values))
+    return rules
+
+
+def _attributes_for(path: str, rules: List[Tuple[str, Dict[str, bool]]]) -> Dict[str, bool]:
+    resolved: Dict[str, bool] = {}
+    for pattern, values in rules:
+        if glob_match(path, pattern):
+            resolved.update(values)
+    return resolved
+
+
+@dataclass
+class FilteredDiff:
+    """Files kept for the prompt, plus what was skipped and why."""
+
+    files: List[Dict[str, Any]] = field(default_factory=list)
+    skipped: List[Dict[str, Any]] = field(default_factory=list)
+
+    def stats(self) -> Dict[str, Any]:
+        by_reason: Dict[str, int] = {}
+        for skip in self.skipped:
+            by_reason[skip["reason"]] = by_reason.get(skip["reason"], 0) + 1
+        return {
+            "files_kept": len(self.files),
+            "files_skipped": len(self.skipped),
+            "bytes_kept": sum(len((f.get("patch") or "").encode("utf-8")) for f in self.files),
+            "bytes_skipped": sum(s["bytes"] for s in self.skipped),
+            "tokens_skipped_estimate": sum(s["tokens"] for s in self.skipped),
+            "skipped_by_reason": by_reason,
+        }
+
+    def record_metrics(self):
+        """Count the skipped bytes and tokens; call once per job, not per rendering of the diff."""
+        for skip in self.skipped:
+            DIFF_SKIPPED_BYTES.inc(skip["bytes"], reason=skip["reason"])
+            DIFF_SKIPPED_TOKENS.inc(skip["tokens"], reason=skip["reason"])
+
+
+def skipped_summary_line(skip: Dict[str, Any]) -> str:
+    """One compact line standing in for a skipped file's patch."""
+    return (
+        f"[skipped] {skip['filename']} ({skip['status']}, +{skip['additions']} -{skip['deletions']}, "
+        f"{skip['bytes']} bytes): {skip['detail']}"
+    )
+
+
+class DiffFilter:
+    """
+    Decides which files of a comparison reach the LLM.
+
+    In order, a file is skipped when it has no patch (binary, or a text diff too
+    large for GitHub to include), matches an
+    exclude glob (DIFF_EXCLUDE, plus DEFAULT_EXCLUDES unless
+    DIFF_DEFAULT_EXCLUDES=false), misses every DIFF_INCLUDE glob when those are
+    set, is marked linguist-generated/linguist-vendored/-diff in the repository's
+    .gitattributes (DIFF_RESPECT_GITATTRIBUTES), is larger than
+    DIFF_MAX_FILE_BYTES, or would push the kept patches past DIFF_MAX_TOTAL_BYTES.
+    """
+
+    def __init__(
+        self,
+        include: Optional[Iterable[str]] = None,
+        exclude: Optional[Iterable[str]] = None,
+        max_file_bytes: Optional[int] = None,
+        max_total_bytes: Optional[int] = None,
+        use_gitattributes: Optional[bool] = None,
+    ):
+        if include is None:
+            include = _split_patterns(os.environ.get("DIFF_INCLUDE"))
+        if exclude is None:
+            exclude = _split_patterns(os.environ.get("DIFF_EXCLUDE"))
+            if os.environ.get("DIFF_DEFAULT_EXCLUDES", "true").lower() in ("1", "true", "yes"):
+                exclude = list(DEFAULT_EXCLUDES) + exclude
+        if use_gitattributes is None:
+            use_gitattributes = os.environ.get("DIFF_RESPECT_GITATTRIBUTES", "true").lower() in ("1", "true", "yes")
+        self.include = list(include)
+        self.exclude = list(exclude)
+        self.max_file_bytes = max_file_bytes or int(os.environ.get("DIFF_MAX_FILE_BYTES", "100000"))
+        self.max_total_bytes = max_total_bytes or int(os.environ.get("DIFF_MAX_TOTAL_BYTES", "1000000"))
+        self.use_gitattributes = use_gitattributes
+
+    def _rule_skip(self, path: str, rules) -> Optional[Tuple[str, str]]:
+        for pattern in self.exclude:
+            if glob_match(path, pattern):
+                return "excluded", f"excluded by pattern '{pattern}'"
+        if self.include and not any(glob_match(path, pattern) for pattern in self.include):
+            return "not_included", "matches no DIFF_INCLUDE pattern"
+        if rules:
+            attributes = _attributes_for(path, rules)
+            if attributes.get("linguist-generated"):
+                return "generated", "marked linguist-generated in .gitattributes"
+            if attributes.get("linguist-vendored"):
+                return "vendored", "marked linguist-vendored in .gitattributes"
+            if attributes.get("diff") is False:
+                return "binary", "marked -diff/binary in .gitattributes"
+        return None
+
+    def apply(self, files: Iterable[Dict[str, Any]], gitattributes: Optional[str] = None) -> FilteredDiff:
+        rules = parse_gitattributes(gitattributes) if self.use_gitattributes else []
+        result = FilteredDiff()
+        total = 0
+        for file in files:
+            patch = file.get("patch") or ""
+            size = len(patch.encode("utf-8"))
+            if not patch:
+                changes = file.get("changes", file.get("additions", 0) + file.get("deletions", 0))
+                if changes:
+                    # GitHub leaves out the patch of text diffs over its size limit
+                    skip = ("no_patch", f"GitHub omitted the patch ({changes} changed lines)")
+                else:
+                    skip = ("binary", "binary or empty file")
+            else:
+                skip = self._rule_skip(file["filename"], rules)
+            if skip is None and size > self.max_file_bytes:
+                skip = ("file_bytes_cap", f"patch exceeds DIFF_MAX_FILE_BYTES ({self.max_file_bytes})")
+            if skip is None and total + size > self.max_total_bytes:
+                skip = ("total_bytes_cap", f"diff already at DIFF_MAX_TOTAL_BYTES ({self.max_total_bytes})")
+            if skip is None:
+                total += size
+                result.files.append(file)
+                continue
+            reason, detail = skip
+            tokens = estimate_tokens(patch)
+            result.skipped.append({
+                "filename": file["filename"],
+                "status": file.get("status", "modified"),
+                "additions": file.get("additions", 0),
+                "deletions": file.get("deletions", 0),
+                "bytes": size,
+                "tokens": tokens,
+                "reason": reason,
+                "detail": detail,
+            })
+        return result
+
+
+# Configuration comes from the environment, so one filter serves the whole process
+diff_filter = DiffFilter()
@@ -0,0 +1,403 @@
+import hashlib
+import json
+import math
+import operator
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from .metrics import HUNK_INDEX_ENTRIES, HUNK_LOOKUP_SECONDS, HUNK_LOOKUPS
+
+_HUNK_HEADER_RE = re.compile(r"^@@ -\d+(?:,\d+)? \+(?P<start>\d+)(?:,(?P<length>\d+))? @@")
+_TOKEN_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|\d+|[^\sA-Za-z0-9_]")
+
+
+@dataclass
+class Hunk:
+    """One `@@` section of a file's patch; `start`/`length` refer to the new side."""
+
+    filename: str
+    start: int
+    length: int
+    lines: List[str] = field(default_factory=list)
+
+    def normalized(self) -> str:
+        """
+        The changed lines only, with whitespace collapsed: hunks that differ in
+        their line numbers, surrounding context or indentation normalize to the same text.
+        """
+        changed = []
+        for line in self.lines:
+            if line[:1] in ("+", "-") and line[1:].strip():
+                changed.append(line[0] + " ".join(line[1:].split()))
+        return "\n".join(changed)
+
+    def digest(self) -> str:
+        return hashlib.sha256(self.normalized().encode("utf-8")).hexdigest()
+
+    def contains(self, line: int) -> bool:
+        return self.start <= line < self.start + max(1, self.length)
+
+
+def split_hunks(file: Dict[str, Any]) -> List[Hunk]:
+    hunks: List[Hunk] = []
+    for line in (file.get("patch") or "").splitlines():
+        match = _HUNK_HEADER_RE.match(line)
+        if match:
+            length = match.group("length")
+            hunks.append(Hunk(file["filename"], int(match.group("start")), int(length) if length is not None else 1))
+        elif hunks:
+            hunks[-1].lines.append(line)
+    return [hunk for hunk in hunks if hunk.normalized()]
+
+
+class HashingEmbedder:
+    """
+    Offline embedder: signed feature hashing of code tokens and token bigrams
+    into HUNK_EMBEDDING_DIM dimensions, L2-normalized. Near-identical hunks
+    (a renamed variable, a changed constant) land close to each other.
+    """
+
+    name = "hashing"
+
+    def __init__(self, dim: Optional[int] = None):
+        self.dim = dim or int(os.environ.get("HUNK_EMBEDDING_DIM", "256"))
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        vectors = []
+        for text in texts:
+            tokens = _TOKEN_RE.findall(text)
+            features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+            vector = [0.0] * self.dim
+            for feature in features:
+                h = zlib.crc32(feature.encode("utf-8"))
+                vector[h % self.dim] += 1.0 if (h >> 31) & 1 else -1.0
+            norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+            vectors.append([v / norm for v in vector])
+        return vectors
+
+
+class GeckoEmbedder:
+    """
+    Embeddings from `embedding-gecko-001` (see agents.list_models) through the
+    Generative Language API's batchEmbedText; HUNK_EMBEDDING_URL overrides the endpoint.
+    """
+
+    name = "embedding-gecko-001"
+
+    def __init__(self, api_key: Optional[str] = None):
+        import requests
+        self.url = os.environ.get(
+            "HUNK_EMBEDDING_URL",
+            "https://generativelanguage.googleapis.com/v1beta3/models/embedding-gecko-001:batchEmbedText",
+        )
+        self._session = requests.Session()
+        self._session.headers.update({"x-goog-api-key": api_key or os.environ.get("GEMINI_API_KEY", "")})
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        # The model takes at most 1024 tokens; hunks are cut well before that
+        response = self._session.post(self.url, json={"texts": [t[:3000] for t in texts]}, timeout=30)
+        response.raise_for_status()
+        vectors = []
+        for item in response.json().get("embeddings", []):
+            vector = item.get("value") or []
+            norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+            vectors.append([v / norm for v in vector])
+        return vectors
+
+
+def create_embedder():
+    """HUNK_EMBEDDER: "hashing" (default, offline), "gecko", or "none" for exact matching only."""
+    kind = os.environ.get("HUNK_EMBEDDER", "hashing").strip().lower()
+    if kind == "none":
+        return None
+    if kind == "gecko":
+        return GeckoEmbedder()
+    return HashingEmbedder()
+
+
+class HunkIndex:
+    """
+    Similarity index over previously reviewed hunks and the findings made on them.
+
+    Backports, cherry-picks and fork PRs carry hunks that were already reviewed
+    elsewhere. Each reviewed hunk is stored under the hash of its normalized
+    changed lines, with the findings that fell inside it (line numbers relative
+    to the hunk). A lookup first tries the exact hash, then, if an embedder is
+    configured, the most similar stored hunk by cosine similarity. Entries live
+    in memory and in a SQLite file (HUNK_INDEX_PATH) shared by every process on
+    the host; matches are limited to the same repository unless
+    HUNK_INDEX_SCOPE=global, and never come from earlier runs of the PR being
+    looked up. At most HUNK_INDEX_MAX_ENTRIES are kept, oldest first out.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS hunks (
+            digest TEXT NOT NULL,
+            repo_name TEXT NOT NULL,
+            filename TEXT NOT NULL,
+            findings TEXT NOT NULL,
+            vector TEXT,
+            created_at REAL NOT NULL,
+            pr_number INTEGER,
+            PRIMARY KEY (repo_name, digest)
+        );
+        CREATE INDEX IF NOT EXISTS hunks_created ON hunks (created_at);
+    """
+
+    def __init__(self, path: Optional[str] = None, embedder: Any = "default"):
+        self.enabled = os.environ.get("HUNK_INDEX", "true").lower() in ("1", "true", "yes")
+        self.path = path if path is not None else os.environ.get("HUNK_INDEX_PATH", os.path.join("tmp", "hunk_index.sqlite3"))
+        self.global_scope = os.environ.get("HUNK_INDEX_SCOPE", "repo").strip().lower() == "global"
+        self.max_entries = int(os.environ.get("HUNK_INDEX_MAX_ENTRIES", "20000"))
+        self.min_changed_lines = int(os.environ.get("HUNK_MIN_CHANGED_LINES", "3"))
+        self._embedder = embedder
+        self._lock = threading.Lock()
+        self._loaded = False
+        # (repo, digest) -> {"filename", "findings", "vector", "created_at", "pr_number"}
+        self._entries: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self.lookups = {"exact": 0, "near": 0, "miss": 0}
+        self.lookup_seconds = 0.0
+        HUNK_INDEX_ENTRIES.set_function(lambda: {(): len(self._entries)})
+
+    @property
+    def embedder(self):
+        if self._embedder == "default":
+            self._embedder = create_embedder()
+        return self._embedder
+
+    # --- Storage ---
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _load_locked(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        if not self.path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with self._connect() as conn:
+                conn.executescript(self.SCHEMA)
+                columns = [row[1] for row in conn.execute("PRAGMA table_info(hunks)")]
+                if "pr_number" not in columns:
+                    # Index files written before entries recorded their PR
+                    conn.execute("ALTER TABLE hunks ADD COLUMN pr_number INTEGER")
+                rows = conn.execute(
+                    "SELECT repo_name, digest, filename, findings, vector, created_at, pr_number FROM hunks "
+                    "ORDER BY created_at DESC LIMIT ?", (self.max_entries,)
+                ).fetchall()
+        except sqlite3.Error as e:
+            print(f"Warning: hunk index persistence disabled, cannot use {self.path}: {e}")
+            self.path = ""
+            return
+        for repo_name, digest, filename, findings, vector, created_at, pr_number in rows:
+            self._entries[(repo_name, digest)] = {
+                "filename": filename,
+                "findings": json.loads(findings),
+                "vector": json.loads(vector) if vector else None,
+                "created_at": created_at,
+                "pr_number": pr_number,
+            }
+
+    def _persist(self, rows: List[Tuple]):
+        if not self.path or not rows:
+            return
+        try:
+            with self._connect() as conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO hunks (digest, repo_name, filename, findings, vector, created_at, pr_number) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+                )
+                conn.execute(
+                    "DELETE FROM hunks WHERE created_at < (SELECT created_at FROM hunks "
+                    "ORDER BY created_at DESC LIMIT 1 OFFSET ?)", (self.max_entries,)
+                )
+        except sqlite3.Error as e:
+            print(f"Warning: could not persist hunk index entries: {e}")
+
+    def _evict_locked(self):
+        if len(self._entries) <= self.max_entries:
+            return
+        oldest = sorted(self._entries, key=lambda key: self._entries[key]["created_at"])
+        for key in oldest[:len(self._entries) - self.max_entries]:
+            del self._entries[key]
+
+    def _embed(self, hunks: List[Hunk]) -> List[Optional[List[float]]]:
+        if self.embedder is None or not hunks:
+            return [None] * len(hunks)
+        try:
+            return self.embedder.embed([hunk.normalized() for hunk in hunks])
+        except Exception as e:
+            print(f"Hunk embedding failed, using exact matching only: {e}")
+            return [None] * len(hunks)
+
+    def _indexable(self, hunk: Hunk) -> bool:
+        # One-line hunks (version bumps, imports) match everywhere and say little
+        return len(hunk.normalized().splitlines()) >= self.min_changed_lines
+
+    # --- Lookup ---
+
+    def lookup(self, repo_name: str, files: List[Dict[str, Any]],
+               pr_number: Optional[int] = None) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Find prior reviews of the hunks in `files`, ignoring entries indexed by
+        earlier runs of `pr_number` in `repo_name`.
+
+        Returns {filename: [match per hunk]}; each match has the hunk, whether it
+        matched the normalized hash exactly, the similarity (1.0 for an exact
+        match, None on a miss) and the prior findings moved to the hunk's current
+        file and line numbers.
+        """
+        if not self.enabled:
+            return {}
+        started_at = time.perf_counter()
+        hunks = [hunk for file in files for hunk in split_hunks(file)]
+
+        def usable(key, entry):
+            return pr_number is None or key[0] != repo_name or entry.get("pr_number") != pr_number
+
+        with self._lock:
+            self._load_locked()
+            exact = {}
+            for hunk in hunks:
+                if not self._indexable(hunk):
+                    continue
+                key = (repo_name, hunk.digest())
+                entry = self._entries.get(key)
+                if entry is not None and not usable(key, entry):
+                    entry = None
+                if entry is None and self.global_scope:
+                    entry = next(
+                        (e for k, e in self._entries.items() if k[1] == hunk.digest() and usable(k, e)), None
+                    )
+                if entry is not None:
+                    exact[id(hunk)] = entry
+        # Embeddings (possibly a network call) are computed outside the lock
+        misses = [hunk for hunk in hunks if id(hunk) not in exact and self._indexable(hunk)]
+        vectors = dict(zip((id(h) for h in misses), self._embed(misses)))
+
+        # Snapshot the candidates and run the cosine scan outside the lock, so one large
+        # lookup does not serialize every other review in the process
+        with self._lock:
+            candidates = [
+                (entry, entry["vector"]) for key, entry in self._entries.items()
+                if entry["vector"] is not None and (key[0] == repo_name or self.global_scope) and usable(key, entry)
+            ] if any(v is not None for v in vectors.values()) else []
+
+        results: Dict[str, List[Dict[str, Any]]] = {}
+        counts = {"exact": 0, "near": 0, "miss": 0}
+        for hunk in hunks:
+            entry, similarity, result = exact.get(id(hunk)), 1.0, "exact"
+            if entry is None:
+                entry, similarity = self._nearest(candidates, vectors.get(id(hunk)))
+                result = "near" if entry is not None else "miss"
+            counts[result] += 1
+            HUNK_LOOKUPS.inc(result=result)
+            results.setdefault(hunk.filename, []).append({
+                "hunk": hunk,
+                "exact": result == "exact",
+                "similarity": similarity if entry is not None else None,
+                "findings": self._relocate(entry["findings"], hunk) if entry is not None else [],
+            })
+        elapsed = time.perf_counter() - started_at
+        with self._lock:
+            for result, count in counts.items():
+                self.lookups[result] += count
+            self.lookup_seconds += elapsed
+        HUNK_LOOKUP_SECONDS.observe(elapsed)
+        return results
+
+    @staticmethod
+    def _nearest(candidates: List[Tuple[Dict[str, Any], List[float]]], vector: Optional[List[float]]):
+        if vector is None:
+            return None, None
+        best, best_similarity = None, 0.0
+        for entry, other in candidates:
+            if len(other) != len(vector):
+                continue
+            similarity = sum(map(operator.mul, vector, other))
+            if similarity > best_similarity:
+                best, best_similarity = entry, similarity
+        return best, round(best_similarity, 4)
+
+    @staticmethod
+    def _relocate(findings: List[Dict[str, Any]], hunk: Hunk) -> List[Dict[str, Any]]:
+        """Stored findings as {"category", "finding"} with the finding moved onto `hunk`."""
+        relocated = []
+        for stored in findings:
+            finding = dict(stored["finding"], file=hunk.filename)
+            offset = finding.pop("offset", None)
+            if offset is not None:
+                finding["line"] = hunk.start + offset
+            relocated.append({"category": stored["category"], "finding": finding})
+        return relocated
+
+    # --- Indexing ---
+
+    def add_review(self, repo_name: str, files: List[Dict[str, Any]], review: Optional[Dict[str, Any]],
+                   pr_number: Optional[int] = None):
+        """Index the hunks of reviewed `files` (from PR `pr_number`) with the findings of `review` that fall inside them."""
+        if not self.enabled or review is None:
+            return
+        hunks = [hunk for file in files for hunk in split_hunks(file) if self._indexable(hunk)]
+        per_hunk: Dict[int, List[Dict[str, Any]]] = {id(hunk): [] for hunk in hunks}
+        for category, findings in review.items():
+            if not isinstance(findings, list):
+                continue
+            for finding in findings:
+                if not isinstance(finding, dict):
+                    continue
+                candidates = [h for h in hunks if h.filename == finding.get("file")]
+                line = finding.get("line")
+                if isinstance(line, int):
+                    candidates = [h for h in candidates if h.contains(line)]
+                elif len(candidates) != 1:
+                    # A file-level finding only belongs to a hunk if the file has just one
+                    continue
+                for hunk in candidates[:1]:
+                    stored = {k: v for k, v in finding.items() if k != "line"}
+                    if isinstance(line, int):
+                        stored["offset"] = line - hunk.start
+                    per_hunk[id(hunk)].append({"category": category, "finding": stored})
+
+        vectors = self._embed(hunks)
+        now = time.time()
+        rows = []
+        with self._lock:
+            self._load_locked()
+            for hunk, vector in zip(hunks, vectors):
+                findings = per_hunk[id(hunk)]
+                self._entries[(repo_name, hunk.digest())] = {
+                    "filename": hunk.filename, "findings": findings, "vector": vector, "created_at": now,
+                    "pr_number": pr_number,
+                }
+                rows.append((hunk.digest(), repo_name, hunk.filename, json.dumps(findings),
+                             json.dumps(vector) if vector is not None else None, now, pr_number))
+            self._evict_locked()
+        self._persist(rows)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = sum(self.lookups.values())
+            hits = self.lookups["exact"] + self.lookups["near"]
+            return {
+                "entries": len(self._entries),
+                "embedder": getattr(self.embedder, "name", None) if self._embedder != "default" else None,
+                "lookups": dict(self.lookups),
+                "hit_rate": round(hits / total, 3) if total else 0.0,
+                "avg_lookup_ms": round(self.lookup_seconds / total * 1000, 3) if total else 0.0,
+            }
+
+
+# Shared by every crew in the process
+hunk_index = HunkIndex()
@@ -0,0 +1,230 @@
+import contextvars
+import fnmatch
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+from .metrics import LLM_CACHE_ENTRIES, LLM_CACHE_LOOKUPS, LLM_CACHE_TOKENS_SAVED
+from .sharding import estimate_tokens
+
+# (repo_name, bypass) of the run making the current LLM calls; see LLMResponseCache.scope
+_scope: contextvars.ContextVar = contextvars.ContextVar("llm_cache_scope", default=None)
+
+
+def normalize_messages(messages) -> list:
+    """Role and content of each message, with line endings and trailing whitespace normalized."""
+    if isinstance(messages, str):
+        messages = [{"role": "user", "content": messages}]
+    normalized = []
+    for message in messages or []:
+        role = message.get("role", "") if isinstance(message, dict) else ""
+        content = message.get("content", "") if isinstance(message, dict) else message
+        if not isinstance(content, str):
+            content = json.dumps(content, sort_keys=True, default=str)
+        lines = content.replace("\r\n", "\n").split("\n")
+        normalized.append([role, "\n".join(line.rstrip() for line in lines).strip()])
+    return normalized
+
+
+def cache_key(model: str, temperature: Optional[float], messages, tools=None) -> str:
+    material = {
+        "model": model,
+        "temperature": temperature,
+        "messages": normalize_messages(messages),
+        # Function-calling answers depend on which tools were offered
+        "tools": sorted(json.dumps(tool, sort_keys=True, default=str) for tool in tools or []),
+    }
+    return hashlib.sha256(json.dumps(material, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    Memoizes LLM answers for byte-identical prompts.
+
+    Webhook redeliveries, "Redeliver" clicks and reopened PRs re-run the whole
+    crew on the same SHA; with this cache the reviewer, tester and reporter
+    conversations replay from stored answers instead of the API. Keys are
+    sha256(model, temperature, normalized messages, tools). Entries live in an
+    LRU of LLM_CACHE_MAX_ENTRIES and, unless LLM_CACHE_PATH is empty, in a SQLite
+    file shared by every process on the host (at most LLM_CACHE_DISK_MAX_ENTRIES);
+    both expire after LLM_CACHE_TTL seconds.
+
+    Only calls made inside `scope()` use the cache, so a run decides for itself:
+    repositories matching LLM_CACHE_EXCLUDE_REPOS never do, and a forced re-review
+    passes bypass=True to skip lookups (fresh answers are still stored).
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS responses (
+            key TEXT PRIMARY KEY,
+            model TEXT NOT NULL,
+            response TEXT NOT NULL,
+            created_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS responses_created ON responses (created_at);
+    """
+
+    def __init__(self, path: Optional[str] = None, max_entries: Optional[int] = None):
+        self.enabled = os.environ.get("LLM_CACHE", "true").lower() in ("1", "true", "yes")
+        self.path = path if path is not None else os.environ.get("LLM_CACHE_PATH", os.path.join("tmp", "llm_cache.sqlite3"))
+        self.max_entries = max_entries or int(os.environ.get("LLM_CACHE_MAX_ENTRIES", "1000"))
+        self.disk_max_entries = int(os.environ.get("LLM_CACHE_DISK_MAX_ENTRIES", "20000"))
+        self.ttl = float(os.environ.get("LLM_CACHE_TTL", str(24 * 3600)))
+        self.excluded_repos = [
+            pattern.strip() for pattern in os.environ.get("LLM_CACHE_EXCLUDE_REPOS", "").split(",") if pattern.strip()
+        ]
+        self._lock = threading.Lock()
+        # key -> (created_at, response)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._disk_ready = False
+        self._puts = 0
+        self.counts = {"hit": 0, "miss": 0, "bypass": 0}
+        self.tokens_saved = 0
+        LLM_CACHE_ENTRIES.set_function(lambda: {(): len(self._entries)})
+
+    # --- Run scope ---
+
+    @contextmanager
+    def scope(self, repo_name: str, bypass: bool = False):
+        """Let LLM calls made in this context (and in contexts copied from it) use the cache."""
+        token = _scope.set((repo_name, bypass))
+        try:
+            yield
+        finally:
+            _scope.reset(token)
+
+    def repo_excluded(self, repo_name: str) -> bool:
+        return any(fnmatch.fnmatch(repo_name, pattern) for pattern in self.excluded_repos)
+
+    def _active_scope(self):
+        scope = _scope.get()
+        if not self.enabled or scope is None or self.repo_excluded(scope[0]):
+            return None
+        return scope
+
+    # --- SQLite tier ---
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _disk(self) -> bool:
+        if not self.path:
+            return False
+        if not self._disk_ready:
+            try:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                with self._connect() as conn:
+                    conn.executescript(self.SCHEMA)
+                self._disk_ready = True
+            except sqlite3.Error as e:
+                print(f"Warning: LLM cache persistence disabled, cannot use {self.path}: {e}")
+                self.path = ""
+                return False
+        return True
+
+    def _disk_get(self, key: str) -> Optional[tuple]:
+        if not self._disk():
+            return None
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT created_at, response FROM responses WHERE key = ? AND created_at > ?",
+                    (key, time.time() - self.ttl),
+                ).fetchone()
+        except sqlite3.Error as e:
+            print(f"Warning: LLM cache read failed: {e}")
+            return None
+        return tuple(row) if row else None
+
+    def _disk_put(self, key: str, model: str, created_at: float, response: str):
+        if not self._disk():
+            return
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, model, response, created_at) VALUES (?, ?, ?, ?)",
+                    (key, model, response, created_at),
+                )
+                self._puts += 1
+                if self._puts % 100 == 1:
+                    conn.execute("DELETE FROM responses WHERE created_at <= ?", (time.time() - self.ttl,))
+                    conn.execute(
+                        "DELETE FROM responses WHERE key NOT IN "
+                        "(SELECT key FROM responses ORDER BY created_at DESC LIMIT ?)",
+                        (self.disk_max_entries,),
+                    )
+        except sqlite3.Error as e:
+            print(f"Warning: LLM cache write failed: {e}")
+
+    # --- Lookup and store ---
+
+    def _remember_locked(self, key: str, entry: tuple):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, model: str, temperature: Optional[float], messages, tools=None) -> Optional[str]:
+        """The stored answer for this prompt, or None (also outside a scope or when bypassed)."""
+        scope = self._active_scope()
+        if scope is None:
+            return None
+        result = "bypass" if scope[1] else "miss"
+        response = None
+        if not scope[1]:
+            key = cache_key(model, temperature, messages, tools)
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] <= time.time() - self.ttl:
+                    del self._entries[key]
+                    entry = None
+                if entry is not None:
+                    self._entries.move_to_end(key)
+            if entry is None:
+                entry = self._disk_get(key)
+                if entry is not None:
+                    with self._lock:
+                        self._remember_locked(key, entry)
+            if entry is not None:
+                result, response = "hit", entry[1]
+        with self._lock:
+            self.counts[result] += 1
+        LLM_CACHE_LOOKUPS.inc(result=result)
+        if response is not None:
+            saved = estimate_tokens("\n".join(content for _, content in normalize_messages(messages))) + estimate_tokens(response)
+            with self._lock:
+                self.tokens_saved += saved
+            LLM_CACHE_TOKENS_SAVED.inc(saved, model=model)
+        return response
+
+    def put(self, model: str, temperature: Optional[float], messages, response: Any, tools=None):
+        """Store a successful, non-empty text answer of a call made inside a scope."""
+        if self._active_scope() is None or not isinstance(response, str) or not response.strip():
+            return
+        key = cache_key(model, temperature, messages, tools)
+        entry = (time.time(), response)
+        with self._lock:
+            self._remember_locked(key, entry)
+        self._disk_put(key, model, entry[0], response)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.counts["hit"] + self.counts["miss"]
+            return {
+                "entries": len(self._entries),
+                "lookups": dict(self.counts),
+                "hit_rate": round(self.counts["hit"] / lookups, 3) if lookups else 0.0,
+                "tokens_saved": self.tokens_saved,
+            }
+
+
+# Shared by every LLM of the process
+llm_response_cache = LLMResponseCache()
@@ -0,0 +1,342 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+def _format_labels(labelnames: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        (registry or REGISTRY).register(self)
+
+    def _label_values(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.kind}"
+        yield from self._samples()
+
+    def _samples(self):
+        return iter(())
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._label_values(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._label_values(labels), 0.0)
+
+    def _samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+
+
+class Gauge(_Metric):
+    """A settable value; alternatively `set_function` computes it at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._function: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None
+
+    def set(self, value: float, **labels):
+        key = self._label_values(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, function: Callable[[], Dict[Tuple[str, ...], float]]):
+        """`function` returns {label_values_tuple: value}; use () as the key for unlabelled gauges."""
+        self._function = function
+
+    def _samples(self):
+        if self._function is not None:
+            items = list(self._function().items())
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: Iterable[float] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        self._counts: Dict[Tuple[str, ...], list] = {}
+        self._sums: Dict[Tuple[str, ...], float] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._label_values(labels)
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * (len(self.buckets) + 1))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-1] += 1
+            self._sums[key] = self._sums.get(key, 0.0) + value
+
+    @contextmanager
+    def time(self, **labels):
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started_at, **labels)
+
+    def _samples(self):
+        with self._lock:
+            items = [(key, list(counts), self._sums[key]) for key, counts in self._counts.items()]
+        for key, counts, total in items:
+            for bound, count in zip(self.buckets, counts):
+                labels = _format_labels(self.labelnames, key, 'le="%s"' % bound)
+                yield f"{self.name}_bucket{labels} {count}"
+            labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            yield f"{self.name}_bucket{labels} {counts[-1]}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {counts[-1]}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric):
+        with self._lock:
+            self._metrics.append(metric)
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def serve_metrics(port: int, host: str = "0.0.0.0", registry: Optional["Registry"] = None):
+    """
+    Serve GET /metrics from a daemon thread, for processes without the Flask app
+    (dedicated queue workers). Returns the server; its port is server.server_address[1].
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    source = registry or REGISTRY
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = source.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+class ErrorRateWindow:
+    """Success/failure outcomes over a sliding time window."""
+
+    def __init__(self, window_seconds: float = 300.0):
+        self.window_seconds = window_seconds
+        self._events: deque = deque()
+        self._lock = threading.Lock()
+
+    def record(self, ok: bool):
+        now = time.time()
+        with self._lock:
+            self._events.append((now, ok))
+            self._trim(now)
+
+    def _trim(self, now: float):
+        while self._events and self._events[0][0] < now - self.window_seconds:
+            self._events.popleft()
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            self._trim(time.time())
+            total = len(self._events)
+            errors = sum(1 for _, ok in self._events if not ok)
+        return {
+            "window_seconds": self.window_seconds,
+            "calls": total,
+            "errors": errors,
+            "error_rate": round(errors / total, 4) if total else 0.0,
+        }
+
+
+REGISTRY = Registry()
+
+# --- Hot-path instrumentation shared across the watcher, crew and tools ---
+
+SPAN_SECONDS = Histogram(
+    "ai_tech_lead_span_seconds",
+    "Duration of instrumented pipeline spans.",
+    labelnames=("span",),
+)
+STAGE_SECONDS = Histogram(
+    "ai_tech_lead_stage_seconds",
+    "Duration of agent task stages by stage and model.",
+    labelnames=("stage", "model"),
+)
+LLM_CALL_SECONDS = Histogram(
+    "ai_tech_lead_llm_call_seconds",
+    "Duration of individual LLM calls.",
+    labelnames=("model", "outcome"),
+)
+LLM_TOKENS = Counter(
+    "ai_tech_lead_llm_tokens_total",
+    "Estimated LLM tokens by direction (prompt or completion).",
+    labelnames=("model", "direction"),
+)
+LLM_ERRORS = Counter(
+    "ai_tech_lead_llm_errors_total",
+    "LLM calls that raised an error.",
+    labelnames=("model",),
+)
+WEBHOOKS = Counter(
+    "ai_tech_lead_webhooks_total",
+    "Webhook deliveries by outcome.",
+    labelnames=("outcome",),
+)
+JOBS_FINISHED = Counter(
+    "ai_tech_lead_jobs_total",
+    "Finished jobs by final status.",
+    labelnames=("status",),
+)
+GITHUB_RATE_LIMIT_REMAINING = Gauge(
+    "ai_tech_lead_github_rate_limit_remaining",
+    "GitHub API requests left in the current rate-limit window (X-RateLimit-Remaining).",
+)
+GITHUB_THROTTLED = Counter(
+    "ai_tech_lead_github_throttled_total",
+    "GitHub requests delayed by the rate-limit scheduler, by priority.",
+    labelnames=("priority",),
+)
+DIFF_SKIPPED_BYTES = Counter(
+    "ai_tech_lead_diff_skipped_bytes_total",
+    "Patch bytes kept out of prompts by the diff filter, by reason.",
+    labelnames=("reason",),
+)
+DIFF_SKIPPED_TOKENS = Counter(
+    "ai_tech_lead_diff_skipped_tokens_total",
+    "Estimated prompt tokens kept out of prompts by the diff filter, by reason.",
+    labelnames=("reason",),
+)
+VERIFY_SUITES = Counter(
+    "ai_tech_lead_verify_suites_total",
+    "Generated test suites verified against the PR head, by outcome and whether the result was cached.",
+    labelnames=("outcome", "cached"),
+)
+REVIEW_OUTPUT_PARSES = Counter(
+    "ai_tech_lead_review_output_parses_total",
+    "Reviewer answers parsed, by method (clean, repaired, reformatted, failed).",
+    labelnames=("method",),
+)
+LLM_RETRIES_AVOIDED = Counter(
+    "ai_tech_lead_llm_retries_avoided_total",
+    "Review re-runs avoided because malformed output was repaired locally or by a reformat-only call.",
+    labelnames=("via",),
+)
+HUNK_LOOKUPS = Counter(
+    "ai_tech_lead_hunk_lookups_total",
+    "Diff hunks looked up in the cross-PR hunk index, by result (exact, near, miss).",
+    labelnames=("result",),
+)
+HUNK_LOOKUP_SECONDS = Histogram(
+    "ai_tech_lead_hunk_lookup_seconds",
+    "Time to look up all hunks of a PR in the hunk index.",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0),
+)
+HUNK_INDEX_ENTRIES = Gauge(
+    "ai_tech_lead_hunk_index_entries",
+    "Reviewed hunks held in the in-memory hunk index.",
+)
+REVIEW_POSTS = Counter(
+    "ai_tech_lead_review_posts_total",
+    "GitHub writes by the review publisher, by action (summary_created, summary_updated, summary_unchanged, review_created, review_rejected).",
+    labelnames=("action",),
+)
+LLM_CACHE_LOOKUPS = Counter(
+    "ai_tech_lead_llm_cache_lookups_total",
+    "LLM response cache lookups, by result (hit, miss, bypass).",
+    labelnames=("result",),
+)
+LLM_CACHE_TOKENS_SAVED = Counter(
+    "ai_tech_lead_llm_cache_tokens_saved_total",
+    "Estimated prompt and completion tokens not sent to the LLM thanks to cached responses.",
+    labelnames=("model",),
+)
+LLM_CACHE_ENTRIES = Gauge(
+    "ai_tech_lead_llm_cache_entries",
+    "Responses held in the in-memory LLM response cache.",
+)
+LLM_DISPATCH_EVENTS = Counter(
+    "ai_tech_lead_llm_dispatch_events_total",
+    "LLM dispatcher events: hedge_sent/hedge_won, failover_sent/failover_won, rerouted, breaker_opened.",
+    labelnames=("event",),
+)
+LLM_BREAKER_OPEN = Gauge(
+    "ai_tech_lead_llm_breaker_open",
+    "1 while a model's circuit breaker is open or half-open, else 0.",
+    labelnames=("model",),
+)
+
+llm_error_window = ErrorRateWindow()
+
+
+@contextmanager
+def span(name: str):
+    """Time a block of code into the ai_tech_lead_span_seconds histogram."""
+    with SPAN_SECONDS.time(span=name):
+        yield
@@ -1,13 +1,21 @@
-import json
-from typing import Dict, Any
+from typing import Callable, Dict, Any, Optional
+
+from .structured_output import review_output_parser
 
 
 class CrewAIResultAdapter:
     """
     Adapts the raw output from a CrewAI workflow into a structured format
     suitable for the Reviewer Server.
+
+    Review output that is not clean JSON is repaired locally (fences, prose,
+    truncation, trailing commas); only if that fails is `reformatter`, a small
+    "reformat only" LLM call such as agents.reformat_review_output, asked to fix it.
     """
 
+    def __init__(self, reformatter: Optional[Callable[[str], str]] = None):
+        self.reformatter = reformatter
+
     def transform_crew_results(self, crew_results: Dict[str, Any], pr_info: Dict[str, Any]) -> Dict[str, Any]:
         """
         Transforms the raw CrewAI results into the final JSON payload.
@@ -40,16 +48,16 @@ class CrewAIResultAdapter:
 
         review_output = crew_results.get('review_results', {})
 
-        # If review_output is a string, try to parse it as JSON
+        # If review_output is a string, extract (and if needed repair) the JSON object in it
         if isinstance(review_output, str):
-            try:
-                review_output = json.loads(review_output)
-            except json.JSONDecodeError:
-                # If it's not valid JSON, use it as a summary
+            parsed, _ = review_output_parser.parse(review_output, reformatter=self.reformatter)
+            if parsed is None:
+                # Neither repair nor the reformat-only call produced a review; use it as a summary
                 return {
                     "summary": "Code review produced an invalid output format.",
                     "raw_output": review_output
                 }
+            review_output = parsed
 
         # Structure the analysis based on expected keys from CodeReviewTool
         analysis = {
@@ -72,6 +80,13 @@ class CrewAIResultAdapter:
                         "description": issue
                     })
 
+        if isinstance(review_output.get("optimization_recommendations"), list):
+            for recommendation in review_output["optimization_recommendations"]:
+                analysis["recommendations"].append({
+                    "category": "Optimization",
+                    "description": recommendation
+                })
+
         # Add positive aspects as recommendations
         if "positive_aspects" in review_output and isinstance(review_output["positive_aspects"], list):
             for positive in review_output["positive_aspects"]:
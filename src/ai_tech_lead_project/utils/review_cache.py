@@ -0,0 +1,178 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+
+# Marker the tester agent places before each file's tests so the suite can be split per file
+TEST_SECTION_MARKER = "# === Tests for {filename} ==="
+_TEST_SECTION_RE = re.compile(r"^# === Tests for (?P<filename>.+?) ===\s*$", re.MULTILINE)
+
+TESTS_SKIPPED_MESSAGE = "Tests SKIPPED due to non-testable code."
+
+
+def file_fingerprint(file: Dict[str, Any]) -> str:
+    """Hash of a file's patch as returned in comparison.files (filename included)."""
+    payload = f"{file['filename']}\0{file.get('patch') or ''}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def split_review_by_file(review: Dict[str, Any], filenames: List[str]) -> Optional[Dict[str, Dict[str, list]]]:
+    """
+    Group list-valued review categories by the `file` each finding refers to.
+
+    Returns None when some finding cannot be attributed to one of the files.
+    """
+    per_file: Dict[str, Dict[str, list]] = {name: {} for name in filenames}
+    for category, findings in review.items():
+        if not isinstance(findings, list):
+            continue
+        for finding in findings:
+            if not isinstance(finding, dict) or finding.get("file") not in per_file:
+                return None
+            per_file[finding["file"]].setdefault(category, []).append(finding)
+    return per_file
+
+
+def split_tests_by_file(tests: str, filenames: List[str]) -> Optional[Dict[str, str]]:
+    """
+    Split a generated test suite into per-file sections using TEST_SECTION_MARKER.
+
+    Returns None when the suite cannot be attributed to files (no markers).
+    """
+    per_file = {name: "" for name in filenames}
+    stripped = (tests or "").strip()
+    if not stripped or stripped == TESTS_SKIPPED_MESSAGE:
+        return per_file
+
+    matches = list(_TEST_SECTION_RE.finditer(tests))
+    if not matches:
+        return None
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(tests)
+        filename = match.group("filename").strip()
+        if filename in per_file:
+            per_file[filename] += tests[match.end():end].strip("\n") + "\n"
+    return per_file
+
+
+def merge_reviews(fresh: Optional[Dict[str, Any]], cached: List[Dict[str, list]]) -> Dict[str, Any]:
+    """Combine the LLM's review of changed files with other list-valued findings (cached files, other shards)."""
+    merged: Dict[str, Any] = dict(fresh or {})
+    for findings_by_category in cached:
+        for category, findings in findings_by_category.items():
+            if not isinstance(findings, list):
+                continue
+            existing = merged.get(category)
+            merged[category] = (existing if isinstance(existing, list) else []) + list(findings)
+    return merged
+
+
+def merge_tests(fresh: str, cached: List[Tuple[str, str]]) -> str:
+    """Append cached per-file test sections to the freshly generated suite."""
+    sections = []
+    fresh = (fresh or "").strip()
+    if fresh and fresh != TESTS_SKIPPED_MESSAGE:
+        sections.append(fresh)
+    for filename, code in cached:
+        if code.strip():
+            sections.append(TEST_SECTION_MARKER.format(filename=filename) + "\n" + code.strip())
+    if not sections:
+        return TESTS_SKIPPED_MESSAGE
+    return "\n\n".join(sections) + "\n"
+
+
+class FileReviewCache:
+    """
+    Per-file store of reviewer findings and generated tests.
+
+    Entries are keyed by (repo, file fingerprint), so a synchronize push that
+    leaves a file's patch untouched reuses the previous run's output for it.
+    The in-memory tier is an LRU bounded by entry count; REVIEW_CACHE_DIR adds
+    an optional on-disk tier.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, disk_dir: Optional[str] = None):
+        self.max_entries = max_entries or int(os.environ.get("REVIEW_CACHE_MAX_ENTRIES", "5000"))
+        self.disk_dir = disk_dir if disk_dir is not None else os.environ.get("REVIEW_CACHE_DIR", "")
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(repo_name: str, fingerprint: str) -> str:
+        return hashlib.sha256(f"{repo_name}\0{fingerprint}".encode("utf-8")).hexdigest()
+
+    def get(self, repo_name: str, file: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        key = self._key(repo_name, file_fingerprint(file))
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        if not self.disk_dir:
+            return None
+        try:
+            with open(os.path.join(self.disk_dir, f"{key}.json"), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        self._remember(key, entry)
+        return entry
+
+    def put(self, repo_name: str, file: Dict[str, Any], findings: Dict[str, list], tests: str):
+        key = self._key(repo_name, file_fingerprint(file))
+        entry = {"filename": file["filename"], "findings": findings, "tests": tests}
+        self._remember(key, entry)
+        if self.disk_dir:
+            path = os.path.join(self.disk_dir, f"{key}.json")
+            try:
+                with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+                    json.dump(entry, f)
+                os.replace(f"{path}.tmp", path)
+            except OSError as e:
+                print(f"Warning: could not persist review cache entry for {file['filename']}: {e}")
+
+    def _remember(self, key: str, entry: Dict[str, Any]):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def partition(self, repo_name: str, files: List[Dict[str, Any]]):
+        """Split files into (cached [(file, entry)], changed [file])."""
+        cached, changed = [], []
+        for file in files:
+            entry = self.get(repo_name, file)
+            if entry is None:
+                changed.append(file)
+            else:
+                cached.append((file, entry))
+        return cached, changed
+
+    def store_run(self, repo_name: str, files: List[Dict[str, Any]], review: Optional[Dict[str, Any]], tests: str) -> int:
+        """
+        Record per-file output of a run. Files are only cached when every finding and
+        the test suite could be attributed per file; otherwise a cached file would come
+        back without the findings that were dropped. Returns the number stored.
+        """
+        if review is None:
+            return 0
+        filenames = [f["filename"] for f in files]
+        tests_by_file = split_tests_by_file(tests, filenames)
+        if tests_by_file is None:
+            return 0
+        findings_by_file = split_review_by_file(review, filenames)
+        if findings_by_file is None:
+            return 0
+        for file in files:
+            self.put(repo_name, file, findings_by_file[file["filename"]], tests_by_file[file["filename"]])
+        return len(files)
+
+
+# Shared instance used by all crew runs in this process
+review_cache = FileReviewCache()
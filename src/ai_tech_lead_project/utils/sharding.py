@@ -0,0 +1,59 @@
+import os
+from typing import Any, Dict, List, Optional
+
+
+# Prompt text surrounding the diff (instructions, JSON example, agent backstory)
+PROMPT_OVERHEAD_TOKENS = 2000
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token for code and English)."""
+    return (len(text) + 3) // 4 if text else 0
+
+
+def file_tokens(file: Dict[str, Any]) -> int:
+    """Estimated prompt tokens for one file of a comparison, including its diff header."""
+    return estimate_tokens(file.get("patch") or "") + estimate_tokens(file["filename"]) * 2 + 20
+
+
+def shard_token_budget(model_info: Optional[Dict[str, Any]]) -> int:
+    """
+    Maximum diff tokens per shard for a model from the catalog.
+
+    The review JSON and the generated tests grow with the input, so the output
+    limit usually binds before the input limit: REVIEW_OUTPUT_RATIO is the
+    expected output tokens per input token. REVIEW_SHARD_MAX_TOKENS caps the
+    result further, e.g. to trade more shards for lower per-shard latency.
+    """
+    input_limit = (model_info or {}).get("input_token_limit", 32768)
+    output_limit = (model_info or {}).get("output_token_limit", 8192)
+    output_ratio = float(os.environ.get("REVIEW_OUTPUT_RATIO", "2.0"))
+
+    budget = min(input_limit - PROMPT_OVERHEAD_TOKENS, int(output_limit / output_ratio))
+    override = os.environ.get("REVIEW_SHARD_MAX_TOKENS")
+    if override:
+        budget = min(budget, int(override))
+    return max(1, budget)
+
+
+def pack_shards(files: List[Dict[str, Any]], budget: int) -> List[List[Dict[str, Any]]]:
+    """
+    Pack files into shards of at most `budget` estimated tokens (first-fit decreasing).
+
+    A file larger than the budget gets a shard of its own. Files keep their
+    original diff order within each shard.
+    """
+    order = {f["filename"]: i for i, f in enumerate(files)}
+    shards: List[List[Dict[str, Any]]] = []
+    loads: List[int] = []
+    for file in sorted(files, key=file_tokens, reverse=True):
+        tokens = file_tokens(file)
+        for i, load in enumerate(loads):
+            if load + tokens <= budget:
+                shards[i].append(file)
+                loads[i] += tokens
+                break
+        else:
+            shards.append([file])
+            loads.append(tokens)
+    return [sorted(shard, key=lambda f: order[f["filename"]]) for shard in shards]
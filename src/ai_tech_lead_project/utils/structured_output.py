@@ -0,0 +1,242 @@
+import re
+import json
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .metrics import LLM_RETRIES_AVOIDED, REVIEW_OUTPUT_PARSES
+
+# List-valued categories of the reviewer's JSON answer (see tasks.review_pr_task)
+REVIEW_CATEGORIES = (
+    "style_issues", "documentation_issues", "potential_bugs", "error_handling_issues",
+    "security_concerns", "performance_issues", "optimization_recommendations", "positive_aspects",
+)
+
+_FENCE_RE = re.compile(r"```[a-zA-Z]*\s*(.*?)(?:```|$)", re.DOTALL)
+_PYTHON_LITERALS = {"True": "true", "False": "false", "None": "null"}
+_CLOSERS = {"{": "}", "[": "]"}
+_DANGLING_KEY_RE = re.compile(r'([,{])\s*"(?:[^"\\]|\\.)*"\s*:?\s*$')
+
+
+def _strip_fences(text: str) -> str:
+    """Contents of the first fenced block holding an object, else the text itself (an unclosed fence counts)."""
+    for match in _FENCE_RE.finditer(text):
+        if "{" in match.group(1):
+            return match.group(1)
+    return text
+
+
+def _last_significant(out: List[str]) -> str:
+    for ch in reversed(out):
+        if not ch.isspace():
+            return ch
+    return ""
+
+
+def _scan(text: str, start: int) -> Tuple[str, List[str], bool]:
+    """
+    Copy the JSON value starting at text[start] ('{'), normalizing on the way:
+    trailing commas are dropped, missing values (`"key":,`) become null and
+    Python literals become JSON ones. Stops after the matching '}'.
+
+    Returns (copied, open_brackets, inside_string); open_brackets is empty when
+    the object was complete.
+    """
+    out: List[str] = []
+    stack: List[str] = []
+    in_string = escaped = False
+    i = start
+    while i < len(text):
+        ch = text[i]
+        if in_string:
+            out.append(ch)
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            i += 1
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in _CLOSERS:
+            stack.append(_CLOSERS[ch])
+        elif ch in "}]":
+            if stack and stack[-1] == ch:
+                stack.pop()
+            # Drop a comma left in front of the closer
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ",":
+                out.pop()
+            if out and out[-1] == ":":
+                out.append(" null")
+            out.append(ch)
+            if not stack:
+                return "".join(out), [], False
+            i += 1
+            continue
+        elif ch == "," and _last_significant(out) == ":":
+            out.append(" null")
+        elif ch.isalpha():
+            word = re.match(r"[A-Za-z]+", text[i:]).group(0)
+            out.append(_PYTHON_LITERALS.get(word, word))
+            i += len(word)
+            continue
+        out.append(ch)
+        i += 1
+    return "".join(out), stack, in_string
+
+
+def _close_truncated(fragment: str, stack: List[str], in_string: bool) -> str:
+    """Finish a value cut off mid-way (e.g. by the output token limit)."""
+    if in_string:
+        fragment += '"'
+    fragment = fragment.rstrip()
+    if stack[-1] == "}":
+        # A key cut off before its value is dropped
+        fragment = _DANGLING_KEY_RE.sub(r"\1", fragment)
+    if fragment.endswith(":"):
+        fragment += " null"
+    fragment = fragment.rstrip(",").rstrip()
+    for closer in reversed(stack):
+        fragment = fragment.rstrip().rstrip(",") + closer
+    return fragment
+
+
+def extract_json_object(raw: str, max_candidates: int = 5) -> Tuple[Optional[Dict[str, Any]], bool]:
+    """
+    Find the outermost JSON object in an LLM answer and parse it.
+
+    Tolerates Markdown fences, prose before and after the object, trailing
+    commas, missing values, Python literals and truncation. Returns
+    (object or None, repaired); `repaired` is False when the answer was
+    already valid JSON.
+    """
+    if not raw or not raw.strip():
+        return None, False
+    text = raw.strip()
+    try:
+        parsed = json.loads(text)
+        if isinstance(parsed, dict):
+            return parsed, False
+    except json.JSONDecodeError:
+        pass
+
+    text = _strip_fences(text)
+    start = text.find("{")
+    for _ in range(max_candidates):
+        if start < 0:
+            break
+        fragment, stack, in_string = _scan(text, start)
+        if stack:
+            fragment = _close_truncated(fragment, stack, in_string)
+        try:
+            parsed = json.loads(fragment)
+        except json.JSONDecodeError:
+            parsed = None
+        if isinstance(parsed, dict):
+            return parsed, True
+        # Prose may contain braces of its own; try the next opening brace
+        start = text.find("{", start + 1)
+    return None, False
+
+
+def validate_review(data: Any) -> Optional[Dict[str, Any]]:
+    """
+    Check a parsed answer against the review schema and normalize it.
+
+    Every REVIEW_CATEGORIES entry becomes a list of findings (null -> [], a lone
+    finding -> [finding]), `summary` a string and `overall_score` a number.
+    Returns None when the object carries none of the review fields.
+    """
+    if not isinstance(data, dict):
+        return None
+    if not any(key in data for key in REVIEW_CATEGORIES + ("summary", "overall_score")):
+        return None
+    review = dict(data)
+    for category in REVIEW_CATEGORIES:
+        if category not in review:
+            continue
+        findings = review[category]
+        if findings is None:
+            findings = []
+        elif not isinstance(findings, list):
+            findings = [findings]
+        review[category] = [f if isinstance(f, (dict, str)) else str(f) for f in findings if f is not None]
+    if "summary" in review and not isinstance(review["summary"], str):
+        review["summary"] = json.dumps(review["summary"])
+    if "overall_score" in review:
+        try:
+            review["overall_score"] = float(review["overall_score"])
+        except (TypeError, ValueError):
+            del review["overall_score"]
+    return review
+
+
+def reformat_prompt(raw: str, max_chars: int) -> str:
+    """Prompt for the small "reformat only" LLM call used when local repair fails."""
+    return (
+        "Reformat the code review below into a single valid JSON object. Use only these keys: "
+        + ", ".join(REVIEW_CATEGORIES)
+        + ", summary, overall_score. Each category is a list of objects with `file`, `line` and `description`. "
+        "Do not add, drop or reword findings. Answer with the JSON object only, without a code fence.\n\n"
+        "Code review:\n" + raw[:max_chars]
+    )
+
+
+class ReviewOutputParser:
+    """
+    Turns the reviewer's raw answer into a validated review dict, as cheaply as possible:
+
+    1. `json.loads` (clean),
+    2. local extraction and repair (repaired),
+    3. only then a small "reformat only" LLM call through `reformatter(raw) -> str` (reformatted).
+
+    Each repaired or reformatted answer is one full review re-run avoided, counted
+    in ai_tech_lead_llm_retries_avoided_total.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {"clean": 0, "repaired": 0, "reformatted": 0, "failed": 0}
+
+    def _record(self, method: str):
+        with self._lock:
+            self.counts[method] += 1
+        REVIEW_OUTPUT_PARSES.inc(method=method)
+        if method in ("repaired", "reformatted"):
+            LLM_RETRIES_AVOIDED.inc(via=method)
+
+    def parse(self, raw: str, reformatter: Optional[Callable[[str], str]] = None) -> Tuple[Optional[Dict[str, Any]], str]:
+        """Returns (review or None, method) with method one of clean/repaired/reformatted/failed."""
+        raw = raw if isinstance(raw, str) else str(raw or "")
+
+        data, repaired = extract_json_object(raw)
+        review = validate_review(data)
+        if review is not None:
+            method = "repaired" if repaired else "clean"
+            self._record(method)
+            return review, method
+
+        if reformatter is not None and raw.strip():
+            try:
+                data, _ = extract_json_object(reformatter(raw))
+                review = validate_review(data)
+            except Exception as e:
+                print(f"Reformat-only LLM call failed: {e}")
+                review = None
+            if review is not None:
+                self._record("reformatted")
+                return review, "reformatted"
+
+        self._record("failed")
+        return None, "failed"
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.counts)
+
+
+# Shared by the crew and CrewAIResultAdapter so the counts cover the whole process
+review_output_parser = ReviewOutputParser()
@@ -0,0 +1,429 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import signal
+import subprocess
+import sys
+import tarfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .metrics import VERIFY_SUITES, span
+from .review_cache import TESTS_SKIPPED_MESSAGE, split_tests_by_file
+
+try:
+    import resource
+except ImportError:  # Windows: no rlimits, the wall-clock timeout still applies
+    resource = None
+
+OUTCOMES = ("passed", "failed", "collection_error", "timeout", "no_tests", "error")
+
+_COUNT_RE = re.compile(r"(\d+) (passed|failed|errors?|skipped|xfailed|xpassed)")
+
+
+def code_hash(code: str) -> str:
+    return hashlib.sha256(code.encode("utf-8")).hexdigest()
+
+
+def split_suites(test_output: str, filenames: List[str]) -> List[Tuple[str, str]]:
+    """
+    Split the tester's output into independently runnable suites, one per source
+    file (TEST_SECTION_MARKER). Output without markers is run as one suite.
+    Returns [(name, code)] for the non-empty suites.
+    """
+    stripped = (test_output or "").strip()
+    if not stripped or stripped == TESTS_SKIPPED_MESSAGE:
+        return []
+    # Strip a Markdown fence the tester sometimes wraps its answer in
+    fence = re.fullmatch(r"```(?:python)?\s*(.*?)```", stripped, re.DOTALL)
+    if fence:
+        stripped = fence.group(1).strip()
+    per_file = split_tests_by_file(stripped, filenames)
+    if per_file is None:
+        return [("all", stripped + "\n")]
+    return [(name, code) for name, code in per_file.items() if code.strip()]
+
+
+def _summarize_counts(output: str) -> Dict[str, int]:
+    counts: Dict[str, int] = {}
+    # The summary is the last line pytest prints; earlier lines may quote test names
+    for line in reversed(output.strip().splitlines()):
+        found = _COUNT_RE.findall(line)
+        if found:
+            for number, kind in found:
+                counts["errors" if kind.startswith("error") else kind] = int(number)
+            break
+    return counts
+
+
+def _outcome(returncode: int, counts: Dict[str, int]) -> str:
+    # pytest exit codes: 0 all passed, 1 some failed, 2 interrupted (collection errors), 5 nothing collected
+    if returncode == 0:
+        return "passed"
+    if returncode == 1:
+        return "collection_error" if counts.get("errors") and not counts.get("failed") else "failed"
+    if returncode == 2:
+        return "collection_error"
+    if returncode == 5:
+        return "no_tests"
+    return "error"
+
+
+class VerificationCache:
+    """
+    Results of previous suite runs keyed by (head SHA, test-code hash).
+
+    The same suite against the same commit always gives the same answer, so
+    re-deliveries, retried jobs and cached per-file tests of a re-review skip
+    the run entirely. The in-memory tier is an LRU bounded by
+    VERIFY_CACHE_MAX_ENTRIES; VERIFY_CACHE_DIR adds an optional on-disk tier.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, disk_dir: Optional[str] = None):
+        self.max_entries = max_entries or int(os.environ.get("VERIFY_CACHE_MAX_ENTRIES", "5000"))
+        self.disk_dir = disk_dir if disk_dir is not None else os.environ.get("VERIFY_CACHE_DIR", "")
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(repo_name: str, head_sha: str, code: str) -> str:
+        return hashlib.sha256(f"{repo_name}\0{head_sha}\0{code_hash(code)}".encode("utf-8")).hexdigest()
+
+    def get(self, repo_name: str, head_sha: str, code: str) -> Optional[Dict[str, Any]]:
+        key = self._key(repo_name, head_sha, code)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        if not self.disk_dir:
+            return None
+        try:
+            with open(os.path.join(self.disk_dir, f"{key}.json"), "r", encoding="utf-8") as f:
+                result = json.load(f)
+        except (OSError, ValueError):
+            return None
+        self._remember(key, result)
+        return result
+
+    def put(self, repo_name: str, head_sha: str, code: str, result: Dict[str, Any]):
+        key = self._key(repo_name, head_sha, code)
+        self._remember(key, result)
+        if self.disk_dir:
+            path = os.path.join(self.disk_dir, f"{key}.json")
+            try:
+                with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+                    json.dump(result, f)
+                os.replace(f"{path}.tmp", path)
+            except OSError as e:
+                print(f"Warning: could not persist verification result for {result.get('suite')}: {e}")
+
+    def _remember(self, key: str, result: Dict[str, Any]):
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+def safe_extract(archive_path: str, dest_dir: str):
+    """
+    Extract a GitHub source tarball into `dest_dir`, dropping the archive's
+    top-level `owner-repo-sha/` directory. Only regular files and directories
+    are extracted; absolute paths, `..` components and links are skipped.
+    """
+    root = os.path.realpath(dest_dir)
+    with tarfile.open(archive_path, "r:*") as archive:
+        for member in archive:
+            parts = member.name.split("/", 1)
+            if len(parts) < 2 or not parts[1]:
+                continue
+            relative = parts[1]
+            if relative.startswith("/") or ".." in relative.split("/"):
+                continue
+            target = os.path.realpath(os.path.join(root, relative))
+            if not target.startswith(root + os.sep):
+                continue
+            if member.isdir():
+                os.makedirs(target, exist_ok=True)
+            elif member.isfile():
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                source = archive.extractfile(member)
+                with open(target, "wb") as f:
+                    shutil.copyfileobj(source, f)
+                os.chmod(target, 0o755 if member.mode & 0o111 else 0o644)
+
+
+def _limit_command(prlimit: Optional[str], cpu_seconds: int, memory_bytes: int) -> List[str]:
+    """`prlimit` arguments that start the suite under CPU and address-space limits, if the tool exists."""
+    if not prlimit:
+        return []
+    command = [prlimit]
+    if cpu_seconds:
+        command.append(f"--cpu={cpu_seconds}:{cpu_seconds + 1}")
+    if memory_bytes:
+        command.append(f"--as={memory_bytes}")
+    return command + ["--"]
+
+
+def _limit_process(pid: int, cpu_seconds: int, memory_bytes: int):
+    """Fallback without the `prlimit` tool: set the limits on the freshly spawned process."""
+    if resource is None or not hasattr(resource, "prlimit"):
+        return
+    try:
+        if cpu_seconds:
+            resource.prlimit(pid, resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + 1))
+        if memory_bytes:
+            resource.prlimit(pid, resource.RLIMIT_AS, (memory_bytes, memory_bytes))
+    except OSError as e:
+        # The process may already be gone
+        print(f"Warning: could not limit suite process {pid}: {e}")
+
+
+class SuiteVerifier:
+    """
+    Runs the tester agent's generated pytest suites against the PR head.
+
+    The head commit is downloaded as a source tarball into VERIFY_WORKDIR (the
+    last VERIFY_MAX_CHECKOUTS checkouts are kept), each suite is written next
+    to it and run by `python -m pytest` in its own process with a minimal
+    environment, RLIMIT_CPU / RLIMIT_AS limits and a wall-clock timeout. At most
+    VERIFY_MAX_PARALLEL suites run at once across every crew in the process, and
+    results are cached in a VerificationCache.
+
+    None of that isolates the suite: it runs code from the PR head (conftest.py,
+    the package itself) as the server's user, which can read the server's
+    /proc/<pid>/environ, .env and tmp/ stores and reach the network. Suites
+    therefore only run inside the external sandbox named by VERIFY_COMMAND_PREFIX
+    (e.g. `firejail --quiet --net=none --private`); without one, verify() refuses
+    unless VERIFY_ALLOW_UNSANDBOXED=true (local experiments on trusted code only).
+    """
+
+    def __init__(self, cache: Optional[VerificationCache] = None):
+        self.max_parallel = int(os.environ.get("VERIFY_MAX_PARALLEL", str(max(1, (os.cpu_count() or 2) // 2))))
+        self.timeout = float(os.environ.get("VERIFY_TIMEOUT", "60"))
+        self.cpu_seconds = int(os.environ.get("VERIFY_CPU_SECONDS", "60"))
+        self.memory_bytes = int(os.environ.get("VERIFY_MEMORY_MB", "1024")) * 1024 * 1024
+        self.workdir = os.environ.get("VERIFY_WORKDIR", os.path.join("tmp", "verify"))
+        self.max_checkouts = int(os.environ.get("VERIFY_MAX_CHECKOUTS", "8"))
+        self.output_chars = int(os.environ.get("VERIFY_OUTPUT_CHARS", "2000"))
+        self.command_prefix = os.environ.get("VERIFY_COMMAND_PREFIX", "").split()
+        self.allow_unsandboxed = os.environ.get("VERIFY_ALLOW_UNSANDBOXED", "false").lower() in ("1", "true", "yes")
+        # Limits are applied by exec'ing through prlimit(1): a preexec_fn can deadlock a threaded server
+        self.prlimit = os.environ.get("VERIFY_PRLIMIT", shutil.which("prlimit") or "")
+        self.python = os.environ.get("VERIFY_PYTHON", sys.executable)
+        self.cache = cache or VerificationCache()
+
+        # Shared by every crew in the process so verification load stays bounded
+        self._slots = threading.BoundedSemaphore(self.max_parallel)
+        self._lock = threading.Lock()
+        # checkout dir -> lock, and LRU of finished checkouts
+        self._checkout_locks: Dict[str, threading.Lock] = {}
+        self._checkouts: OrderedDict = OrderedDict()
+        self._in_use: Dict[str, int] = {}
+
+    # --- Checkouts ---
+
+    def _checkout_dir(self, repo_name: str, head_sha: str) -> str:
+        return os.path.join(self.workdir, repo_name.replace("/", "__"), head_sha)
+
+    def _acquire_checkout(self, repo_name: str, head_sha: str, fetch_source: Callable[[str], Any]) -> str:
+        """Return an extracted checkout of `head_sha`, downloading it once per SHA."""
+        path = self._checkout_dir(repo_name, head_sha)
+        with self._lock:
+            lock = self._checkout_locks.setdefault(path, threading.Lock())
+            self._in_use[path] = self._in_use.get(path, 0) + 1
+        try:
+            with lock:
+                if not os.path.isdir(path):
+                    staging = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+                    os.makedirs(staging)
+                    archive = os.path.join(staging, "source.tar.gz")
+                    try:
+                        with span("verify_checkout"):
+                            fetch_source(archive)
+                            source_dir = os.path.join(staging, "src")
+                            os.makedirs(source_dir)
+                            safe_extract(archive, source_dir)
+                        os.replace(source_dir, path)
+                    finally:
+                        shutil.rmtree(staging, ignore_errors=True)
+        except BaseException:
+            self._release_checkout(path)
+            raise
+        with self._lock:
+            self._checkouts[path] = True
+            self._checkouts.move_to_end(path)
+        return path
+
+    def _release_checkout(self, path: str):
+        with self._lock:
+            self._in_use[path] -= 1
+            if not self._in_use[path]:
+                del self._in_use[path]
+            # Evict the oldest checkouts nobody is running suites in
+            evictable = [p for p in self._checkouts if p not in self._in_use]
+            doomed = evictable[:max(0, len(self._checkouts) - self.max_checkouts)]
+            for p in doomed:
+                del self._checkouts[p]
+                self._checkout_locks.pop(p, None)
+        for p in doomed:
+            shutil.rmtree(p, ignore_errors=True)
+
+    # --- Running suites ---
+
+    def _environment(self, checkout: str, home: str) -> Dict[str, str]:
+        # Deliberately minimal: generated code never sees GITHUB_ACCESS_TOKEN, GEMINI_API_KEY, ...
+        return {
+            "PATH": os.environ.get("PATH", "/usr/bin:/bin"),
+            "HOME": home,
+            "LANG": "C.UTF-8",
+            "PYTHONPATH": os.pathsep.join([checkout, os.path.join(checkout, "src")]),
+            "PYTHONDONTWRITEBYTECODE": "1",
+            "PYTHONHASHSEED": "0",
+        }
+
+    def _run_suite(self, checkout: str, name: str, code: str) -> Dict[str, Any]:
+        suite_dir = os.path.join(checkout, ".ai_tech_lead_tests", uuid.uuid4().hex[:12])
+        os.makedirs(suite_dir)
+        test_file = os.path.join(suite_dir, "test_generated_suite.py")
+        with open(test_file, "w", encoding="utf-8") as f:
+            f.write(code)
+        limits = _limit_command(self.prlimit, self.cpu_seconds, self.memory_bytes)
+        command = self.command_prefix + limits + [
+            self.python, "-m", "pytest", "-q", "-p", "no:cacheprovider", "--no-header", "-rfE", test_file,
+        ]
+        result = {"suite": name, "code_hash": code_hash(code)}
+        started_at = time.time()
+        try:
+            with self._slots:
+                process = subprocess.Popen(
+                    command,
+                    cwd=checkout,
+                    env=self._environment(checkout, suite_dir),
+                    stdin=subprocess.DEVNULL,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT,
+                    # Own process group, so a timeout can kill anything the suite spawned
+                    start_new_session=True,
+                )
+                if not limits:
+                    _limit_process(process.pid, self.cpu_seconds, self.memory_bytes)
+                try:
+                    output, _ = process.communicate(timeout=self.timeout)
+                    returncode = process.returncode
+                except subprocess.TimeoutExpired:
+                    try:
+                        os.killpg(process.pid, signal.SIGKILL)
+                    except (OSError, AttributeError):
+                        process.kill()
+                    output, _ = process.communicate()
+                    returncode = None
+            text = output.decode("utf-8", errors="replace")
+            counts = _summarize_counts(text)
+            if returncode is None:
+                outcome = "timeout"
+            elif hasattr(signal, "SIGXCPU") and returncode == -signal.SIGXCPU:
+                # VERIFY_CPU_SECONDS exceeded
+                outcome = "timeout"
+            elif returncode and "No module named pytest" in text:
+                # pytest is not a production requirement; the sandbox image must provide it
+                outcome = "error"
+                text += f"\npytest is not installed for {self.python} in the verification sandbox."
+            else:
+                outcome = _outcome(returncode, counts)
+            result.update({
+                "outcome": outcome,
+                "returncode": returncode,
+                "counts": counts,
+                "output": text[-self.output_chars:],
+            })
+        except OSError as e:
+            result.update({"outcome": "error", "returncode": None, "counts": {}, "output": str(e)})
+        finally:
+            shutil.rmtree(suite_dir, ignore_errors=True)
+        result["seconds"] = round(time.time() - started_at, 3)
+        return result
+
+    def verify(
+        self,
+        repo_name: str,
+        head_sha: str,
+        suites: List[Tuple[str, str]],
+        fetch_source: Callable[[str], Any],
+    ) -> Dict[str, Any]:
+        """
+        Run `suites` ([(name, code)]) against `head_sha`.
+
+        `fetch_source(dest_path)` downloads the head's source tarball; it is only
+        called when some suite is not cached. Returns a report with one result per
+        suite, outcome counts and how many results came from the cache. Raises
+        RuntimeError when no sandbox is configured (see the class docstring).
+        """
+        if not self.command_prefix and not self.allow_unsandboxed:
+            raise RuntimeError(
+                "no sandbox configured (VERIFY_COMMAND_PREFIX); generated suites would run PR code with the server's privileges"
+            )
+        results: Dict[int, Dict[str, Any]] = {}
+        pending = []
+        for index, (name, code) in enumerate(suites):
+            cached = self.cache.get(repo_name, head_sha, code)
+            if cached is not None:
+                results[index] = dict(cached, suite=name, cached=True)
+            else:
+                pending.append((index, name, code))
+
+        if pending:
+            with span("test_verification"):
+                checkout = self._acquire_checkout(repo_name, head_sha, fetch_source)
+                try:
+                    workers = min(len(pending), self.max_parallel)
+                    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="verify") as pool:
+                        runs = list(pool.map(lambda item: self._run_suite(checkout, item[1], item[2]), pending))
+                finally:
+                    self._release_checkout(checkout)
+            for (index, name, code), result in zip(pending, runs):
+                # Infrastructure errors (could not spawn, ...) are not a property of the suite
+                if result["outcome"] != "error":
+                    self.cache.put(repo_name, head_sha, code, result)
+                results[index] = dict(result, cached=False)
+
+        ordered = [results[i] for i in range(len(suites))]
+        summary = {outcome: 0 for outcome in OUTCOMES}
+        for result in ordered:
+            summary[result["outcome"]] += 1
+            VERIFY_SUITES.inc(outcome=result["outcome"], cached=str(result["cached"]).lower())
+        return {
+            "status": "verified",
+            "head_sha": head_sha,
+            "suites": ordered,
+            "summary": summary,
+            "cached": sum(1 for r in ordered if r["cached"]),
+        }
+
+
+def format_verification(report: Dict[str, Any]) -> str:
+    """Markdown summary of a verification report for the reporter's prompt."""
+    if report.get("status") != "verified":
+        return f"Generated tests were not executed: {report.get('reason', 'verification skipped')}."
+    head = report["head_sha"][:7]
+    lines = [f"Generated suites executed with pytest against {head}:", ""]
+    for result in report["suites"]:
+        counts = ", ".join(f"{n} {kind}" for kind, n in sorted(result.get("counts", {}).items()))
+        lines.append(f"- `{result['suite']}`: **{result['outcome']}**" + (f" ({counts})" if counts else ""))
+        if result["outcome"] != "passed" and result.get("output"):
+            lines.append("  ```")
+            lines.extend("  " + line for line in result["output"].strip().splitlines()[-15:])
+            lines.append("  ```")
+    return "\n".join(lines)
+
+
+# Shared by every crew in the process: one parallelism budget and one result cache
+suite_verifier = SuiteVerifier()
@@ -1,11 +1,19 @@
 import os
 import json
-from flask import Flask, request, abort
+import threading
+import time
+from flask import Flask, request, abort, jsonify
 import hmac
 import hashlib
 from dotenv import load_dotenv
-import threading
-from .crew import AITechLeadCrew
+from .job_queue import create_job_queue, QueueFullError, DuplicateDeliveryError
+from .tools.github_scheduler import github_scheduler
+from .worker import run_crew_in_background
+from .utils.metrics import REGISTRY, WEBHOOKS, Gauge, SPAN_SECONDS, llm_error_window, span
+from . import __version__
+
+# crewai, the LLM clients and the agents are only imported when the first job runs
+# (or by the background warm-up), so the server answers requests right after start.
 
 # --- Environment Variable Loading and Validation ---
 load_dotenv()
@@ -13,9 +21,10 @@ load_dotenv()
 required_vars = ["GITHUB_WEBHOOK_SECRET", "GITHUB_ACCESS_TOKEN", "GEMINI_API_KEY"]
 missing_vars = [var for var in required_vars if not os.environ.get(var)]
 if missing_vars:
-    raise ValueError(f"CRITICAL ERROR: Missing required environment variables: {', '.join(missing_vars)}")
+    # Keep serving /health so the misconfiguration is visible; webhooks are refused below
+    print(f"CRITICAL ERROR: Missing required environment variables: {', '.join(missing_vars)}")
 
-GITHUB_WEBHOOK_SECRET_STR = os.environ.get('GITHUB_WEBHOOK_SECRET')
+GITHUB_WEBHOOK_SECRET_STR = os.environ.get('GITHUB_WEBHOOK_SECRET', '')
 GITHUB_WEBHOOK_SECRET = GITHUB_WEBHOOK_SECRET_STR.encode('utf-8')
 # --- End of Validation ---
 
@@ -23,6 +32,8 @@ app = Flask(__name__)
 
 def verify_signature(payload_body, signature_header):
     """Verify that the payload was sent from GitHub."""
+    if not GITHUB_WEBHOOK_SECRET:
+        raise ValueError("Signature verification failed: GITHUB_WEBHOOK_SECRET is not configured!")
     if not signature_header:
         raise ValueError("Signature verification failed: x-hub-signature-256 header is missing!")
     
@@ -32,42 +43,169 @@ def verify_signature(payload_body, signature_header):
     if not hmac.compare_digest(expected_signature, signature_header):
         raise ValueError("Signature verification failed: Request signatures didn't match!")
 
-def run_crew_in_background(repo_name, pr_number):
-    """Function to run the CrewAI process in a separate thread."""
-    print(f"Starting crew for {repo_name}# {pr_number} in a background thread.")
+# Durable queue selected by QUEUE_BACKEND; MAX_WORKERS, MAX_WORKERS_PER_REPO and MAX_QUEUE_DEPTH control concurrency.
+# Jobs run on QUEUE_EMBEDDED_WORKERS threads here and in any `ai-tech-lead worker` process sharing the store.
+job_queue = create_job_queue(run_crew_in_background)
+
+QUEUE_GAUGE = Gauge(
+    "ai_tech_lead_queue_jobs",
+    "Jobs currently pending or running in the worker queue.",
+    labelnames=("state",),
+)
+QUEUE_GAUGE.set_function(lambda: {
+    (state,): count
+    for state, count in job_queue.snapshot()["counts"].items()
+    if state in ("pending", "running")
+})
+WORKER_SATURATION = Gauge(
+    "ai_tech_lead_worker_saturation",
+    "Fraction of MAX_WORKERS currently running a job.",
+)
+WORKER_SATURATION.set_function(
+    lambda: {(): job_queue.snapshot()["counts"]["running"] / max(1, job_queue.max_running)}
+)
+
+# --- Background warm-up ---
+
+warmup_state = {"status": "pending", "seconds": None, "error": None}
+_warmup_lock = threading.Lock()
+
+
+def warm_up():
+    """Import crewai and build the default LLM, agents and GitHub client ahead of the first job."""
+    with _warmup_lock:
+        if warmup_state["status"] != "pending":
+            return
+        warmup_state["status"] = "running"
+    started_at = time.perf_counter()
     try:
-        crew_instance = AITechLeadCrew(repo_name, pr_number)
-        crew_instance.run()
-        print(f"Crew run finished successfully for {repo_name}# {pr_number}.")
+        from . import crew  # noqa: F401  (pulls in crewai and litellm)
+        from .agents import get_reviewer_agent, get_tester_agent, get_reporter_agent
+        from .tools.github_tools import get_github_tool
+        get_github_tool()
+        get_reviewer_agent()
+        get_tester_agent()
+        get_reporter_agent()
+        warmup_state["status"] = "done"
     except Exception as e:
-        print(f"CRITICAL ERROR during crew run for {repo_name}# {pr_number}: {e}")
+        # The first job retries construction and reports the error there
+        warmup_state["status"] = "failed"
+        warmup_state["error"] = str(e)
+        print(f"--- Warm-up failed: {e} ---")
+    warmup_state["seconds"] = round(time.perf_counter() - started_at, 3)
+    SPAN_SECONDS.observe(warmup_state["seconds"], span="warmup")
+    print(f"Warm-up {warmup_state['status']} in {warmup_state['seconds']}s.")
+
+
+def start_warmup():
+    """Run warm_up() on a daemon thread after WARMUP_DELAY seconds, unless WARMUP_ON_START=false."""
+    if os.environ.get("WARMUP_ON_START", "true").strip().lower() in ("0", "false", "no"):
+        warmup_state["status"] = "disabled"
+        return None
+    # The delay lets the server bind and take its first requests before the heavy imports start
+    timer = threading.Timer(float(os.environ.get("WARMUP_DELAY", "1.0")), warm_up)
+    timer.daemon = True
+    timer.start()
+    return timer
+
+
+start_warmup()
 
 @app.route('/webhook', methods=['POST'])
 def webhook():
+    if missing_vars:
+        WEBHOOKS.inc(outcome="misconfigured")
+        return f"Server is missing required configuration: {', '.join(missing_vars)}", 503
+
     signature_header = request.headers.get('x-hub-signature-256')
     try:
-        verify_signature(request.data, signature_header)
+        with span("signature_verification"):
+            verify_signature(request.data, signature_header)
     except ValueError as e:
         print(f"--- SIGNATURE VERIFICATION FAILED: {e} ---")
+        WEBHOOKS.inc(outcome="bad_signature")
         abort(403)
 
     if request.headers.get('x-github-event') == 'pull_request':
-        payload = request.get_json()
+        with span("payload_parsing"):
+            payload = request.get_json()
         action = payload.get('action')
 
         if action in ['opened', 'synchronize']:
             repo_name = payload['repository']['full_name']
             pr_number = payload['number']
+            head_sha = payload.get('pull_request', {}).get('head', {}).get('sha')
+            delivery_id = request.headers.get('x-github-delivery')
+            # Forced re-review: a signed request carrying the bypass header skips the LLM response cache
+            bypass_header = os.environ.get("LLM_CACHE_BYPASS_HEADER", "X-AI-Tech-Lead-Bypass-Cache")
+            bypass_cache = request.headers.get(bypass_header, "").lower() in ("1", "true", "yes")
+            if bypass_cache:
+                # A forced re-review is often a replayed delivery; it must not be dropped as a duplicate
+                delivery_id = None
             
-            print(f"+++ Webhook received and verified for PR: {repo_name}# {pr_number} +++")
-            
-            thread = threading.Thread(target=run_crew_in_background, args=(repo_name, pr_number))
-            thread.start()
+            print(f"+++ Webhook received and verified for PR: {repo_name}# {pr_number} @ {head_sha} +++")
             
-            return 'Webhook received. Kicking off review process in the background.', 202
+            try:
+                job = job_queue.submit(
+                    repo_name, pr_number, head_sha=head_sha, delivery_id=delivery_id, bypass_cache=bypass_cache
+                )
+            except DuplicateDeliveryError as e:
+                print(f"--- DUPLICATE DELIVERY ignored: {e} ---")
+                WEBHOOKS.inc(outcome="duplicate")
+                return 'Duplicate delivery ignored.', 200
+            except QueueFullError as e:
+                print(f"--- QUEUE FULL, rejecting {repo_name}# {pr_number}: {e} ---")
+                WEBHOOKS.inc(outcome="queue_full")
+                return str(e), 503, {'Retry-After': str(e.retry_after)}
+
+            WEBHOOKS.inc(outcome="queued")
+            return f'Webhook received. Review job {job.id} queued.', 202
             
+    WEBHOOKS.inc(outcome="ignored")
     return 'Event not processed.', 200
 
+@app.route('/jobs', methods=['GET'])
+def jobs():
+    """Report queue depth, running jobs and recent job outcomes."""
+    return jsonify(job_queue.snapshot())
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus scrape endpoint."""
+    return REGISTRY.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+@app.route('/health', methods=['GET'])
+def health():
+    """Liveness plus worker saturation, the recent LLM error rate, the GitHub rate-limit budget and warm-up state."""
+    counts = job_queue.snapshot()["counts"]
+    llm = llm_error_window.snapshot()
+    github = github_scheduler.snapshot()
+    error_threshold = float(os.environ.get("HEALTH_LLM_ERROR_RATE_THRESHOLD", "0.5"))
+    degraded = (
+        bool(missing_vars)
+        or counts["pending"] >= job_queue.max_depth
+        or (llm["calls"] >= 5 and llm["error_rate"] >= error_threshold)
+        or (github["remaining"] is not None and github["remaining"] <= github["buffer"])
+    )
+    return jsonify({
+        "status": "degraded" if degraded else "healthy",
+        "service": "AI Tech Lead Watcher Agent",
+        "version": __version__,
+        "workers": {
+            # MAX_WORKERS, the cap across every process; embedded_workers are this process's threads
+            "max_workers": job_queue.max_running,
+            "embedded_workers": job_queue.max_workers,
+            "running": counts["running"],
+            "pending": counts["pending"],
+            "max_queue_depth": job_queue.max_depth,
+            "saturation": round(counts["running"] / max(1, job_queue.max_running), 3),
+        },
+        "llm": llm,
+        "github_rate_limit": github,
+        "warmup": warmup_state,
+        "missing_config": missing_vars,
+    }), 200
+
 if __name__ == '__main__':
     print("--- Starting Flask Server ---")
     print("Watcher is listening for GitHub webhooks on port 5001...")
@@ -0,0 +1,77 @@
+import os
+import signal
+import threading
+
+from .job_queue import JobCancelled, create_job_queue
+from .tools.github_scheduler import github_scheduler
+from .utils.llm_cache import llm_response_cache
+from .utils.metrics import serve_metrics
+
+
+def run_crew_in_background(job):
+    """Function to run the CrewAI process on a job queue worker thread."""
+    repo_name, pr_number = job.repo_name, job.pr_number
+    print(f"Starting crew for {repo_name}# {pr_number} @ {job.head_sha} (job {job.id}, {job.priority} priority, attempt {job.attempts}) on a worker thread.")
+    try:
+        from .crew import AITechLeadCrew
+        crew_instance = AITechLeadCrew(
+            repo_name, pr_number, head_sha=job.head_sha, cancel_check=job.raise_if_cancelled,
+            bypass_cache=job.bypass_cache
+        )
+        job.stats = crew_instance.run_stats
+        with github_scheduler.prioritize(repo_name, pr_number, job.priority), \
+                llm_response_cache.scope(repo_name, bypass=job.bypass_cache):
+            crew_instance.run()
+        print(f"Crew run finished successfully for {repo_name}# {pr_number}.")
+    except JobCancelled as e:
+        print(f"Crew run for {repo_name}# {pr_number} stopped early: {e}")
+        raise
+    except Exception as e:
+        print(f"CRITICAL ERROR during crew run for {repo_name}# {pr_number}: {e}")
+        raise
+
+
+def run_worker(concurrency=None):
+    """
+    Consume jobs from the durable queue until SIGINT/SIGTERM (`ai-tech-lead worker`).
+
+    On shutdown no new jobs are leased and running jobs are allowed to finish;
+    if the process is killed first, their leases expire and another worker
+    picks them up. Prometheus metrics (LLM calls, stages, caches) are served on
+    WORKER_METRICS_PORT (default 9464, 0 to disable) at /metrics.
+    """
+    if os.environ.get("QUEUE_BACKEND", "sqlite").strip().lower() == "memory":
+        raise SystemExit("ai-tech-lead worker needs a durable queue: set QUEUE_BACKEND to 'sqlite' or 'redis'.")
+    if concurrency is None:
+        concurrency = int(os.environ.get("MAX_WORKERS", "2"))
+
+    # Workers are long-lived, so build the LLM, agents and GitHub client up front
+    from .agents import get_reviewer_agent, get_tester_agent, get_reporter_agent
+    get_reviewer_agent()
+    get_tester_agent()
+    get_reporter_agent()
+
+    metrics_port = int(os.environ.get("WORKER_METRICS_PORT", "9464"))
+    if metrics_port:
+        try:
+            serve_metrics(metrics_port, os.environ.get("WORKER_METRICS_HOST", "0.0.0.0"))
+            print(f"Worker metrics on :{metrics_port}/metrics")
+        except OSError as e:
+            # e.g. a second worker process on the same host; jobs still run
+            print(f"Warning: cannot serve worker metrics on port {metrics_port}: {e}")
+
+    queue = create_job_queue(run_crew_in_background, workers=concurrency)
+    stopping = threading.Event()
+
+    def request_stop(signum, _frame):
+        print(f"Received signal {signum}; finishing running jobs before exit.")
+        stopping.set()
+
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+    print(f"Worker {queue.worker_id} consuming {queue.backend.describe()} with {concurrency} threads.")
+    while not stopping.wait(1.0):
+        pass
+    queue.shutdown(wait=True)
+    print("Worker stopped.")
+    return 0
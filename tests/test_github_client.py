@@ -0,0 +1,168 @@
+import json
+
+import pytest
+
+pytest.importorskip("requests")
+pytest.importorskip("github")
+
+from ai_tech_lead_project.tools.github_client import GithubClient
+from ai_tech_lead_project.tools.github_scheduler import PRIORITY_LOW, PRIORITY_NORMAL, RateLimitScheduler
+
+API = "https://api.test"
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=None, headers=None, next_url=None):
+        self.status_code = status_code
+        self.content = json.dumps(body).encode("utf-8") if body is not None else b""
+        self.text = self.content.decode("utf-8")
+        self.headers = dict(headers or {})
+        self.links = {"next": {"url": next_url}} if next_url else {}
+        self._body = body
+
+    def json(self):
+        if self._body is None:
+            raise ValueError("no body")
+        return self._body
+
+
+class FakeSession:
+    """Stands in for requests.Session: routes (method, url) to handlers and records every request."""
+
+    def __init__(self):
+        self.headers = {}
+        self.routes = {}
+        self.sent = []
+
+    def route(self, method, url, handler):
+        self.routes[(method, url)] = handler
+
+    def request(self, method, url, timeout=None, params=None, headers=None, **kwargs):
+        self.sent.append({"method": method, "url": url, "params": params, "headers": dict(headers or {})})
+        return self.routes[(method, url)](params, headers or {})
+
+
+class Resource:
+    """A GET endpoint that honours If-None-Match like GitHub does."""
+
+    def __init__(self, body, etag='"v1"'):
+        self.body, self.etag = body, etag
+
+    def __call__(self, params, headers):
+        if headers.get("If-None-Match") == self.etag:
+            return FakeResponse(304, headers={"ETag": self.etag})
+        return FakeResponse(200, self.body, {"ETag": self.etag})
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv("GITHUB_API_URL", API)
+    monkeypatch.setenv("GITHUB_METADATA_TTL", "30")
+    client = GithubClient("token", scheduler=RateLimitScheduler(buffer=0, burst=100))
+    client._session = FakeSession()
+    return client
+
+
+def test_etag_revalidation_reuses_body_on_304(client):
+    client._session.route("GET", f"{API}/repos/o/r/issues/1/comments", Resource([{"id": 1}]))
+
+    first = client.get("/repos/o/r/issues/1/comments")
+    second = client.get("/repos/o/r/issues/1/comments")
+
+    assert first == second == [{"id": 1}]
+    assert client._session.sent[1]["headers"]["If-None-Match"] == '"v1"'
+    assert client.not_modified == 1
+
+
+def test_metadata_ttl_skips_the_request(client):
+    client._session.route("GET", f"{API}/repos/o/r", Resource({"full_name": "o/r"}))
+
+    client.get_repo("o/r")
+    client.get_repo("o/r")
+
+    assert len(client._session.sent) == 1
+    assert client.ttl_hits == 1
+
+
+def test_get_pull_refetches_when_the_cached_head_is_stale(client):
+    pull = Resource({"number": 1, "head": {"sha": "old"}})
+    client._session.route("GET", f"{API}/repos/o/r/pulls/1", pull)
+    assert client.get_pull("o/r", 1)["head"]["sha"] == "old"
+
+    # A push lands within the metadata TTL and the webhook announces the new head
+    pull.body, pull.etag = {"number": 1, "head": {"sha": "new"}}, '"v2"'
+    assert client.get_pull("o/r", 1)["head"]["sha"] == "old"
+    assert client.get_pull("o/r", 1, head_sha="new")["head"]["sha"] == "new"
+    # The refreshed copy is what the TTL tier serves from now on
+    assert client.get_pull("o/r", 1, head_sha="new")["head"]["sha"] == "new"
+    assert len(client._session.sent) == 2
+
+
+def test_compare_fetches_only_the_first_page_and_is_not_cached(client):
+    url = f"{API}/repos/o/r/compare/a...b"
+    # Later pages only carry more commits: GitHub lists the files on the first page
+    client._session.route("GET", url, lambda params, headers: FakeResponse(
+        200, {"files": [{"filename": "a.py"}, {"filename": "b.py"}]}, {"ETag": '"c1"'},
+        next_url=f"{url}?per_page=100&page=2"
+    ))
+
+    comparison = client.compare("o/r", "a", "b")
+
+    assert [f["filename"] for f in comparison["files"]] == ["a.py", "b.py"]
+    assert len(client._session.sent) == 1
+    assert client.stats()["etag_entries"] == 0
+
+
+def test_list_pull_files_follows_link_pages(client):
+    url = f"{API}/repos/o/r/pulls/7/files"
+    page_2 = f"{url}?per_page=100&page=2"
+    client._session.route("GET", url, lambda params, headers: FakeResponse(
+        200, [{"filename": "a.py"}, {"filename": "b.py"}], next_url=page_2
+    ))
+    client._session.route("GET", page_2, lambda params, headers: FakeResponse(200, [{"filename": "c.py"}]))
+
+    assert [f["filename"] for f in client.list_pull_files("o/r", 7)] == ["a.py", "b.py", "c.py"]
+    # The next link already carries the query string
+    assert client._session.sent[1]["params"] is None
+
+
+def test_etag_cache_is_bounded_by_bytes(client):
+    client.etag_cache_bytes = 1000
+    for i in range(10):
+        client._session.route("GET", f"{API}/items/{i}", Resource({"payload": "x" * 200}, etag=f'"{i}"'))
+        client.get(f"/items/{i}")
+
+    stats = client.stats()
+    assert stats["etag_bytes"] <= 1000
+    assert 0 < stats["etag_entries"] < 10
+    # The newest entries survive
+    assert f"{API}/items/9" in client._etags
+
+
+def test_rate_limited_response_is_retried(client):
+    responses = iter([
+        FakeResponse(429, {"message": "slow down"}, {"Retry-After": "0"}),
+        FakeResponse(200, {"ok": True}),
+    ])
+    client._session.route("GET", f"{API}/limited", lambda params, headers: next(responses))
+
+    assert client.get("/limited") == {"ok": True}
+    assert len(client._session.sent) == 2
+
+
+def test_scheduler_keeps_the_reserve_for_normal_priority(monkeypatch):
+    monkeypatch.setenv("GITHUB_LOW_PRIORITY_RESERVE", "10")
+    monkeypatch.setenv("GITHUB_RATE_LIMIT_MAX_WAIT", "5")
+    scheduler = RateLimitScheduler(buffer=10, burst=5)
+    scheduler.observe(200, {"X-RateLimit-Remaining": "15", "X-RateLimit-Reset": "9999999999"})
+
+    assert scheduler.acquire(PRIORITY_NORMAL) < 0.1
+    with pytest.raises(TimeoutError):
+        scheduler.acquire(PRIORITY_LOW)
+
+
+def test_scheduler_pauses_after_retry_after(monkeypatch):
+    scheduler = RateLimitScheduler(buffer=0, burst=5)
+
+    assert scheduler.observe(403, {"Retry-After": "0.2"}) is True
+    assert scheduler.acquire(PRIORITY_NORMAL) >= 0.15
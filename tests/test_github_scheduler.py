@@ -0,0 +1,103 @@
+import threading
+import time
+
+import pytest
+
+from ai_tech_lead_project.tools.github_scheduler import PRIORITY_LOW, PRIORITY_NORMAL, RateLimitScheduler
+
+
+def budget(scheduler, remaining, reset_in):
+    scheduler.observe(200, {
+        "X-RateLimit-Limit": "5000",
+        "X-RateLimit-Remaining": str(remaining),
+        "X-RateLimit-Reset": str(time.time() + reset_in),
+    })
+
+
+@pytest.fixture(autouse=True)
+def short_waits(monkeypatch):
+    # A broken scheduler fails the test instead of hanging it
+    monkeypatch.setenv("GITHUB_RATE_LIMIT_MAX_WAIT", "5")
+
+
+def test_buffer_is_never_spent(monkeypatch):
+    monkeypatch.setenv("GITHUB_LOW_PRIORITY_RESERVE", "0")
+    scheduler = RateLimitScheduler(buffer=10, burst=5)
+    budget(scheduler, remaining=12, reset_in=3600)
+
+    assert scheduler.acquire(PRIORITY_NORMAL) < 0.1
+    assert scheduler.acquire(PRIORITY_NORMAL) < 0.1
+    # 10 left: only the buffer, which would take until the reset to refill
+    with pytest.raises(TimeoutError):
+        scheduler.acquire(PRIORITY_NORMAL)
+
+
+def test_low_priority_leaves_the_reserve_to_first_reviews(monkeypatch):
+    monkeypatch.setenv("GITHUB_LOW_PRIORITY_RESERVE", "20")
+    scheduler = RateLimitScheduler(buffer=10, burst=5)
+    budget(scheduler, remaining=25, reset_in=3600)
+
+    with pytest.raises(TimeoutError):
+        scheduler.acquire(PRIORITY_LOW)
+    for _ in range(3):
+        assert scheduler.acquire(PRIORITY_NORMAL) < 0.1
+    assert scheduler.remaining == 22
+
+
+def test_waiting_normal_requests_go_before_low_ones_queued_earlier(monkeypatch):
+    monkeypatch.setenv("GITHUB_LOW_PRIORITY_RESERVE", "0")
+    scheduler = RateLimitScheduler(buffer=0, burst=1)
+    # One token every 0.2s
+    budget(scheduler, remaining=50, reset_in=10)
+    scheduler.acquire(PRIORITY_NORMAL)
+
+    order = []
+
+    def request(priority):
+        scheduler.acquire(priority)
+        order.append(priority)
+
+    low = threading.Thread(target=request, args=(PRIORITY_LOW,))
+    low.start()
+    time.sleep(0.05)
+    normal = threading.Thread(target=request, args=(PRIORITY_NORMAL,))
+    normal.start()
+    low.join(5)
+    normal.join(5)
+
+    assert order == [PRIORITY_NORMAL, PRIORITY_LOW]
+    assert scheduler.snapshot()["waiting"] == 0
+
+
+def test_budget_is_spread_until_the_reset(monkeypatch):
+    scheduler = RateLimitScheduler(buffer=0, burst=2)
+    # 10 requests over 1s: beyond the burst, one every ~0.1s
+    budget(scheduler, remaining=10, reset_in=1)
+
+    started_at = time.perf_counter()
+    for _ in range(4):
+        scheduler.acquire(PRIORITY_NORMAL)
+    elapsed = time.perf_counter() - started_at
+
+    assert 0.1 <= elapsed < 1.0
+    assert scheduler.throttled >= 1
+
+
+def test_exhausted_budget_waits_for_the_reset():
+    scheduler = RateLimitScheduler(buffer=5, burst=5)
+    budget(scheduler, remaining=5, reset_in=0.3)
+
+    waited = scheduler.acquire(PRIORITY_NORMAL)
+
+    assert 0.2 <= waited < 2.0
+    # The rolled-over window is unknown until the next response reports it
+    assert scheduler.remaining is None
+
+
+def test_prioritize_scopes_the_priority_of_a_pull_request():
+    scheduler = RateLimitScheduler()
+
+    with scheduler.prioritize("o/r", "7", PRIORITY_LOW):
+        assert scheduler.priority_for("o/r", 7) == PRIORITY_LOW
+        assert scheduler.priority_for("o/r", 8) == PRIORITY_NORMAL
+    assert scheduler.priority_for("o/r", 7) == PRIORITY_NORMAL
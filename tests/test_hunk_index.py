@@ -0,0 +1,127 @@
+import threading
+import types
+
+import pytest
+
+from ai_tech_lead_project.utils.hunk_index import HashingEmbedder, HunkIndex
+
+REPO = "acme/api"
+
+ORIGINAL = [
+    "def page_slice(items, page, size):",
+    "    if page < 0:",
+    "        raise ValueError('page')",
+    "    start = page * size",
+    "    end = start + size",
+    "    if end > len(items):",
+    "        end = len(items)",
+    "    result = items[start:end]",
+    "    return result",
+]
+# The one-token bug fix: `page < 0` -> `page < 1`
+FIXED = [line.replace("page < 0", "page < 1") for line in ORIGINAL]
+
+FINDING = {"file": "pager.py", "line": 2, "issue": "page 0 is accepted", "severity": "high"}
+
+
+def patched_file(filename, lines):
+    patch = f"@@ -0,0 +1,{len(lines)} @@\n" + "\n".join("+" + line for line in lines)
+    return {"filename": filename, "patch": patch, "additions": len(lines), "deletions": 0}
+
+
+@pytest.fixture
+def index():
+    index = HunkIndex(path="", embedder=HashingEmbedder())
+    index.add_review(REPO, [patched_file("pager.py", ORIGINAL)], {"bugs": [FINDING]}, pr_number=1)
+    return index
+
+
+def test_identical_hunk_matches_exactly_with_relocated_findings(index):
+    match, = index.lookup(REPO, [patched_file("backport/pager.py", ORIGINAL)], pr_number=2)["backport/pager.py"]
+    assert match["exact"] and match["similarity"] == 1.0
+    assert match["findings"] == [{"category": "bugs", "finding": dict(FINDING, file="backport/pager.py")}]
+
+
+def test_one_token_edit_is_a_near_match_not_an_exact_one(index):
+    match, = index.lookup(REPO, [patched_file("pager.py", FIXED)], pr_number=2)["pager.py"]
+    assert not match["exact"]
+    # Textually almost identical, which is why similarity alone must never skip a review
+    assert match["similarity"] > 0.95
+
+
+def test_earlier_runs_of_the_same_pr_are_ignored(index):
+    same_pr = index.lookup(REPO, [patched_file("pager.py", ORIGINAL)], pr_number=1)["pager.py"]
+    assert [m["similarity"] for m in same_pr] == [None]
+    other_repo = index.lookup("acme/web", [patched_file("pager.py", ORIGINAL)], pr_number=1)["pager.py"]
+    assert [m["similarity"] for m in other_repo] == [None]
+
+
+def test_one_token_fix_is_reviewed_again_with_the_old_finding_as_a_hint(index, monkeypatch):
+    pytest.importorskip("crewai")
+    from ai_tech_lead_project.crew import AITechLeadCrew
+
+    monkeypatch.setattr("ai_tech_lead_project.crew.hunk_index", index)
+    crew = types.SimpleNamespace(repo_name=REPO, pr_number=2, run_stats={})
+    fixed = patched_file("pager.py", FIXED)
+
+    reused, to_review, hints = AITechLeadCrew._match_prior_hunks(crew, [fixed])
+
+    assert reused == []
+    assert to_review == [fixed]
+    assert [item["finding"]["issue"] for item in hints["pager.py"]] == ["page 0 is accepted"]
+
+
+def test_exact_backport_is_reused(index, monkeypatch):
+    pytest.importorskip("crewai")
+    from ai_tech_lead_project.crew import AITechLeadCrew
+
+    monkeypatch.setattr("ai_tech_lead_project.crew.hunk_index", index)
+    crew = types.SimpleNamespace(repo_name=REPO, pr_number=2, run_stats={})
+    backport = patched_file("pager.py", ORIGINAL)
+
+    reused, to_review, hints = AITechLeadCrew._match_prior_hunks(crew, [backport])
+
+    assert [file for file, _ in reused] == [backport]
+    assert reused[0][1]["bugs"][0]["issue"] == "page 0 is accepted"
+    assert to_review == [] and hints == {}
+
+
+def test_entries_and_pr_numbers_survive_a_reload(tmp_path):
+    path = str(tmp_path / "hunks.sqlite3")
+    HunkIndex(path=path, embedder=None).add_review(
+        REPO, [patched_file("pager.py", ORIGINAL)], {"bugs": [FINDING]}, pr_number=1
+    )
+    reloaded = HunkIndex(path=path, embedder=None)
+    assert reloaded.lookup(REPO, [patched_file("pager.py", ORIGINAL)], pr_number=1)["pager.py"][0]["exact"] is False
+    assert reloaded.lookup(REPO, [patched_file("pager.py", ORIGINAL)], pr_number=3)["pager.py"][0]["exact"] is True
+
+
+def test_lookups_run_alongside_indexing():
+    index = HunkIndex(path="", embedder=HashingEmbedder())
+    errors = []
+
+    def index_reviews(worker):
+        try:
+            for i in range(40):
+                lines = [f"{line}  # {worker}-{i}" for line in ORIGINAL]
+                index.add_review(REPO, [patched_file(f"f{worker}_{i}.py", lines)], {"bugs": []}, pr_number=worker)
+        except Exception as e:
+            errors.append(e)
+
+    def look_up():
+        try:
+            for _ in range(40):
+                index.lookup(REPO, [patched_file("pager.py", FIXED)], pr_number=99)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=index_reviews, args=(w,)) for w in range(3)]
+    threads += [threading.Thread(target=look_up) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+
+    assert errors == []
+    assert index.stats()["entries"] == 120
+    assert sum(index.stats()["lookups"].values()) == 120
@@ -0,0 +1,193 @@
+import threading
+import time
+
+import pytest
+
+from ai_tech_lead_project.job_queue import DuplicateDeliveryError, DurableJobQueue, JobQueue, QueueFullError
+from ai_tech_lead_project.queue_backends import SQLiteQueueBackend
+
+REPO = "acme/api"
+
+
+@pytest.fixture
+def backend(tmp_path):
+    return SQLiteQueueBackend(path=str(tmp_path / "jobs.sqlite3"))
+
+
+def enqueue(backend, pr_number=1, head_sha="a", delivery_id=None, max_depth=50, bypass_cache=False):
+    return backend.enqueue(REPO, pr_number, head_sha, delivery_id, max_depth=max_depth, retry_after=60,
+                           bypass_cache=bypass_cache)
+
+
+def lease(backend, owner="w1", visibility_timeout=60.0, max_per_repo=1, max_attempts=3, max_running=None):
+    return backend.lease(owner, visibility_timeout, max_per_repo, max_attempts, max_running=max_running)
+
+
+def test_expired_lease_is_handed_out_again(backend):
+    job = enqueue(backend)
+    first = lease(backend, owner="w1", visibility_timeout=0.01)
+    time.sleep(0.05)
+
+    second = lease(backend, owner="w2")
+
+    assert first.id == second.id == job.id
+    assert second.attempts == 2
+    # The first worker lost its lease: it can neither renew nor record an outcome
+    assert backend.renew(job.id, "w1", 60) is None
+    first.status = "succeeded"
+    assert backend.finish(first, "w1") is False
+    second.status = "succeeded"
+    assert backend.finish(second, "w2") is True
+
+
+def test_lease_fails_the_job_after_max_attempts(backend):
+    job = enqueue(backend)
+    for _ in range(2):
+        assert lease(backend, visibility_timeout=0.01, max_attempts=2) is not None
+        time.sleep(0.05)
+
+    assert lease(backend, max_attempts=2) is None
+    recent, = backend.snapshot(10)["recent"]
+    assert recent.id == job.id and recent.status == "failed"
+
+
+def test_expired_lease_merges_into_a_push_coalesced_meanwhile(backend):
+    running = enqueue(backend, head_sha="a")
+    lease(backend, visibility_timeout=0.01)
+    pending = enqueue(backend, head_sha="b", bypass_cache=True)
+    assert pending.id != running.id
+    time.sleep(0.05)
+
+    leased = lease(backend)
+
+    # One job for the PR, at the newest head
+    assert leased.id == pending.id
+    assert leased.head_sha == "b" and leased.superseded_shas == ["a"] and leased.bypass_cache
+    assert lease(backend) is None
+    state = backend.snapshot(10)
+    assert state["pending"] == []
+    assert [(j.id, j.status) for j in state["recent"]] == [(running.id, "cancelled")]
+    assert state["counters"]["coalesced"] == 1
+
+
+def test_concurrent_pushes_coalesce_into_one_pending_job(backend):
+    shas = [f"sha{i}" for i in range(8)]
+    barrier = threading.Barrier(len(shas))
+    jobs, errors = [], []
+
+    def push(sha):
+        barrier.wait()
+        try:
+            jobs.append(enqueue(backend, head_sha=sha, delivery_id=f"delivery-{sha}"))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=push, args=(sha,)) for sha in shas]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+    assert errors == []
+    assert len({job.id for job in jobs}) == 1
+    pending, = backend.snapshot(10)["pending"]
+    assert pending.head_sha in shas
+    assert sorted(pending.superseded_shas + [pending.head_sha]) == sorted(shas)
+    assert backend.snapshot(10)["counters"]["coalesced"] == len(shas) - 1
+
+
+def test_concurrent_redeliveries_are_accepted_once(backend):
+    barrier = threading.Barrier(6)
+    outcomes = []
+
+    def deliver():
+        barrier.wait()
+        try:
+            enqueue(backend, head_sha="a", delivery_id="same-guid")
+            outcomes.append("accepted")
+        except DuplicateDeliveryError:
+            outcomes.append("duplicate")
+
+    threads = [threading.Thread(target=deliver) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+    assert sorted(outcomes) == ["accepted"] + ["duplicate"] * 5
+
+
+def test_push_during_a_run_flags_it_for_cancellation(backend):
+    enqueue(backend, head_sha="a")
+    job = lease(backend)
+    assert backend.renew(job.id, "w1", 60) is False
+
+    enqueue(backend, head_sha="b")
+
+    assert backend.renew(job.id, "w1", 60) is True
+    # The newer push waits: two reviews of one PR never run side by side
+    assert lease(backend, owner="w2") is None
+
+
+def test_lease_respects_max_running_and_per_repo_caps(backend):
+    for pr_number in (1, 2, 3):
+        enqueue(backend, pr_number=pr_number)
+    backend.enqueue("acme/web", 1, "a", None, max_depth=50, retry_after=60)
+
+    assert lease(backend, max_per_repo=2, max_running=2) is not None
+    assert lease(backend, max_per_repo=2, max_running=2) is not None
+    assert lease(backend, max_per_repo=2, max_running=2) is None
+    assert lease(backend, max_per_repo=2, max_running=3).repo_name == "acme/web"
+
+
+def test_queue_depth_is_enforced(backend):
+    enqueue(backend, pr_number=1)
+    with pytest.raises(QueueFullError) as excinfo:
+        enqueue(backend, pr_number=2, max_depth=1)
+    assert excinfo.value.retry_after == 60
+    # Coalescing into an existing pending job is always accepted
+    assert enqueue(backend, pr_number=1, head_sha="b", max_depth=1).head_sha == "b"
+
+
+def test_durable_queue_runs_jobs_and_records_outcomes(backend, monkeypatch):
+    monkeypatch.setenv("MAX_WORKERS", "2")
+    monkeypatch.setenv("QUEUE_POLL_INTERVAL", "0.01")
+    done = threading.Event()
+    handled = []
+
+    def handler(job):
+        handled.append((job.pr_number, job.head_sha))
+        if len(handled) == 2:
+            done.set()
+
+    queue = DurableJobQueue(handler, backend, workers=2)
+    try:
+        queue.submit(REPO, 1, "a")
+        queue.submit("acme/web", 2, "b")
+        assert done.wait(5)
+    finally:
+        queue.shutdown(wait=True)
+
+    assert sorted(handled) == [(1, "a"), (2, "b")]
+    assert queue.snapshot()["counts"]["completed"] == 2
+
+
+def test_in_memory_queue_coalesces_pending_pushes():
+    started, release = threading.Event(), threading.Event()
+
+    def handler(job):
+        started.set()
+        release.wait(5)
+
+    queue = JobQueue(handler, max_workers=1, max_per_repo=1, max_depth=10)
+    try:
+        running = queue.submit(REPO, 1, "a")
+        assert started.wait(5)
+        first = queue.submit(REPO, 1, "b")
+        second = queue.submit(REPO, 1, "c")
+
+        assert first is second and second.head_sha == "c" and second.superseded_shas == ["b"]
+        assert running.is_cancelled()
+    finally:
+        release.set()
+        queue.shutdown()
@@ -0,0 +1,135 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("crewai")
+
+import ai_tech_lead_project.llm_dispatch as llm_dispatch
+from ai_tech_lead_project.llm_dispatch import CircuitBreaker, InstrumentedLLM, LLMDispatcher
+from ai_tech_lead_project.utils.llm_cache import LLMResponseCache
+
+OVERLOADED = "503 Service Unavailable: The model is overloaded"
+
+
+class StubModel:
+    """A model with a fixed latency that can be told to fail with an overload error."""
+
+    def __init__(self, model, latency=0.0, fail=False, stop=None):
+        self.model, self.latency, self.fail = model, latency, fail
+        self.temperature = 0.0
+        self.stop = stop
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def call(self, messages, **kwargs):
+        with self._lock:
+            self.calls.append(self.stop)
+        time.sleep(self.latency)
+        if self.fail:
+            raise RuntimeError(OVERLOADED)
+        return f"{self.model}: answer"
+
+    def supports_stop_words(self):
+        return True
+
+    def supports_function_calling(self):
+        return False
+
+    def get_context_window_size(self):
+        return 8192
+
+
+@pytest.fixture
+def dispatcher(monkeypatch):
+    monkeypatch.setenv("LLM_HEDGE_DEFAULT_DELAY", "0.1")
+    monkeypatch.setenv("LLM_HEDGE_MIN_DELAY", "0.01")
+    monkeypatch.setenv("LLM_BREAKER_FAILURES", "2")
+    monkeypatch.setenv("LLM_BREAKER_COOLDOWN", "0.2")
+    dispatcher = LLMDispatcher()
+    monkeypatch.setattr(llm_dispatch, "llm_dispatcher", dispatcher)
+    return dispatcher
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = LLMResponseCache(path="")
+    monkeypatch.setattr(llm_dispatch, "llm_response_cache", cache)
+    return cache
+
+
+def test_slow_primary_is_hedged_to_a_backup(dispatcher):
+    slow, fast = StubModel("slow", latency=1.0), StubModel("fast", latency=0.01)
+
+    started_at = time.perf_counter()
+    answer = InstrumentedLLM(slow, backups=lambda: [fast]).call("prompt")
+
+    assert answer == "fast: answer"
+    assert time.perf_counter() - started_at < 0.8
+    assert dispatcher.events["hedge_sent"] == dispatcher.events["hedge_won"] == 1
+
+
+def test_overload_fails_over_without_hedging(dispatcher):
+    dispatcher.hedging = False
+    bad, good = StubModel("bad", fail=True), StubModel("good")
+
+    assert InstrumentedLLM(bad, backups=lambda: [good]).call("prompt") == "good: answer"
+    assert dispatcher.events == {"failover_sent": 1, "failover_won": 1}
+
+
+def test_a_lone_failing_model_raises(dispatcher):
+    with pytest.raises(RuntimeError, match="overloaded"):
+        InstrumentedLLM(StubModel("solo", fail=True)).call("prompt")
+
+
+def test_breaker_opens_and_reroutes_then_recovers(dispatcher):
+    bad, good = StubModel("bad", fail=True), StubModel("good")
+    llm = InstrumentedLLM(bad, backups=lambda: [good])
+
+    for _ in range(2):
+        llm.call("prompt")
+    assert dispatcher.breaker("bad").state == "open"
+    llm.call("prompt")
+    # Rerouted while open: the overloaded model is not called again
+    assert len(bad.calls) == 2
+    assert dispatcher.events["rerouted"] == 1
+
+    time.sleep(0.25)
+    bad.fail = False
+    assert llm.call("prompt") == "bad: answer"
+    assert dispatcher.breaker("bad").state == "closed"
+
+
+def test_half_open_breaker_lets_one_probe_through():
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=0.0)
+    breaker.record(False, overload=True)
+
+    assert breaker.allow() == "probe"
+    assert breaker.allow() is None
+    # A call sent before the breaker opened does not end the probe
+    breaker.record(True)
+    breaker.record(False, overload=True)
+    assert breaker.allow() is None
+    breaker.record(True, probe=True)
+    assert breaker.allow() == "closed"
+
+
+def test_backup_answers_are_cached_under_the_backup_model(dispatcher, cache):
+    dispatcher.hedging = False
+    bad, good = StubModel("bad", fail=True), StubModel("good")
+
+    with cache.scope("o/r"):
+        InstrumentedLLM(bad, backups=lambda: [good]).call("prompt")
+        assert cache.get("bad", 0.0, "prompt") is None
+        assert cache.get("good", 0.0, "prompt") == "good: answer"
+
+
+def test_backups_get_the_callers_stop_words_without_mutation(dispatcher):
+    dispatcher.hedging = False
+    shared_backup = StubModel("good")
+    llm = InstrumentedLLM(StubModel("bad", fail=True, stop=["Observation:"]), backups=lambda: [shared_backup])
+
+    llm.call("prompt")
+
+    assert shared_backup.calls == [["Observation:"]]
+    assert shared_backup.stop is None